@@ -1,14 +1,34 @@
 import os
 import signal
 import sys
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response
 from models import db, Camera, Map, CameraMapPosition, Gateway, Person, GatewayMapPosition
+from database import init_db, migrate, database_info
 from config import Config
-from ffmpeg_manager import start_ffmpeg_container, stop_ffmpeg_container
+from ffmpeg_manager import stop_stream
+from mac_index import mac_index, normalize_mac
+from location_writer import location_writer
+from ingest import ingest, merge_stats
+from scheduler import scheduler
+from presence import GatewayPeopleManager, BUFFER_TIME
+from presence_sync import PresenceConsumer, PresencePublisher, GatewayDiscovery, connect, notify_index_changed
+from events import presence_events, sse_retry, FULL_RETRY_MS
+from map_cache import map_layouts, presence_token
+from rtsp_probe import rtsp_prober
+from stream_reconciler import stream_reconciler
+from stream_health import stream_health
+from stream_demand import stream_demand
+from stream_profiles import profile_for, profile_label, stream_settings_error
+from stream_storage import output_storage
+from snapshots import snapshots
+from status_board import status_board
+from listing import field, list_rows
+from retention import location_log_retention
+from rollups import presence_rollups, occupancy, person_dwell, GRANULARITIES
 from flask_cors import CORS
+from werkzeug.serving import is_running_from_reloader
 import logging
 from log_config import setup_logging
-import cv2  # Biblioteca OpenCV para validação de RTSP
 from dotenv import load_dotenv
 import shutil
 import re
@@ -16,14 +36,12 @@ import unicodedata
 import uuid
 import json
 import threading
+import subprocess
 import time
+from datetime import datetime, timedelta
 import paho.mqtt.client as mqtt
 
 
-# Inicialização de estados globais
-active_gateways = {}
-gateway_last_seen = {}  # Mantém controle de mensagens recentes por gateway
-BUFFER_TIME = 5  # Segundos para considerar uma pessoa "fora do local"
 # Carregar variáveis de ambiente do arquivo .env
 load_dotenv()
 
@@ -35,7 +53,16 @@ logger = logging.getLogger(__name__)
 app = Flask(__name__)
 CORS(app, resources={r"/api/*": {"origins": "*"}})
 app.config.from_object(Config)
-db.init_app(app)
+init_db(app)
+location_writer.init_app(app, buffer_time=BUFFER_TIME)
+ingest.init_app(app)
+presence_events.attach(GatewayPeopleManager())
+rtsp_prober.init_app(app)
+stream_reconciler.init_app(app)
+stream_health.init_app(app)
+stream_demand.init_app(app)
+presence_rollups.init_app(app)
+location_log_retention.init_app(app)
 
 # Função para normalizar os nomes, removendo acentos e caracteres especiais
 def sanitize_name(name):
@@ -45,62 +72,59 @@ def sanitize_name(name):
     name = re.sub(r'[^a-zA-Z0-9_.-]', '_', name)
     return name
 
-#Def dos Logs para rastreio
-def close_inactive_logs():
-    with app.app_context():
-        now = datetime.utcnow()
-        threshold_time = now - timedelta(seconds=3)
-
-        # Encontra logs inativos
-        inactive_logs = LocationLog.query.filter(
-            LocationLog.exit_time == None,
-            LocationLog.entry_time < threshold_time
-        ).all()
-
-        for log in inactive_logs:
-            log.exit_time = now
-            log.duration = log.exit_time - log.entry_time
-            db.session.commit()
-
-#Def de Registro dos Logs
-def register_movement(person, gateway):
-    now = datetime.utcnow()
-
-    # Verificar se já existe um log ativo
-    active_log = LocationLog.query.filter_by(
-        person_id=person.id,
-        gateway_id=gateway.id,
-        exit_time=None
-    ).first()
-
-    if active_log:
-        # Atualizar o horário de saída
-        active_log.exit_time = now
-        active_log.duration = active_log.exit_time - active_log.entry_time
-        db.session.commit()
-    else:
-        # Criar novo log
-        new_log = LocationLog(
-            person_id=person.id,
-            gateway_id=gateway.id,
-            entry_time=now
-        )
-        db.session.add(new_log)
-        db.session.commit()
+RTSP_PROBE_ERRORS = {
+    "connect": "Não foi possível conectar ao fluxo RTSP. Verifique a URL.",
+    "read": "Não foi possível ler do fluxo RTSP. Verifique a URL.",
+    "timeout": "Tempo esgotado ao conectar ao fluxo RTSP. Verifique a URL.",
+    "unauthorized": "Credenciais do fluxo RTSP recusadas. Verifique usuário e senha.",
+    "decode_unavailable": "Validação com decodificação indisponível (OpenCV não instalado).",
+}
+
+# Valida a URL RTSP pelo pool de sondagem; retorna (resultado da sondagem, resposta de erro ou None)
+def probe_rtsp_url(rtsp_url):
+    result = rtsp_prober.probe(rtsp_url)
+    if result["ok"]:
+        return result, None
+    logger.error(f"Fluxo RTSP inválido ou inacessível ({result['error']}): {rtsp_url}")
+    return result, (jsonify({'error': RTSP_PROBE_ERRORS[result["error"]]}), 400)
+
+# Campos de perfil de stream aceitos no cadastro e na atualização de câmeras
+STREAM_FIELDS = ('stream_profile', 'encoder_preset', 'encoder_tune', 'resolutions', 'bitrates')
+
+def apply_stream_settings(camera, data):
+    for field in STREAM_FIELDS:
+        if field in data:
+            setattr(camera, field, data[field] or None)
+    if not camera.stream_profile:
+        camera.stream_profile = 'auto'
+    if 'pinned' in data:
+        camera.pinned = bool(data['pinned'])
+
+def camera_stream_data(camera):
+    profile = profile_for(camera)
+    data = {field: getattr(camera, field) for field in STREAM_FIELDS}
+    data.update({
+        "source_codec": camera.source_codec,
+        "stream_mode": profile_label(profile),
+        "pinned": bool(camera.pinned)
+    })
+    return data
 
-# Inicializar banco de dados
-with app.app_context():
-    db.create_all()
-    logger.info("Banco de dados inicializado com sucesso.")
+def create_app(migrate_schema=True):
+    """Prepara a aplicação para servir: esquema do banco e índice de MACs.
 
-    # Reiniciar contêineres para as câmeras já registradas no banco de dados
-    cameras = Camera.query.all()
-    for camera in cameras:
-        if camera.container_id:
-            logger.info(f"Reiniciando contêiner FFmpeg para câmera {camera.id}.")
-            stop_ffmpeg_container(camera.container_id)
-            camera.container_id = start_ffmpeg_container(camera.id, camera.name, camera.rtsp_url)
-            db.session.commit()
+    As rotas ficam registradas no `app` deste módulo; a função só faz a parte
+    que depende do banco. Sob o gunicorn as migrações rodam uma vez no master
+    (gunicorn.conf.py), então os workers chamam com migrate_schema=False.
+    """
+    with app.app_context():
+        if migrate_schema:
+            migrate(app)
+        logger.info(f"Banco de dados inicializado com sucesso: {database_info()}")
+
+        # Carregar o índice de MACs usado pelo ingest MQTT
+        mac_index.load()
+    return app
 
 # Diretório de saída
 OUTPUT_DIR = os.getenv("CAMERAS_OUTPUT_DIR", "/var/www/html/cameras")
@@ -125,29 +149,25 @@ def add_camera():
 
     # Validar a conexão com a URL RTSP
     logger.info(f"Validando conexão RTSP para {name}...")
-    cap = cv2.VideoCapture(rtsp_url)
-    if not cap.isOpened():
-        logger.error(f"Falha ao conectar ao fluxo RTSP: {rtsp_url}")
-        return jsonify({'error': 'Não foi possível conectar ao fluxo RTSP. Verifique a URL.'}), 400
+    probe, error = probe_rtsp_url(rtsp_url)
+    if error:
+        return error
 
-    ret, _ = cap.read()
-    cap.release()
-    if not ret:
-        logger.error(f"Fluxo RTSP inválido ou inacessível: {rtsp_url}")
-        return jsonify({'error': 'Não foi possível ler do fluxo RTSP. Verifique a URL.'}), 400
+    settings_error = stream_settings_error(data, probe.get('codec'))
+    if settings_error:
+        return jsonify({"error": settings_error}), 400
 
     # Criar e salvar a nova câmera no banco de dados
-    camera = Camera(name=name, rtsp_url=rtsp_url, agrupamento=agrupamento)
+    camera = Camera(name=name, rtsp_url=rtsp_url, agrupamento=agrupamento, source_codec=probe.get('codec'))
+    apply_stream_settings(camera, data)
     db.session.add(camera)
     db.session.commit()
     logger.info(f"Câmera {name} adicionada com sucesso.")
 
-    # Iniciar o contêiner Docker para processar o fluxo de câmera
-    logger.info(f"Iniciando contêiner FFmpeg para câmera {camera.id}.")
-    camera.container_id = start_ffmpeg_container(camera.id, camera.name, camera.rtsp_url)
-    db.session.commit()
+    # O processo de serviços sobe o worker FFmpeg da câmera (no modo sob demanda, só se fixada)
+    stream_reconciler.request(camera.id)
 
-    return jsonify({"message": "Câmera adicionada com sucesso"}), 201
+    return jsonify({"message": "Câmera adicionada com sucesso", "stream": camera_stream_data(camera)}), 201
 
 # Rota para atualizar uma câmera existente
 @app.route('/api/cameras/<int:camera_id>', methods=['PUT'])
@@ -163,23 +183,18 @@ def update_camera(camera_id):
     rtsp_url = data.get('rtsp_url')
     agrupamento = data.get('agrupamento')
 
+    source_codec = camera.source_codec
     if rtsp_url:
         # Validar a conexão com a URL RTSP
         logger.info(f"Validando conexão RTSP para atualização da câmera {camera.name}...")
-        cap = cv2.VideoCapture(rtsp_url)
-        if not cap.isOpened():
-            logger.error(f"Falha ao conectar ao fluxo RTSP: {rtsp_url}")
-            return jsonify({'error': 'Não foi possível conectar ao fluxo RTSP. Verifique a URL.'}), 400
-
-        ret, _ = cap.read()
-        cap.release()
-        if not ret:
-            logger.error(f"Fluxo RTSP inválido ou inacessível: {rtsp_url}")
-            return jsonify({'error': 'Não foi possível ler do fluxo RTSP. Verifique a URL.'}), 400
+        probe, error = probe_rtsp_url(rtsp_url)
+        if error:
+            return error
+        source_codec = probe.get('codec')
 
-    # Parar e remover o contêiner antigo, se necessário
-    if camera.container_id:
-        stop_ffmpeg_container(camera.container_id)
+    settings_error = stream_settings_error(data, source_codec)
+    if settings_error:
+        return jsonify({"error": settings_error}), 400
 
     # Atualizar os dados da câmera
     if name:
@@ -188,26 +203,92 @@ def update_camera(camera_id):
         camera.rtsp_url = rtsp_url
     if agrupamento:
         camera.agrupamento = agrupamento
-
-    # Iniciar o contêiner Docker para processar o fluxo de câmera atualizado
-    camera.container_id = start_ffmpeg_container(camera.id, camera.name, camera.rtsp_url)
+    camera.source_codec = source_codec
+    apply_stream_settings(camera, data)
     db.session.commit()
+    map_layouts.invalidate()
+
+    # O processo de serviços recria o worker FFmpeg com a configuração nova
+    stream_reconciler.request(camera.id)
 
     logger.info(f"Câmera {camera.name} atualizada com sucesso.")
-    return jsonify({"message": "Câmera atualizada com sucesso"}), 200
+    return jsonify({"message": "Câmera atualizada com sucesso", "stream": camera_stream_data(camera)}), 200
 
 # Rota para listar todas as câmeras
+CAMERA_FIELDS = {
+    "id": field(Camera.id),
+    "name": field(Camera.name),
+    "rtsp_url": field(Camera.rtsp_url),
+    "agrupamento": field(Camera.agrupamento),
+    "stream": field(*(getattr(Camera, name) for name in STREAM_FIELDS), Camera.source_codec, Camera.pinned,
+                    value=camera_stream_data),
+    "health": field(Camera.id, value=lambda row: stream_health.health(row.id)),
+}
+
 @app.route('/api/cameras', methods=['GET'])
 def list_cameras():
-    cameras = Camera.query.all()
-    cameras_data = [{
-        "id": camera.id,
-        "name": camera.name,
-        "rtsp_url": camera.rtsp_url,
-        "agrupamento": camera.agrupamento
-    } for camera in cameras]
+    return list_rows(CAMERA_FIELDS, Camera.id)
 
-    return jsonify(cameras_data), 200
+# Custo de CPU medido agora, agrupado pelo perfil efetivo das câmeras
+@app.route('/api/streams/profiles', methods=['GET'])
+def stream_profile_costs():
+    cameras = [camera for camera in Camera.query.all() if camera.container_id]
+    usage = stream_reconciler.cpu_usage([camera.container_id for camera in cameras])
+
+    profiles = {}
+    for camera in cameras:
+        label = profile_label(profile_for(camera))
+        entry = profiles.setdefault(label, {"profile": label, "cameras": 0, "measured": 0, "cpu_percent": 0.0})
+        entry["cameras"] += 1
+        if usage.get(camera.container_id) is not None:
+            entry["measured"] += 1
+            entry["cpu_percent"] += usage[camera.container_id]
+
+    for entry in profiles.values():
+        entry["cpu_percent"] = round(entry["cpu_percent"], 1)
+        entry["cpu_percent_per_camera"] = round(entry["cpu_percent"] / entry["measured"], 1) if entry["measured"] else None
+    return jsonify(sorted(profiles.values(), key=lambda entry: entry["cpu_percent"], reverse=True)), 200
+
+# Tempos de inicialização dos contêineres FFmpeg, última reconciliação e espaço do diretório de saída
+@app.route('/api/streams/stats', methods=['GET'])
+def stream_stats():
+    streams = stream_reconciler.status()
+    return jsonify({
+        "reconcile": streams.get("reconcile", {}),
+        "on_demand": stream_demand.stats(),
+        "snapshots": snapshots.stats(),
+        "start_timings": streams.get("start_timings", {}),
+        "workers": streams.get("workers", {}),
+        "storage": output_storage([profile_for(camera) for camera in Camera.query.all()])
+    }), 200
+
+# Miniatura JPEG da câmera, extraída do segmento HLS mais recente, para grades de câmeras
+@app.route('/api/cameras/<int:camera_id>/snapshot', methods=['GET'])
+def camera_snapshot(camera_id):
+    if not db.session.get(Camera, camera_id):
+        return jsonify({"error": "Câmera não encontrada"}), 404
+
+    snapshot = snapshots.get(camera_id)
+    if snapshot is None:
+        return jsonify({"error": "Nenhum segmento disponível para a câmera"}), 404
+
+    if request.if_none_match.contains(snapshot["etag"]):
+        response = Response(status=304)
+    else:
+        response = Response(snapshot["jpeg"], mimetype="image/jpeg")
+    response.set_etag(snapshot["etag"])
+    response.last_modified = snapshot["modified_at"]
+    response.headers["Cache-Control"] = "no-cache"
+    return response
+
+# Subrequisição do nginx (auth_request) para cada playlist/segmento em /streams/:
+# registra o espectador e, no modo sob demanda, liga o stream parado
+@app.route('/api/streams/access', methods=['GET'])
+def stream_access():
+    # O auth_request do nginx só repassa 401/403; qualquer outro erro vira 500
+    if not stream_demand.access(request.headers.get('X-Original-URI')):
+        return '', 403
+    return '', 204
 
 # Rota para deletar uma câmera existente
 @app.route('/api/cameras/<int:camera_id>', methods=['DELETE'])
@@ -218,13 +299,13 @@ def delete_camera(camera_id):
         logger.warning(f"Câmera com ID {camera_id} não encontrada.")
         return jsonify({"error": "Câmera não encontrada"}), 404
 
-    # Parar o contêiner Docker associado à câmera
-    if camera.container_id:
-        stop_ffmpeg_container(camera.container_id)
+    snapshots.forget(camera_id)
 
-    # Remover a câmera do banco de dados
+    # Remover a câmera do banco de dados; o processo de serviços para o worker FFmpeg dela
     db.session.delete(camera)
     db.session.commit()
+    map_layouts.invalidate()
+    stream_reconciler.request(camera_id)
     logger.info(f"Câmera {camera.name} removida com sucesso.")
 
     # Remover diretório de saída da câmera
@@ -291,6 +372,7 @@ def create_map():
             db.session.add(gateway_position)
 
     db.session.commit()
+    map_layouts.invalidate(new_map.id)
 
     logger.info(f"Mapa {name} criado com sucesso com ID {new_map.id}.")
 
@@ -330,58 +412,78 @@ def add_cameras_to_map(map_id):
         db.session.add(camera_position)
 
     db.session.commit()
+    map_layouts.invalidate(map.id)
 
     return jsonify({"message": "Câmeras adicionadas ao mapa com sucesso"}), 200
 
+MAP_FIELDS = {
+    "id": field(Map.id),
+    "name": field(Map.name),
+    "image_url": field(Map.image_url),
+}
+
 @app.route('/api/maps', methods=['GET'])
 def get_maps():
     logger.info("Recebendo solicitação para listar mapas.")
-    maps = Map.query.all()
-    maps_data = [{
-        "id": map.id,
-        "name": map.name,
-        "image_url": map.image_url
-    } for map in maps]
-
-    logger.info(f"Mapas encontrados: {len(maps_data)}")
-    return jsonify(maps_data), 200
+    return list_rows(MAP_FIELDS, Map.id)
     
 @app.route('/api/maps/<int:map_id>', methods=['GET'])
 def get_map(map_id):
+    layout = map_layouts.get(map_id)
+
+    if not layout:
+        return jsonify({"error": "Mapa não encontrado"}), 404
+
+    # Layout estático vem do cache; só a presença é montada a cada requisição
+    manager = GatewayPeopleManager()  # Obter a instância Singleton
+    people_by_gateway = [manager.get_people_by_gateway(mac) for mac in layout["gateway_macs"]]
+    etag = f"{layout['etag']}-{presence_token(people_by_gateway)}"
+
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        response = jsonify({
+            "map_id": layout["map_id"],
+            "name": layout["name"],
+            "image_url": layout["image_url"],
+            "cameras": layout["cameras"],
+            "gateways": [
+                dict(gateway, people=people)
+                for gateway, people in zip(layout["gateways"], people_by_gateway)
+            ]
+        })
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = "no-cache"
+    return response
+
+
+@app.route('/api/maps/<int:map_id>/events', methods=['GET'])
+def get_map_events(map_id):
     map = Map.query.get(map_id)
 
     if not map:
         return jsonify({"error": "Mapa não encontrado"}), 404
 
-    cameras_data = []
-    for camera_position in map.camera_positions:
-        camera = camera_position.camera
-        cameras_data.append({
-            "camera_id": camera.id,
-            "name": camera.name,
-            "pos_x": camera_position.pos_x,
-            "pos_y": camera_position.pos_y
-        })
+    gateways = [(position.gateway.id, position.gateway.mac) for position in map.gateway_positions]
+    subscriber = presence_events.subscribe([mac for _, mac in gateways], limit=app.config['SSE_MAX_CLIENTS'])
+    initial = presence_events.snapshot_event(gateways)
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
 
-    gateways_data = []
-    manager = GatewayPeopleManager()  # Obter a instância Singleton
-    for gateway_position in map.gateway_positions:
-        gateway = gateway_position.gateway
-        gateways_data.append({
-            "gateway_id": gateway.id,
-            "name": gateway.name,
-            "pos_x": gateway_position.pos_x,
-            "pos_y": gateway_position.pos_y,
-            "people": manager.get_people_by_gateway(gateway.mac)
-        })
+    if subscriber is None:
+        # Threads de SSE deste worker esgotadas: entrega a presença atual e o EventSource reconecta mais tarde
+        logger.warning(f"Limite de {app.config['SSE_MAX_CLIENTS']} streams SSE atingido; cliente do mapa {map_id} vai reconectar.")
+        return Response(initial + sse_retry(FULL_RETRY_MS), mimetype='text/event-stream', headers=headers)
 
-    return jsonify({
-        "map_id": map.id,
-        "name": map.name,
-        "image_url": map.image_url,
-        "cameras": cameras_data,
-        "gateways": gateways_data
-    }), 200
+    # Stream SSE: presença atual e depois só os deltas de entrada/saída dos gateways do mapa
+    def stream():
+        try:
+            yield initial
+            while True:
+                yield subscriber.next_event()
+        finally:
+            presence_events.unsubscribe(subscriber)
+
+    return Response(stream(), mimetype='text/event-stream', headers=headers)
 
 
 @app.route('/api/maps/<int:map_id>', methods=['DELETE'])
@@ -397,14 +499,32 @@ def delete_map(map_id):
     # Remover o mapa
     db.session.delete(map)
     db.session.commit()
+    map_layouts.invalidate(map_id)
 
     return jsonify({"message": "Mapa removido com sucesso"}), 200
 
 
-# Rota para validar a URL RTSP de uma câmera
+# Rota para validar a URL RTSP de uma câmera (ou de várias, com "rtsp_urls")
 @app.route('/api/cameras/validate', methods=['POST'])
 def validate_rtsp():
     data = request.get_json()
+    rtsp_urls = data.get('rtsp_urls')
+
+    if rtsp_urls is not None:
+        if not isinstance(rtsp_urls, list) or not rtsp_urls:
+            return jsonify({"error": "rtsp_urls deve ser uma lista não vazia"}), 400
+        if len(rtsp_urls) > app.config['RTSP_PROBE_MAX_BULK']:
+            return jsonify({"error": f"Máximo de {app.config['RTSP_PROBE_MAX_BULK']} URLs por requisição"}), 400
+
+        # Sondagem concorrente: o tempo total fica próximo ao da URL mais lenta
+        logger.info(f"Validando {len(rtsp_urls)} URLs RTSP...")
+        results = rtsp_prober.probe_many(rtsp_urls, decode=bool(data.get('decode')))
+        return jsonify({
+            "valid": sum(1 for result in results if result["ok"]),
+            "invalid": sum(1 for result in results if not result["ok"]),
+            "results": results
+        }), 200
+
     rtsp_url = data.get('rtsp_url')
 
     if not rtsp_url:
@@ -413,30 +533,29 @@ def validate_rtsp():
 
     # Validar a conexão com a URL RTSP
     logger.info(f"Validando conexão RTSP...")
-    cap = cv2.VideoCapture(rtsp_url)
-    if not cap.isOpened():
-        logger.error(f"Falha ao conectar ao fluxo RTSP: {rtsp_url}")
-        return jsonify({'error': 'Não foi possível conectar ao fluxo RTSP. Verifique a URL.'}), 400
-
-    ret, _ = cap.read()
-    cap.release()
-    if not ret:
-        logger.error(f"Fluxo RTSP inválido ou inacessível: {rtsp_url}")
-        return jsonify({'error': 'Não foi possível ler do fluxo RTSP. Verifique a URL.'}), 400
+    result = rtsp_prober.probe(rtsp_url, decode=bool(data.get('decode')))
+    if not result["ok"]:
+        logger.error(f"Fluxo RTSP inválido ou inacessível ({result['error']}): {rtsp_url}")
+        return jsonify({'error': RTSP_PROBE_ERRORS[result["error"]]}), 400
 
-    return jsonify({"message": "URL RTSP válida"}), 200
+    return jsonify({"message": "URL RTSP válida", "probe": result}), 200
 
-# Função para parar todos os contêineres ao encerrar a aplicação
+# Função para parar todos os contêineres ao encerrar o servidor de desenvolvimento
 def stop_all_containers(signal_received, frame):
     # Parar todos os contêineres criados para câmeras ao finalizar a aplicação
     logger.info("Encerrando todos os contêineres de câmeras...")
-    cameras = Camera.query.all()
-    for camera in cameras:
-        try:
-            if camera.container_id:
-                stop_ffmpeg_container(camera.container_id)
-        except Exception as e:
-            logger.error(f"Erro ao parar contêiner {camera.name}: {e}")
+    with app.app_context():
+        cameras = Camera.query.all()
+        for camera in cameras:
+            try:
+                if camera.container_id:
+                    stop_stream(camera.container_id)
+            except Exception as e:
+                logger.error(f"Erro ao parar contêiner {camera.name}: {e}")
+    scheduler.shutdown()
+    stop_ingest_processes()
+    ingest.stop()
+    location_writer.stop()
     sys.exit(0)
 
 
@@ -453,15 +572,12 @@ def get_person_logs(person_id):
         start_date = datetime.strptime(start_date, '%Y-%m-%d')
         end_date = datetime.strptime(end_date, '%Y-%m-%d') + timedelta(days=1)
 
-        logs = LocationLog.query.filter(
-            LocationLog.person_id == person_id,
-            LocationLog.entry_time >= start_date,
-            LocationLog.entry_time < end_date
-        ).all()
+        # Tabela principal e, quando o período alcança logs antigos, as partições de arquivo
+        logs = location_log_retention.person_logs(person_id, start_date, end_date)
 
         log_data = [
             {
-                "gateway": log.gateway.name,
+                "gateway": log.gateway,
                 "entry_time": log.entry_time.isoformat(),
                 "exit_time": log.exit_time.isoformat() if log.exit_time else None,
                 "duration": str(log.duration) if log.duration else None
@@ -469,12 +585,72 @@ def get_person_logs(person_id):
             for log in logs
         ]
 
-        return jsonify(log_data), 200
+        # Meses exportados para CSV (LOCATION_LOG_ARCHIVE_MONTHS) não entram na resposta: o corpo avisa quais são
+        exported = location_log_retention.exported_between(start_date, end_date)
+        body = {"logs": log_data, "exported_partitions": exported}
+        if exported:
+            body["notice"] = (f"Período incompleto: os logs de {', '.join(exported)} foram exportados para CSV "
+                              f"e não estão nesta resposta.")
+        response = jsonify(body)
+        if exported:
+            response.headers['X-Exported-Partitions'] = ','.join(exported)
+        return response, 200
 
     except Exception as e:
         logger.error(f"Erro ao buscar logs: {e}")
         return jsonify({"error": "Erro ao buscar logs"}), 500
 
+# Período (start_date/end_date, end_date inclusivo) e granularidade dos endpoints de análise
+def analytics_range():
+    start_date = request.args.get('start_date')
+    end_date = request.args.get('end_date')
+    granularity = request.args.get('granularity', 'day')
+    if not start_date or not end_date:
+        return None, (jsonify({"error": "start_date e end_date são obrigatórios"}), 400)
+    if granularity not in GRANULARITIES:
+        return None, (jsonify({"error": f"Granularidade inválida. Use um de: {', '.join(GRANULARITIES)}"}), 400)
+    try:
+        start = datetime.strptime(start_date, '%Y-%m-%d')
+        end = datetime.strptime(end_date, '%Y-%m-%d') + timedelta(days=1)
+    except ValueError:
+        return None, (jsonify({"error": "Datas devem estar no formato AAAA-MM-DD"}), 400)
+    return (start, end, granularity), None
+
+# Ocupação por gateway a partir dos rollups (não varre os LocationLogs)
+@app.route('/api/analytics/occupancy', methods=['GET'])
+def get_occupancy():
+    period, error = analytics_range()
+    if error:
+        return error
+    start, end, granularity = period
+    return jsonify(occupancy(start, end, granularity,
+                             gateway_id=request.args.get('gateway_id', type=int),
+                             sector=request.args.get('sector'))), 200
+
+# Permanência de uma pessoa por gateway a partir dos rollups
+@app.route('/api/people/<int:person_id>/dwell', methods=['GET'])
+def get_person_dwell(person_id):
+    if not db.session.get(Person, person_id):
+        return jsonify({"error": "Pessoa não encontrada"}), 404
+    period, error = analytics_range()
+    if error:
+        return error
+    start, end, granularity = period
+    return jsonify(dict(person_dwell(person_id, start, end, granularity), person_id=person_id,
+                        granularity=granularity)), 200
+
+
+def log_duration(row):
+    return str(row.exit_time - row.entry_time) if row.exit_time else "Presente"
+
+def gateway_people_fields(logs):
+    # logs: LocationLogs da tabela principal e das partições de arquivo (location_log_retention.gateway_logs)
+    return {
+        "id": field(logs.c.person_id),
+        "name": field(Person.name),
+        "sector": field(Person.sector),
+        "duration": field(logs.c.entry_time, logs.c.exit_time, value=log_duration),
+    }
 
 @app.route('/api/gateways/<int:gateway_id>', methods=['GET'])
 def get_gateway_details(gateway_id):
@@ -482,29 +658,19 @@ def get_gateway_details(gateway_id):
     if not gateway:
         return jsonify({"error": "Gateway não encontrado"}), 404
 
-    # Buscando pessoas associadas a este gateway
-    people_logs = LocationLog.query.filter_by(gateway_id=gateway_id).all()
-
-    people_data = []
-    for log in people_logs:
-        person = log.person
-        duration = log.exit_time - log.entry_time if log.exit_time else None
-        people_data.append({
-            "id": person.id,
-            "name": person.name,
-            "sector": person.sector,
-            "duration": str(duration) if duration else "Presente",
-        })
-
-    return jsonify({
-        "gateway": {
+    # Pessoas associadas a este gateway: logs (quentes e arquivados) e pessoas num único SELECT,
+    # paginado pelo id do log, que o arquivamento preserva; meses exportados para CSV não entram
+    logs = location_log_retention.gateway_logs(gateway_id)
+    return list_rows(
+        gateway_people_fields(logs), logs.c.id,
+        join=db.join(logs, Person, logs.c.person_id == Person.id),
+        envelope=("people", {"gateway": {
             "id": gateway.id,
             "name": gateway.name,
             "mac": gateway.mac,
             "sector": gateway.sector,
-        },
-        "people": people_data
-    })
+        }})
+    )
 
 
 @app.route('/api/gateway-people/<string:gateway_mac>', methods=['GET'])
@@ -519,136 +685,82 @@ def get_all_gateway_people():
     data = manager.get_all_data()
     return jsonify(data), 200
 
-# Configuração MQTT
-BROKER = 'mosquitto'
-PORT = 1883
-TOPIC = '/gw/+/status'
-
-# Certifique-se de declarar e inicializar a variável global `gateway_people` no início
-# Inicialize a variável global fora de qualquer função
-class GatewayPeopleManager:
-    _instance = None
-
-    def __new__(cls):
-        if cls._instance is None:
-            cls._instance = super(GatewayPeopleManager, cls).__new__(cls)
-            cls._instance.gateway_people = {}
-        return cls._instance
-
-    def add_person_to_gateway(self, gateway_mac, person):
-        gateway_mac = gateway_mac.lower()
-        if gateway_mac not in self.gateway_people:
-            self.gateway_people[gateway_mac] = []
-        if not any(p['id'] == person['id'] for p in self.gateway_people[gateway_mac]):
-            self.gateway_people[gateway_mac].append(person)
-
-    def remove_inactive_people(self, gateway_mac):
-        gateway_mac = gateway_mac.lower()
-        now = time.time()
-        self.gateway_people[gateway_mac] = [
-            person for person in self.gateway_people.get(gateway_mac, [])
-            if now - gateway_last_seen.get((gateway_mac, person['ibeacon_mac']), 0) <= BUFFER_TIME
-        ]
-
-    def get_people_by_gateway(self, gateway_mac):
-        return self.gateway_people.get(gateway_mac.lower(), [])
-
-    def get_all_data(self):
-        return self.gateway_people
-
-def register_movement(person, gateway):
-    now = datetime.utcnow()
-
-    active_log = LocationLog.query.filter_by(
-        person_id=person.id,
-        gateway_id=gateway.id,
-        exit_time=None
-    ).first()
-
-    if active_log:
-        # Atualiza tempo final de log e duração
-        active_log.exit_time = now
-        active_log.duration = active_log.exit_time - active_log.entry_time
-    else:
-        # Cria novo log de movimentação
-        new_log = LocationLog(
-            person_id=person.id,
-            gateway_id=gateway.id,
-            entry_time=now
-        )
-        db.session.add(new_log)
+def on_message(client, userdata, msg):
+    # Só enfileira: decodificação, resolução e gravação ficam com o pipeline de ingest
+    ingest.submit(msg.topic, msg.payload)
 
-    db.session.commit()
 
-def close_inactive_logs():
-    with app.app_context():
-        now = datetime.utcnow()
-        threshold_time = now - timedelta(seconds=BUFFER_TIME)
-
-        # Atualiza logs inativos
-        inactive_logs = LocationLog.query.filter(
-            LocationLog.exit_time == None,
-            LocationLog.entry_time < threshold_time
-        ).all()
+def mqtt_listener():
+    client = mqtt.Client()
+    client.on_message = on_message
+    client.connect(app.config['MQTT_BROKER'], app.config['MQTT_PORT'])
+    client.subscribe(app.config['MQTT_TOPIC'])
+    client.loop_forever()
 
-        for log in inactive_logs:
-            log.exit_time = now
-            log.duration = log.exit_time - log.entry_time
-            db.session.commit()
 
-def on_message(client, userdata, msg):
-    try:
-        payload = json.loads(msg.payload.decode('utf-8'))
-        topic = msg.topic
-        gateway_mac = topic.split('/')[2].lower()
+# Modo 'partitioned': o ingest roda em processos separados (ingest_worker.py) e a API
+# só consome a presença que eles publicam no broker
+ingest_processes = []
+
+def start_ingest_processes():
+    partitions = app.config['INGEST_PROCESSES']
+    for partition in range(partitions):
+        process = subprocess.Popen([
+            sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'ingest_worker.py'),
+            '--partition', str(partition), '--partitions', str(partitions)
+        ])
+        ingest_processes.append(process)
+    logger.info(f"{partitions} processos de ingest iniciados.")
+
+def stop_ingest_processes():
+    for process in ingest_processes:
+        process.terminate()
+    for process in ingest_processes:
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+def presence_listener():
+    client = connect(app.config)
+    consumer = PresenceConsumer(app.config['MQTT_PRESENCE_TOPIC'])
+    client.on_message = lambda client, userdata, msg: consumer.on_message(msg)
+    # Cadastros alterados nesta API precisam chegar ao índice dos processos de ingest
+    mac_index.add_listener(lambda: notify_index_changed(client, app.config['MQTT_INDEX_TOPIC']))
+    consumer.subscribe(client)
+    client.loop_forever()
 
-        logger.info(f"Mensagem recebida do gateway {gateway_mac}: {payload}")
+def gateway_discovery_listener():
+    # Processos de ingest só assinam gateways cadastrados; os novos aparecem por aqui
+    client = connect(app.config)
+    discovery = GatewayDiscovery(client, app.config['MQTT_PRESENCE_TOPIC'])
 
+    def reload_index():
         with app.app_context():
-            manager = GatewayPeopleManager()
-
-            for entry in payload:
-                if entry.get("type") == "iBeacon":
-                    ibeacon_mac = entry.get("mac")
-                    person = Person.query.filter_by(ibeacon_mac=ibeacon_mac).first()
-                    if person:
-                        # Atualiza última vez vista
-                        gateway_last_seen[(gateway_mac, ibeacon_mac)] = time.time()
-
-                        # Adiciona pessoa ao gateway
-                        manager.add_person_to_gateway(gateway_mac, {
-                            "id": person.id,
-                            "name": person.name,
-                            "sector": person.sector,
-                            "ibeacon_mac": ibeacon_mac
-                        })
-
-                        # Registra movimentação
-                        gateway = Gateway.query.filter_by(mac=gateway_mac).first()
-                        if gateway:
-                            register_movement(person, gateway)
-
-            # Remove pessoas inativas
-            manager.remove_inactive_people(gateway_mac)
-
-    except Exception as e:
-        logger.error(f"Erro ao processar mensagem MQTT: {e}")
-
+            mac_index.load()
 
+    def on_message(client, userdata, msg):
+        if msg.topic == app.config['MQTT_INDEX_TOPIC']:
+            threading.Thread(target=reload_index, daemon=True).start()
+            return
+        discovery.on_message(msg)
 
-def mqtt_listener():
-    client = mqtt.Client()
+    client.on_connect = lambda client, *args: client.subscribe(
+        [(app.config['MQTT_TOPIC'], 0), (app.config['MQTT_INDEX_TOPIC'], 0)])
     client.on_message = on_message
-    client.connect(BROKER, PORT)
-    client.subscribe(TOPIC)
-    client.loop_forever()       
+    client.loop_forever()
 
 
+@app.route('/api/ingest/stats', methods=['GET'])
+def get_ingest_stats():
+    # O ingest roda no processo de serviços ou nos processos de ingest; sem publicação, é o pipeline local (desenvolvimento)
+    published = status_board.read_all("ingest-")
+    return jsonify(merge_stats(published) if published else ingest.stats()), 200
+
 @app.route('/api/gateways/active', methods=['GET'])
 def list_active_gateways():
-    now = time.time()
-    active_list = [mac for mac, timestamp in active_gateways.items() if now - timestamp <= 5]
-    return jsonify(active_list)
+    manager = GatewayPeopleManager()
+    return jsonify(manager.get_active_gateways())
 
 # Rota para cadastrar um gateway
 @app.route('/api/gateways/register', methods=['POST'])
@@ -670,13 +782,20 @@ def register_gateway():
     new_gateway = Gateway(name=name, mac=mac, sector=sector)
     db.session.add(new_gateway)
     db.session.commit()
+    mac_index.put_gateway(new_gateway)
     return jsonify({"message": "Gateway registrado com sucesso"}), 201
 
+GATEWAY_FIELDS = {
+    "id": field(Gateway.id),
+    "name": field(Gateway.name),
+    "mac": field(Gateway.mac),
+    "sector": field(Gateway.sector),
+}
+
 # Rota para listar gateways registrados
 @app.route('/api/gateways', methods=['GET'])
 def list_gateways():
-    gateways = Gateway.query.all()
-    return jsonify([{"id": g.id, "name": g.name, "mac": g.mac, "sector": g.sector} for g in gateways])
+    return list_rows(GATEWAY_FIELDS, Gateway.id)
 
 @app.route('/api/gateways/delete/<int:id>', methods=['DELETE'])
 def delete_gateway(id):
@@ -688,6 +807,8 @@ def delete_gateway(id):
     # Deleta o gateway
     db.session.delete(gateway)
     db.session.commit()
+    mac_index.remove_gateway(gateway.mac)
+    map_layouts.invalidate()
     return jsonify({"message": "Gateway deletado com sucesso"}), 200
 
 @app.route('/api/people/register', methods=['POST'])
@@ -709,6 +830,7 @@ def register_person():
     new_person = Person(name=name, sector=sector, ibeacon_mac=ibeacon_mac)
     db.session.add(new_person)
     db.session.commit()
+    mac_index.put_person(new_person)
 
     return jsonify({
         "message": "Pessoa cadastrada com sucesso",
@@ -720,13 +842,16 @@ def register_person():
         }
     }), 201
 
+PERSON_FIELDS = {
+    "id": field(Person.id),
+    "name": field(Person.name),
+    "sector": field(Person.sector),
+    "ibeacon_mac": field(Person.ibeacon_mac),
+}
+
 @app.route('/api/people', methods=['GET'])
 def list_people():
-    people = Person.query.all()
-    return jsonify([
-        {"id": p.id, "name": p.name, "sector": p.sector, "ibeacon_mac": p.ibeacon_mac}
-        for p in people
-    ])
+    return list_rows(PERSON_FIELDS, Person.id)
 
 @app.route('/api/people/update/<int:id>', methods=['PUT'])
 def update_person(id):
@@ -738,6 +863,7 @@ def update_person(id):
     name = data.get('name')
     sector = data.get('sector')
     ibeacon_mac = data.get('ibeacon_mac')
+    old_mac = person.ibeacon_mac
 
     # Atualiza os campos fornecidos
     if name:
@@ -752,6 +878,7 @@ def update_person(id):
         person.ibeacon_mac = ibeacon_mac
 
     db.session.commit()
+    mac_index.put_person(person, old_mac=old_mac)
     return jsonify({
         "message": "Pessoa atualizada com sucesso",
         "person": {
@@ -770,22 +897,111 @@ def delete_person(id):
 
     db.session.delete(person)
     db.session.commit()
+    mac_index.remove_person(person.ibeacon_mac)
     return jsonify({"message": "Pessoa deletada com sucesso"}), 200
 
-# Associa sinais de interrupção (Ctrl+C ou término do programa) ao método de limpeza
-signal.signal(signal.SIGINT, stop_all_containers)
-signal.signal(signal.SIGTERM, stop_all_containers)
+def schedule_maintenance_jobs():
+    # Manutenção do banco: uma única instância por implantação (logs inativos são fechados pelo location_writer)
+    scheduler.add_job(presence_rollups.compact, app.config['ROLLUP_INTERVAL'])
+    scheduler.add_job(location_log_retention.run, app.config['LOCATION_LOG_RETENTION_INTERVAL'])
 
-def mqtt_listener():
-    client = mqtt.Client()
+
+def start_worker_services():
+    """Serviços de cada worker WSGI: presença publicada pelo ingest e expiração de gateways.
+
+    O estado de presença fica na memória do processo, então cada worker
+    consome o tópico de presença por conta própria. Ingest, manutenção do
+    banco e streams ficam no processo de serviços (services.py).
+    """
+    scheduler.add_job(GatewayPeopleManager().remove_inactive_people, 1)
+    scheduler.start()
+    threading.Thread(target=presence_listener, name="presence-listener", daemon=True).start()
+
+
+def start_publishing_ingest():
+    """Ingest no próprio processo (INGEST_MODE='thread') com a presença publicada no broker.
+
+    É o modo 'thread' sob o gunicorn: os workers WSGI recebem a presença pelo
+    presence_listener, do mesmo jeito que no modo 'partitioned', só que de um
+    único pipeline no processo de serviços.
+    """
+    client = connect(app.config, client_id="camanager-ingest")
+    publisher = PresencePublisher(client, app.config['MQTT_PRESENCE_TOPIC'])
+    publisher.attach(GatewayPeopleManager())
+    scheduler.add_job(GatewayPeopleManager().remove_inactive_people, 1)
+    scheduler.add_job(publisher.republish_all, BUFFER_TIME / 2)
+    scheduler.add_job(ingest.publish_status, app.config['STATUS_INTERVAL'])
+
+    def reload_index():
+        with app.app_context():
+            mac_index.load()
+
+    def on_message(client, userdata, msg):
+        if msg.topic == app.config['MQTT_INDEX_TOPIC']:
+            threading.Thread(target=reload_index, daemon=True).start()
+            return
+        ingest.submit(msg.topic, msg.payload)
+
+    client.on_connect = lambda client, *args: client.subscribe(
+        [(app.config['MQTT_TOPIC'], 0), (app.config['MQTT_INDEX_TOPIC'], 0)])
     client.on_message = on_message
-    client.connect(BROKER, PORT)
-    client.subscribe(TOPIC)
-    client.loop_forever()
+    location_writer.start()
+    ingest.start()
+    threading.Thread(target=client.loop_forever, name="mqtt-ingest", daemon=True).start()
+
+
+def start_deployment_services():
+    """Serviços que rodam uma vez por implantação: ingest, manutenção e streams."""
+    schedule_maintenance_jobs()
+    if app.config['INGEST_MODE'] == 'partitioned':
+        start_ingest_processes()
+        threading.Thread(target=gateway_discovery_listener, name="gateway-discovery", daemon=True).start()
+    else:
+        start_publishing_ingest()
+    # Reconciliação, tempos de start e workers para as rotas de estatísticas dos workers WSGI
+    scheduler.add_job(stream_reconciler.publish_status, app.config['STATUS_INTERVAL'])
+    scheduler.start()
+    stream_reconciler.start(then=stream_health.start)
+    stream_demand.start()
+
+
+def stop_deployment_services():
+    # Os contêineres/processos FFmpeg continuam no ar: a próxima reconciliação os reaproveita
+    scheduler.shutdown()
+    stop_ingest_processes()
+    ingest.stop()
+    location_writer.stop()
+    stream_reconciler.stop()
+    stream_health.stop()
+
 
 if __name__ == '__main__':
-    mqtt_thread = threading.Thread(target=mqtt_listener)
+    # Servidor de desenvolvimento, tudo num processo só; em produção use o gunicorn (gunicorn.conf.py)
+    create_app()
+    # Associa sinais de interrupção (Ctrl+C ou término do programa) ao método de limpeza
+    signal.signal(signal.SIGINT, stop_all_containers)
+    signal.signal(signal.SIGTERM, stop_all_containers)
+
+    schedule_maintenance_jobs()
+    scheduler.add_job(GatewayPeopleManager().remove_inactive_people, 1)
+    scheduler.start()
+
+    if app.config['INGEST_MODE'] == 'partitioned':
+        start_ingest_processes()
+        threading.Thread(target=gateway_discovery_listener, daemon=True).start()
+        mqtt_thread = threading.Thread(target=presence_listener)
+    else:
+        location_writer.start()
+        ingest.start()
+        mqtt_thread = threading.Thread(target=mqtt_listener)
     mqtt_thread.daemon = True
     mqtt_thread.start()
 
-    app.run(debug=True, host="0.0.0.0", port=5000)
+    # Com o reloader do modo debug, só o processo filho (que atende as requisições) reconcilia;
+    # o monitor de saúde começa depois, para não reiniciar streams que a reconciliação está subindo
+    debug = os.getenv('FLASK_DEBUG', '1').lower() in ('1', 'true')
+    if not debug or is_running_from_reloader():
+        stream_reconciler.start(wait_for=("127.0.0.1", 5000), then=stream_health.start)
+        stream_demand.start()
+
+    app.run(debug=debug, host="0.0.0.0", port=5000)
@@ -1,6 +1,103 @@
 import os
 
+INSTANCE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance')
+
 class Config:
     SQLALCHEMY_DATABASE_URI = os.getenv('SQLALCHEMY_DATABASE_URI', 'sqlite:///cameras.db')
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     SECRET_KEY = os.getenv('SECRET_KEY', os.urandom(24))
+
+    # Banco
+    DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', 10))
+    DB_MAX_OVERFLOW = int(os.getenv('DB_MAX_OVERFLOW', 20))
+    DB_POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', 30.0))
+    DB_POOL_RECYCLE = int(os.getenv('DB_POOL_RECYCLE', 1800))
+    SQLITE_BUSY_TIMEOUT = int(os.getenv('SQLITE_BUSY_TIMEOUT', 5000))  # ms
+    SQLITE_MMAP_SIZE = int(os.getenv('SQLITE_MMAP_SIZE', 256 * 1024 * 1024))
+    SQLITE_CACHE_KB = int(os.getenv('SQLITE_CACHE_KB', 64 * 1024))
+
+    # LocationLogs
+    LOCATION_LOG_FLUSH_INTERVAL = float(os.getenv('LOCATION_LOG_FLUSH_INTERVAL', 1.0))
+    LOCATION_LOG_BATCH_SIZE = int(os.getenv('LOCATION_LOG_BATCH_SIZE', 500))
+    LOCATION_LOG_SWEEP_INTERVAL = float(os.getenv('LOCATION_LOG_SWEEP_INTERVAL', 5.0))
+    ROLLUP_INTERVAL = float(os.getenv('ROLLUP_INTERVAL', 60.0))
+    ROLLUP_BATCH_SIZE = int(os.getenv('ROLLUP_BATCH_SIZE', 5000))
+    LOCATION_LOG_HOT_DAYS = int(os.getenv('LOCATION_LOG_HOT_DAYS', 30))
+    LOCATION_LOG_ARCHIVE_BATCH = int(os.getenv('LOCATION_LOG_ARCHIVE_BATCH', 5000))
+    LOCATION_LOG_ARCHIVE_MONTHS = int(os.getenv('LOCATION_LOG_ARCHIVE_MONTHS', 0))  # 0 = nunca exportar
+    LOCATION_LOG_EXPORT_DIR = os.getenv('LOCATION_LOG_EXPORT_DIR', os.path.join(INSTANCE_DIR, 'archive'))
+    LOCATION_LOG_RETENTION_INTERVAL = float(os.getenv('LOCATION_LOG_RETENTION_INTERVAL', 3600.0))
+    LOCATION_LOG_VACUUM_PAGES = int(os.getenv('LOCATION_LOG_VACUUM_PAGES', 2000))
+
+    # API
+    LIST_MAX_LIMIT = int(os.getenv('LIST_MAX_LIMIT', 1000))
+    LIST_YIELD_PER = int(os.getenv('LIST_YIELD_PER', 500))
+    SSE_MAX_CLIENTS = int(os.getenv('SSE_MAX_CLIENTS', 32))  # Por worker do gunicorn
+    MAP_CACHE_VERSION_FILE = os.getenv('MAP_CACHE_VERSION_FILE', os.path.join(INSTANCE_DIR, 'map-layouts.version'))
+
+    # MQTT
+    MQTT_BROKER = os.getenv('MQTT_BROKER', 'mosquitto')
+    MQTT_PORT = int(os.getenv('MQTT_PORT', 1883))
+    MQTT_TOPIC = os.getenv('MQTT_TOPIC', '/gw/+/status')
+    MQTT_PRESENCE_TOPIC = os.getenv('MQTT_PRESENCE_TOPIC', 'camanager/presence')
+    MQTT_INDEX_TOPIC = os.getenv('MQTT_INDEX_TOPIC', 'camanager/control/mac-index')
+
+    # Ingest
+    INGEST_WORKERS = int(os.getenv('INGEST_WORKERS', 4))
+    INGEST_QUEUE_SIZE = int(os.getenv('INGEST_QUEUE_SIZE', 10000))
+    INGEST_MODE = os.getenv('INGEST_MODE', 'thread')  # 'thread' ou 'partitioned'
+    INGEST_PROCESSES = int(os.getenv('INGEST_PROCESSES', 2))
+    STATUS_DIR = os.getenv('STATUS_DIR', os.path.join(INSTANCE_DIR, 'status'))
+    STATUS_INTERVAL = float(os.getenv('STATUS_INTERVAL', 5.0))
+    STATUS_MAX_AGE = float(os.getenv('STATUS_MAX_AGE', 30.0))
+
+    # Sondagem RTSP
+    RTSP_PROBE_WORKERS = int(os.getenv('RTSP_PROBE_WORKERS', 8))
+    RTSP_PROBE_TIMEOUT = float(os.getenv('RTSP_PROBE_TIMEOUT', 5.0))
+    RTSP_PROBE_CACHE_TTL = float(os.getenv('RTSP_PROBE_CACHE_TTL', 30.0))
+    RTSP_PROBE_MAX_BULK = int(os.getenv('RTSP_PROBE_MAX_BULK', 200))
+    RTSP_PROBE_READ_PACKET = os.getenv('RTSP_PROBE_READ_PACKET', 'false').lower() == 'true'
+
+    # Streams
+    STREAM_BACKEND = os.getenv('STREAM_BACKEND', 'docker')  # 'docker', 'process' ou 'multiplexed'
+    STREAM_X264_PRESET = os.getenv('STREAM_X264_PRESET', 'veryfast')
+    STREAM_X264_TUNE = os.getenv('STREAM_X264_TUNE', '')
+    HLS_SEGMENT_TIME = float(os.getenv('HLS_SEGMENT_TIME', 2.0))
+    HLS_LIST_SIZE = int(os.getenv('HLS_LIST_SIZE', 5))
+    HLS_LOW_LATENCY = os.getenv('HLS_LOW_LATENCY', 'false').lower() == 'true'
+    HLS_LL_SEGMENT_TIME = float(os.getenv('HLS_LL_SEGMENT_TIME', 1.0))
+    HLS_LL_LIST_SIZE = int(os.getenv('HLS_LL_LIST_SIZE', 4))
+    HLS_ESTIMATED_BITRATE = os.getenv('HLS_ESTIMATED_BITRATE', '4000k')
+    FFMPEG_IMAGE = os.getenv('FFMPEG_IMAGE', 'ffmpeg')
+    FFMPEG_HOST_OUTPUT_DIR = os.getenv('FFMPEG_HOST_OUTPUT_DIR', '/tmp/output')  # Visto pelo Docker no host
+    FFMPEG_LOCAL_OUTPUT_DIR = os.getenv('FFMPEG_LOCAL_OUTPUT_DIR', '/app/output')
+    FFMPEG_FIRST_SEGMENT_TIMEOUT = float(os.getenv('FFMPEG_FIRST_SEGMENT_TIMEOUT', 30.0))
+    FFMPEG_RECONCILE_WORKERS = int(os.getenv('FFMPEG_RECONCILE_WORKERS', 4))
+    FFMPEG_BINARY = os.getenv('FFMPEG_BINARY', 'ffmpeg')
+    FFMPEG_PID_DIR = os.getenv('FFMPEG_PID_DIR', os.path.join(INSTANCE_DIR, 'ffmpeg'))
+    FFMPEG_RESTART_BACKOFF = float(os.getenv('FFMPEG_RESTART_BACKOFF', 1.0))
+    FFMPEG_RESTART_BACKOFF_MAX = float(os.getenv('FFMPEG_RESTART_BACKOFF_MAX', 60.0))
+    FFMPEG_RESTART_STABLE = float(os.getenv('FFMPEG_RESTART_STABLE', 60.0))
+    FFMPEG_PROCESS_NICE = int(os.getenv('FFMPEG_PROCESS_NICE', 5))  # 0 = não alterar
+    FFMPEG_PROCESS_MEMORY_MB = int(os.getenv('FFMPEG_PROCESS_MEMORY_MB', 0))  # 0 = sem limite
+    FFMPEG_MUX_MAX_CAMERAS = int(os.getenv('FFMPEG_MUX_MAX_CAMERAS', 32))
+    FFMPEG_MUX_DEBOUNCE = float(os.getenv('FFMPEG_MUX_DEBOUNCE', 1.0))
+    FFMPEG_MUX_STALL_TIMEOUT = float(os.getenv('FFMPEG_MUX_STALL_TIMEOUT', 15.0))
+    FFMPEG_MUX_QUARANTINE_FAILURES = int(os.getenv('FFMPEG_MUX_QUARANTINE_FAILURES', 3))
+    STREAM_HEALTH_CHECK_INTERVAL = float(os.getenv('STREAM_HEALTH_CHECK_INTERVAL', 5.0))
+    STREAM_HEALTH_STALL_FACTOR = float(os.getenv('STREAM_HEALTH_STALL_FACTOR', 3.0))  # Em durações de segmento
+    STREAM_HEALTH_MIN_STALL = float(os.getenv('STREAM_HEALTH_MIN_STALL', 10.0))
+    STREAM_HEALTH_STARTUP_GRACE = float(os.getenv('STREAM_HEALTH_STARTUP_GRACE', 30.0))
+    STREAM_HEALTH_RESTART_BACKOFF = float(os.getenv('STREAM_HEALTH_RESTART_BACKOFF', 5.0))
+    STREAM_HEALTH_RESTART_BACKOFF_MAX = float(os.getenv('STREAM_HEALTH_RESTART_BACKOFF_MAX', 300.0))
+    STREAM_ON_DEMAND = os.getenv('STREAM_ON_DEMAND', 'false').lower() == 'true'
+    STREAM_IDLE_TIMEOUT = float(os.getenv('STREAM_IDLE_TIMEOUT', 60.0))
+    STREAM_ACTIVATION_TIMEOUT = float(os.getenv('STREAM_ACTIVATION_TIMEOUT', 20.0))
+    STREAM_DEMAND_DIR = os.getenv('STREAM_DEMAND_DIR', os.path.join(INSTANCE_DIR, 'viewers'))
+    STREAM_REQUEST_DIR = os.getenv('STREAM_REQUEST_DIR', os.path.join(INSTANCE_DIR, 'stream-requests'))
+    STREAM_REQUEST_POLL = float(os.getenv('STREAM_REQUEST_POLL', 1.0))
+    SNAPSHOT_TTL = float(os.getenv('SNAPSHOT_TTL', 5.0))
+    SNAPSHOT_CACHE_SIZE = int(os.getenv('SNAPSHOT_CACHE_SIZE', 256))
+    SNAPSHOT_WIDTH = int(os.getenv('SNAPSHOT_WIDTH', 320))
+    SNAPSHOT_QUALITY = int(os.getenv('SNAPSHOT_QUALITY', 5))  # -q:v do FFmpeg, 2 (melhor) a 31
+    SNAPSHOT_TIMEOUT = float(os.getenv('SNAPSHOT_TIMEOUT', 5.0))
@@ -0,0 +1,116 @@
+import logging
+import os
+
+from sqlalchemy import event, inspect
+from sqlalchemy.engine import make_url
+
+from config import Config
+from models import db, upgrade_schema
+
+logger = logging.getLogger(__name__)
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'migrations')
+INSTANCE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance')
+
+
+def database_url(uri, instance_path=INSTANCE_DIR):
+    """URI do banco como o Flask-SQLAlchemy a usa: SQLite relativo fica na pasta instance/ da aplicação."""
+    url = make_url(uri)
+    if url.get_backend_name() == 'sqlite' and url.database not in (None, '', ':memory:') \
+            and not url.database.startswith('file:') and not os.path.isabs(url.database):
+        url = url.set(database=os.path.join(instance_path, url.database))
+    return url
+
+
+def engine_options(uri):
+    """Opções do engine SQLAlchemy ajustadas ao banco da URI.
+
+    SQLite: pool pequeno (um único escritor por vez no WAL) e timeout de
+    lock no driver igual ao busy_timeout. PostgreSQL: pool com pre-ping e
+    reciclagem, para sobreviver a conexões derrubadas pelo servidor.
+    """
+    url = make_url(uri)
+    if url.get_backend_name() == 'sqlite':
+        connect_args = {"timeout": Config.SQLITE_BUSY_TIMEOUT / 1000, "check_same_thread": False}
+        if url.database in (None, '', ':memory:'):
+            # Banco em memória usa um pool de conexão única por thread
+            return {"connect_args": connect_args}
+        return {
+            "pool_size": Config.DB_POOL_SIZE,
+            "max_overflow": Config.DB_MAX_OVERFLOW,
+            "pool_timeout": Config.DB_POOL_TIMEOUT,
+            "connect_args": connect_args,
+        }
+    return {
+        "pool_size": Config.DB_POOL_SIZE,
+        "max_overflow": Config.DB_MAX_OVERFLOW,
+        "pool_timeout": Config.DB_POOL_TIMEOUT,
+        "pool_recycle": Config.DB_POOL_RECYCLE,
+        "pool_pre_ping": True,
+    }
+
+
+def _sqlite_pragmas(dbapi_connection, connection_record):
+    # WAL: leitores não bloqueiam o escritor (thread MQTT) e vice-versa
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute(f"PRAGMA busy_timeout={Config.SQLITE_BUSY_TIMEOUT}")
+    cursor.execute(f"PRAGMA mmap_size={Config.SQLITE_MMAP_SIZE}")
+    cursor.execute(f"PRAGMA cache_size=-{Config.SQLITE_CACHE_KB}")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.close()
+
+
+def init_db(app):
+    """Configura o engine conforme o banco e registra o Flask-SQLAlchemy na aplicação."""
+    options = engine_options(app.config['SQLALCHEMY_DATABASE_URI'])
+    options.update(app.config.get('SQLALCHEMY_ENGINE_OPTIONS', {}))
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = options
+    db.init_app(app)
+    with app.app_context():
+        if db.engine.dialect.name == 'sqlite':
+            event.listen(db.engine, 'connect', _sqlite_pragmas)
+
+
+def migrate(app):
+    """Atualiza o esquema com as migrações Alembic até a última revisão.
+
+    Bancos criados antes das migrações (sem alembic_version) recebem as
+    colunas e índices que faltam pelo upgrade_schema() e são marcados na
+    última revisão, já que o esquema fica igual ao dos modelos. Sem o Alembic
+    instalado, cai no db.create_all() + upgrade_schema() de antes.
+    """
+    try:
+        from alembic import command
+        from alembic.config import Config as AlembicConfig
+    except ImportError:
+        logger.warning("Alembic não instalado; criando o esquema com create_all().")
+        db.create_all()
+        upgrade_schema()
+        return
+
+    alembic_config = AlembicConfig(os.path.join(os.path.dirname(MIGRATIONS_DIR), 'alembic.ini'))
+    alembic_config.set_main_option('script_location', MIGRATIONS_DIR)
+    tables = set(inspect(db.engine).get_table_names())
+    legacy = bool(tables) and 'alembic_version' not in tables
+    if legacy:
+        logger.info("Banco anterior às migrações: completando o esquema e marcando a última revisão.")
+        db.create_all()
+        upgrade_schema()
+    with db.engine.begin() as connection:
+        alembic_config.attributes['connection'] = connection
+        if legacy:
+            command.stamp(alembic_config, 'head')
+        else:
+            command.upgrade(alembic_config, 'head')
+
+
+def database_info():
+    engine = db.engine
+    info = {"dialect": engine.dialect.name, "pool": engine.pool.status()}
+    if engine.dialect.name == 'sqlite':
+        with engine.connect() as connection:
+            info["journal_mode"] = connection.exec_driver_sql("PRAGMA journal_mode").scalar()
+            info["synchronous"] = connection.exec_driver_sql("PRAGMA synchronous").scalar()
+    return info
@@ -8,5 +8,13 @@ if [ -d /mnt/frontend_build ]; then
   ln -sf /mnt/frontend_build/* /usr/share/nginx/html/
 fi
 
+# Streams sob demanda: só então cada pedido em /streams/ passa pela API
+mkdir -p /etc/nginx/streams.d
+if [ "$STREAM_ON_DEMAND" = "true" ]; then
+  cp /etc/nginx/stream_access.conf /etc/nginx/streams.d/stream_access.conf
+else
+  rm -f /etc/nginx/streams.d/stream_access.conf
+fi
+
 # Iniciar o Nginx
 nginx -g 'daemon off;'
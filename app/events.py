@@ -0,0 +1,118 @@
+import json
+import queue
+import threading
+
+from mac_index import mac_index, normalize_mac
+from presence import GatewayPeopleManager
+
+HEARTBEAT_INTERVAL = 15  # Segundos entre comentários de keep-alive no stream
+SUBSCRIBER_QUEUE_SIZE = 256
+FULL_RETRY_MS = 10000  # Espera pedida ao EventSource antes de reconectar quando o worker está lotado
+
+
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n".encode('utf-8')
+
+
+def sse_retry(milliseconds):
+    return f"retry: {milliseconds}\n\n".encode('utf-8')
+
+
+class _Subscriber:
+    def __init__(self, gateway_macs):
+        self.gateway_macs = gateway_macs
+        self.queue = queue.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        self.overflowed = False
+
+    def next_event(self, timeout=HEARTBEAT_INTERVAL):
+        if self.overflowed:
+            # Cliente lento perdeu eventos: descarta a fila e pede para recarregar o mapa
+            self.overflowed = False
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            return sse_event("resync", {})
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return b": ping\n\n"
+
+
+class PresenceEventBroker:
+    """Distribui deltas de presença (entrada/saída por gateway) para streams SSE.
+
+    Os deltas saem das mudanças publicadas pelo GatewayPeopleManager, tanto no
+    ingest local quanto na presença replicada dos processos de ingest. Cada
+    evento é serializado uma única vez e os mesmos bytes vão para todos os
+    assinantes dos gateways afetados.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._by_gateway = {}  # gateway_mac -> tupla de assinantes (copy-on-write)
+        self._subscribers = 0
+        self._last = {}  # gateway_mac -> {person_id: pessoa} do último evento
+
+    def attach(self, manager):
+        manager.add_listener(self._on_change)
+
+    def subscribe(self, gateway_macs, limit=None):
+        """Novo assinante dos gateways, ou None se já há limit assinantes neste processo."""
+        subscriber = _Subscriber({normalize_mac(mac) for mac in gateway_macs})
+        with self._lock:
+            if limit is not None and self._subscribers >= limit:
+                return None
+            self._subscribers += 1
+            for gateway_mac in subscriber.gateway_macs:
+                self._by_gateway[gateway_mac] = self._by_gateway.get(gateway_mac, ()) + (subscriber,)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            self._subscribers -= 1
+            for gateway_mac in subscriber.gateway_macs:
+                remaining = tuple(s for s in self._by_gateway.get(gateway_mac, ()) if s is not subscriber)
+                if remaining:
+                    self._by_gateway[gateway_mac] = remaining
+                else:
+                    self._by_gateway.pop(gateway_mac, None)
+
+    def snapshot_event(self, gateways):
+        """Evento inicial com a presença atual de [(gateway_id, gateway_mac), ...]."""
+        manager = GatewayPeopleManager()
+        return sse_event("snapshot", {
+            "gateways": [
+                {"gateway_id": gateway_id, "people": manager.get_people_by_gateway(gateway_mac)}
+                for gateway_id, gateway_mac in gateways
+            ]
+        })
+
+    def _on_change(self, gateway_mac, people):
+        # Chamado com o lock da faixa do gateway: os eventos de um gateway saem em ordem
+        current = {person['id']: person for person in people}
+        previous = self._last.get(gateway_mac, {})
+        if current:
+            self._last[gateway_mac] = current
+        else:
+            self._last.pop(gateway_mac, None)
+
+        entered = [person for person_id, person in current.items() if person_id not in previous]
+        left = [person_id for person_id in previous if person_id not in current]
+        subscribers = self._by_gateway.get(gateway_mac)
+        if not subscribers or not (entered or left):
+            return
+
+        gateway = mac_index.gateway_by_mac(gateway_mac)
+        payload = sse_event("presence", {
+            "gateway_id": gateway['id'] if gateway else None,
+            "gateway_mac": gateway_mac,
+            "entered": entered,
+            "left": left
+        })
+        for subscriber in subscribers:
+            try:
+                subscriber.queue.put_nowait(payload)
+            except queue.Full:
+                subscriber.overflowed = True
+
+
+presence_events = PresenceEventBroker()
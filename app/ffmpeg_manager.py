@@ -1,67 +1,822 @@
+import hashlib
+import logging
 import os
+import re
+import resource
+import shutil
+import signal
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 import docker
-from docker.errors import NotFound, APIError
-
-client = docker.from_env()
-
-def start_ffmpeg_container(camera_id, camera_name, rtsp_url):
-    # Usar um identificador único baseado em UUID para o nome do container
-    container_name = f"ffmpeg_{camera_id}"
-    output_dir = f"/tmp/output/{camera_id}"  # Diretório no host baseado no ID da câmera
-    container_output_dir = f"/output/{camera_id}"  # Diretório no container baseado no ID da câmera
-
-    # Certifique-se de que o diretório de saída no host existe
-    os.makedirs(output_dir, exist_ok=True)
-
-    # Montagem do volume de maneira consistente para garantir a sincronização
-    volume_mapping = {
-        output_dir: {'bind': container_output_dir, 'mode': 'rw'}
-    }
-
-    # Certifique-se de que a pasta seja criada dentro do volume no container
-    client.containers.run(
-        "alpine",  # Usar uma imagem leve para criar o diretório
-        command=["mkdir", "-p", container_output_dir],
-        volumes=volume_mapping,
-        remove=True  # Remove o container imediatamente após a execução
-    )
-
-    # Iniciar o contêiner FFmpeg com a configuração correta
-    container = client.containers.run(
-        "ffmpeg",  # Nome da imagem do FFmpeg
-        command=[
-            "-rtsp_transport", "tcp",
-            "-i", rtsp_url,
-            "-c:v", "libx264",
-            "-c:a", "aac",
-            "-b:a", "32k",
-            "-f", "hls",
-            "-hls_time", "2",
-            "-hls_list_size", "5",
-            "-hls_flags", "delete_segments",
-            f"{container_output_dir}/stream.m3u8"  # Arquivo de saída
-        ],
-        name=container_name,
-        detach=True,
-        volumes=volume_mapping,
-        user='root',
-        auto_remove=True 
-    )
-
-    return container.id
-
-def stop_ffmpeg_container(container_id):
+from docker.errors import NotFound, APIError, ImageNotFound
+
+from config import Config
+from stream_profiles import resolve_profile, hls_window, ffmpeg_input_args, ffmpeg_output_args
+
+logger = logging.getLogger(__name__)
+
+CONTAINER_PREFIX = "ffmpeg_"
+CONTAINER_NAME_RE = re.compile(r"^/?ffmpeg_(\d+)$")
+SPEC_LABEL = "camanager.spec"  # Hash da configuração usada para criar o contêiner
+
+
+def build_ffmpeg_command(rtsp_url, container_output_dir, profile=None):
+    if profile is None:
+        profile = resolve_profile(None, None)
+    return [
+        "-rtsp_transport", "tcp",
+        *ffmpeg_input_args(profile),
+        "-i", rtsp_url,
+        *ffmpeg_output_args(profile, container_output_dir)
+    ]
+
+
+def stream_spec(camera_id, rtsp_url, profile=None):
+    # Resumo da configuração do worker; a URL (com credenciais) não vai para os labels
+    command = build_ffmpeg_command(rtsp_url, f"/output/{camera_id}", profile)
+    return hashlib.sha1("\0".join(command).encode('utf-8')).hexdigest()[:16]
+
+
+class SegmentWatcher:
+    """Mede quanto tempo cada worker leva até gravar o primeiro segmento HLS.
+
+    Uma única thread verifica periodicamente os diretórios de saída das
+    câmeras recém-iniciadas, em vez de uma thread por start.
+    """
+
+    def __init__(self, interval=0.25):
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._pending = {}  # camera_id -> (nome, início monotônico, início no relógio, timings)
+        self._timings = {}  # camera_id -> timings do último start
+        self._thread = None
+
+    def watch(self, camera_id, camera_name, started, started_at, timings):
+        with self._lock:
+            self._timings[camera_id] = timings
+            self._pending[camera_id] = (camera_name, started, started_at, timings)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="segment-watcher", daemon=True)
+                self._thread.start()
+
+    def forget(self, camera_id):
+        with self._lock:
+            self._pending.pop(camera_id, None)
+            self._timings.pop(camera_id, None)
+
+    def timings(self):
+        with self._lock:
+            return {camera_id: dict(timings) for camera_id, timings in self._timings.items()}
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            with self._lock:
+                pending = list(self._pending.items())
+                if not pending:
+                    self._thread = None
+                    return
+            now = time.monotonic()
+            for camera_id, (camera_name, started, started_at, timings) in pending:
+                if _has_segment(camera_id, started_at):
+                    timings["first_segment_ms"] = round((now - started) * 1000, 1)
+                    logger.info(f"Câmera {camera_name} ({camera_id}) pronta: {timings}")
+                elif now - started > Config.FFMPEG_FIRST_SEGMENT_TIMEOUT:
+                    logger.warning(f"Câmera {camera_name} ({camera_id}) sem segmentos após "
+                                   f"{Config.FFMPEG_FIRST_SEGMENT_TIMEOUT}s: {timings}")
+                else:
+                    continue
+                with self._lock:
+                    if self._pending.get(camera_id, (None,) * 4)[3] is timings:
+                        del self._pending[camera_id]
+
+
+def _has_segment(camera_id, since):
+    # Segmentos antigos de uma execução anterior não contam
+    try:
+        with os.scandir(f"{Config.FFMPEG_LOCAL_OUTPUT_DIR}/{camera_id}") as entries:
+            return any(entry.name.endswith('.ts') and entry.stat().st_mtime >= since for entry in entries)
+    except FileNotFoundError:
+        return False
+
+
+segment_watcher = SegmentWatcher()
+
+
+class DockerBackend:
+    """Um contêiner ffmpeg_<id> por câmera, criado a partir da imagem FFMPEG_IMAGE."""
+
+    name = "docker"
+
+    def __init__(self):
+        self._client = None
+        self._image_lock = threading.Lock()
+        self._image_ready = False
+
+    @property
+    def client(self):
+        # Criado sob demanda: o backend de processos não depende do daemon do Docker
+        if self._client is None:
+            self._client = docker.from_env()
+        return self._client
+
+    def ensure_ready(self):
+        """Confirma uma única vez que a imagem do FFmpeg existe localmente.
+
+        Só o resultado positivo fica em cache: se a imagem ainda não foi
+        construída, a próxima câmera verifica de novo.
+        """
+        if self._image_ready:
+            return
+        with self._image_lock:
+            if not self._image_ready:
+                try:
+                    self.client.images.get(Config.FFMPEG_IMAGE)
+                except ImageNotFound:
+                    raise RuntimeError(f"Imagem Docker '{Config.FFMPEG_IMAGE}' não encontrada; construa-a com setup.sh.")
+                self._image_ready = True
+
+    def list(self):
+        """Contêineres ffmpeg_<id> existentes, em uma única chamada à API do Docker.
+
+        Contêineres de outras aplicações que só compartilham o prefixo são ignorados.
+        """
+        containers = {}
+        for summary in self.client.api.containers(all=True, filters={"name": CONTAINER_PREFIX}):
+            for name in summary.get("Names") or []:
+                match = CONTAINER_NAME_RE.match(name)
+                if match:
+                    containers[int(match.group(1))] = {
+                        "id": summary["Id"],
+                        "name": name.lstrip("/"),
+                        "state": summary.get("State"),
+                        "spec": (summary.get("Labels") or {}).get(SPEC_LABEL),
+                    }
+                    break
+        return containers
+
+    def start(self, camera_id, rtsp_url, profile, group=None):
+        container_name = f"{CONTAINER_PREFIX}{camera_id}"
+        output_dir = f"{Config.FFMPEG_HOST_OUTPUT_DIR}/{camera_id}"  # Diretório no host baseado no ID da câmera
+        container_output_dir = f"/output/{camera_id}"  # Diretório no container baseado no ID da câmera
+
+        # O Docker cria a origem do bind mount no host e o destino no contêiner, então
+        # não é preciso um contêiner auxiliar só para o mkdir
+        os.makedirs(output_dir, exist_ok=True)
+        volume_mapping = {
+            output_dir: {'bind': container_output_dir, 'mode': 'rw'}
+        }
+
+        started = time.monotonic()
+        container = self.client.containers.create(
+            Config.FFMPEG_IMAGE,
+            command=build_ffmpeg_command(rtsp_url, container_output_dir, profile),
+            name=container_name,
+            labels={"camanager.camera_id": str(camera_id), SPEC_LABEL: stream_spec(camera_id, rtsp_url, profile)},
+            detach=True,
+            volumes=volume_mapping,
+            user='root',
+            auto_remove=True
+        )
+        created = time.monotonic()
+        container.start()
+        running = time.monotonic()
+
+        return container.id, {
+            "create_ms": round((created - started) * 1000, 1),
+            "start_ms": round((running - created) * 1000, 1),
+        }
+
+    def cpu_usage(self, container_ids):
+        """Uso de CPU (% de um núcleo) de cada contêiner, consultado em paralelo."""
+        def sample(container_id):
+            try:
+                stats = self.client.api.stats(container_id, stream=False)
+            except (NotFound, APIError):
+                return None
+            cpu, precpu = stats.get("cpu_stats", {}), stats.get("precpu_stats", {})
+            cpu_delta = cpu.get("cpu_usage", {}).get("total_usage", 0) - precpu.get("cpu_usage", {}).get("total_usage", 0)
+            system_delta = cpu.get("system_cpu_usage", 0) - precpu.get("system_cpu_usage", 0)
+            if cpu_delta <= 0 or system_delta <= 0:
+                return 0.0
+            return round(cpu_delta / system_delta * cpu.get("online_cpus", 1) * 100, 1)
+
+        with ThreadPoolExecutor(max_workers=Config.FFMPEG_RECONCILE_WORKERS) as pool:
+            return dict(zip(container_ids, pool.map(sample, container_ids)))
+
+    def stop(self, container_id):
+        try:
+            container = self.client.containers.get(container_id)
+            if container.status == "removing":
+                # Se o contêiner já está sendo removido, apenas ignore
+                logger.info(f"Contêiner {container_id} já está em processo de remoção.")
+                return
+
+            container.stop()
+            container.remove()
+            logger.info(f"Contêiner {container_id} removido com sucesso.")
+        except NotFound:
+            logger.warning(f"Contêiner {container_id} não encontrado.")
+        except APIError as e:
+            logger.error(f"Erro ao tentar remover o contêiner {container_id}: {e}")
+
+
+class _ManagedProcess:
+    def __init__(self, camera_id, command, spec):
+        self.camera_id = camera_id
+        self.command = command
+        self.spec = spec
+        self.process = None
+        self.started = 0.0
+        self.restarts = 0
+        self.backoff = Config.FFMPEG_RESTART_BACKOFF
+        self.restart_at = None  # Próxima tentativa (monotônico) enquanto o processo está fora
+        self.stopping = False
+
+
+class ProcessBackend:
+    """Processos ffmpeg filhos desta aplicação, sem Docker.
+
+    Cada processo roda no próprio grupo (start_new_session), para que o stop
+    alcance também os filhos do ffmpeg. Uma thread supervisora reinicia
+    processos que terminam sozinhos, com backoff exponencial que volta ao
+    mínimo depois de FFMPEG_RESTART_STABLE segundos de execução. Prioridade
+    (nice) e limite de memória são aplicados a cada processo. O PID fica em
+    FFMPEG_PID_DIR para que processos de uma execução anterior que caiu sejam
+    encerrados antes de um novo start.
+    """
+
+    name = "process"
+    local = True  # Processos filhos deste processo: list() e cpu_usage() só enxergam os dele
+
+    def __init__(self, interval=0.5):
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._processes = {}  # camera_id -> _ManagedProcess
+        self._thread = None
+
+    def ensure_ready(self):
+        if shutil.which(Config.FFMPEG_BINARY) is None:
+            raise RuntimeError(f"Executável '{Config.FFMPEG_BINARY}' não encontrado no PATH.")
+
+    def list(self):
+        with self._lock:
+            return {
+                camera_id: {
+                    "id": f"{CONTAINER_PREFIX}{camera_id}",
+                    "name": f"{CONTAINER_PREFIX}{camera_id}",
+                    "state": "running" if managed.restart_at is None else "restarting",
+                    "spec": managed.spec,
+                    "pid": managed.process.pid if managed.process else None,
+                    "restarts": managed.restarts,
+                }
+                for camera_id, managed in self._processes.items()
+            }
+
+    def start(self, camera_id, rtsp_url, profile, group=None):
+        output_dir = f"{Config.FFMPEG_LOCAL_OUTPUT_DIR}/{camera_id}"
+        os.makedirs(output_dir, exist_ok=True)
+        self.stop(f"{CONTAINER_PREFIX}{camera_id}")
+        _kill_stale(camera_id)
+
+        managed = _ManagedProcess(
+            camera_id,
+            [Config.FFMPEG_BINARY, "-nostdin", "-loglevel", "error", *build_ffmpeg_command(rtsp_url, output_dir, profile)],
+            stream_spec(camera_id, rtsp_url, profile)
+        )
+        started = time.monotonic()
+        self._spawn(managed)
+        spawned = time.monotonic()
+        with self._lock:
+            self._processes[camera_id] = managed
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._supervise, name="ffmpeg-supervisor", daemon=True)
+                self._thread.start()
+
+        return f"{CONTAINER_PREFIX}{camera_id}", {
+            "create_ms": round((spawned - started) * 1000, 1),
+            "start_ms": 0.0,
+        }
+
+    def cpu_usage(self, worker_ids, window=0.5):
+        """Uso de CPU (% de um núcleo) de cada processo, por duas leituras de /proc."""
+        with self._lock:
+            pids = {}
+            for worker_id in worker_ids:
+                match = CONTAINER_NAME_RE.match(worker_id or "")
+                managed = self._processes.get(int(match.group(1))) if match else None
+                if managed and managed.process and managed.restart_at is None:
+                    pids[worker_id] = managed.process.pid
+        before = {worker_id: _cpu_seconds(pid) for worker_id, pid in pids.items()}
+        time.sleep(window)
+        usage = {worker_id: None for worker_id in worker_ids}
+        for worker_id, pid in pids.items():
+            after = _cpu_seconds(pid)
+            if before[worker_id] is not None and after is not None:
+                usage[worker_id] = round((after - before[worker_id]) / window * 100, 1)
+        return usage
+
+    def stop(self, worker_id):
+        match = CONTAINER_NAME_RE.match(worker_id or "")
+        if not match:
+            logger.warning(f"Identificador de processo FFmpeg inválido: {worker_id}")
+            return
+        with self._lock:
+            managed = self._processes.pop(int(match.group(1)), None)
+        if managed is None:
+            return
+        managed.stopping = True
+        if managed.process and managed.process.poll() is None:
+            _terminate_group(managed.process)
+        _remove_pidfile(managed.camera_id)
+        logger.info(f"Processo FFmpeg da câmera {managed.camera_id} encerrado.")
+
+    def _spawn(self, managed):
+        process = subprocess.Popen(
+            managed.command,
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            start_new_session=True
+        )
+        _apply_limits(process.pid)
+        _write_pidfile(managed.camera_id, process.pid)
+        managed.process = process
+        managed.started = time.monotonic()
+        managed.restart_at = None
+
+    def _supervise(self):
+        while True:
+            time.sleep(self.interval)
+            with self._lock:
+                processes = list(self._processes.values())
+                if not processes:
+                    self._thread = None
+                    return
+            now = time.monotonic()
+            for managed in processes:
+                if managed.stopping:
+                    continue
+                if managed.restart_at is None:
+                    code = managed.process.poll()
+                    if code is None:
+                        continue
+                    if now - managed.started >= Config.FFMPEG_RESTART_STABLE:
+                        managed.backoff = Config.FFMPEG_RESTART_BACKOFF
+                    managed.restart_at = now + managed.backoff
+                    logger.warning(f"FFmpeg da câmera {managed.camera_id} terminou (código {code}); "
+                                   f"reiniciando em {managed.backoff:g}s.")
+                    managed.backoff = min(managed.backoff * 2, Config.FFMPEG_RESTART_BACKOFF_MAX)
+                elif now >= managed.restart_at:
+                    try:
+                        self._spawn(managed)
+                        managed.restarts += 1
+                        if managed.stopping:
+                            # stop() chegou durante o restart
+                            _terminate_group(managed.process)
+                    except OSError as e:
+                        managed.restart_at = now + managed.backoff
+                        logger.error(f"Erro ao reiniciar FFmpeg da câmera {managed.camera_id}: {e}")
+
+
+def _apply_limits(pid):
+    # Aplicado logo após o spawn (prlimit/setpriority) em vez de preexec_fn, que não é seguro com threads
+    try:
+        if Config.FFMPEG_PROCESS_NICE:
+            os.setpriority(os.PRIO_PROCESS, pid, Config.FFMPEG_PROCESS_NICE)
+        if Config.FFMPEG_PROCESS_MEMORY_MB:
+            limit = Config.FFMPEG_PROCESS_MEMORY_MB * 1024 * 1024
+            resource.prlimit(pid, resource.RLIMIT_AS, (limit, limit))
+    except (OSError, ValueError) as e:
+        logger.warning(f"Não foi possível aplicar limites ao processo {pid}: {e}")
+
+
+def _cpu_seconds(pid):
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+    except (FileNotFoundError, ProcessLookupError):
+        return None
+    # utime e stime são os campos 14 e 15 de /proc/<pid>/stat (12 e 13 após o nome)
+    return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+
+def _terminate_group(process, timeout=5):
+    try:
+        os.killpg(process.pid, signal.SIGTERM)
+        process.wait(timeout=timeout)
+    except subprocess.TimeoutExpired:
+        os.killpg(process.pid, signal.SIGKILL)
+        process.wait()
+    except ProcessLookupError:
+        pass
+
+
+def _pidfile(key):
+    return os.path.join(Config.FFMPEG_PID_DIR, f"{key}.pid")
+
+
+def _write_pidfile(key, pid):
+    os.makedirs(Config.FFMPEG_PID_DIR, exist_ok=True)
+    with open(_pidfile(key), 'w') as f:
+        f.write(str(pid))
+
+
+def _remove_pidfile(key):
+    try:
+        os.remove(_pidfile(key))
+    except FileNotFoundError:
+        pass
+
+
+def _kill_stale(key):
+    # Processo deixado por uma execução anterior que terminou sem encerrar os filhos
     try:
-        container = client.containers.get(container_id)
-        if container.status == "removing":
-            # Se o contêiner já está sendo removido, apenas ignore
-            print(f"Contêiner {container_id} já está em processo de remoção.")
+        with open(_pidfile(key)) as f:
+            pid = int(f.read().strip())
+        with open(f"/proc/{pid}/cmdline", 'rb') as f:
+            cmdline = f.read()
+    except (FileNotFoundError, ValueError):
+        return
+    if os.path.basename(Config.FFMPEG_BINARY).encode('utf-8') in cmdline:
+        try:
+            os.killpg(pid, signal.SIGKILL)
+            logger.info(f"Processo FFmpeg antigo '{key}' (PID {pid}) encerrado.")
+        except ProcessLookupError:
+            pass
+    _remove_pidfile(key)
+
+
+class _CameraGroup:
+    def __init__(self, key):
+        self.key = key
+        self.cameras = {}  # camera_id -> (rtsp_url, profile, spec)
+        self.process = None
+        self.log_path = None
+        self.started = 0.0
+        self.started_wall = 0.0  # Início no relógio, comparado ao mtime dos segmentos
+        self.backoff = Config.FFMPEG_RESTART_BACKOFF
+        self.restart_at = None  # Próxima tentativa depois de uma queda
+        self.rebuild_at = None  # Reconstrução pendente após mudança no conjunto de câmeras
+
+
+class MultiplexedBackend:
+    """Um processo ffmpeg por agrupamento, com uma entrada e uma saída HLS por câmera.
+
+    Decoder, demuxers e o próprio processo são compartilhados, o que reduz a
+    memória por câmera em hosts densos (principalmente em passthrough). Uma
+    única thread supervisiona os grupos: mudanças no conjunto de câmeras são
+    agrupadas (FFMPEG_MUX_DEBOUNCE) antes de reconstruir o comando, processos
+    que caem são reiniciados com backoff e a saúde de cada câmera é medida
+    pela idade do seu segmento mais recente. Como uma entrada que falha
+    derruba ou trava o processo inteiro, a câmera que falha
+    FFMPEG_MUX_QUARANTINE_FAILURES vezes seguidas vai para um processo
+    próprio e deixa de afetar o resto do agrupamento.
+    """
+
+    name = "multiplexed"
+    local = True  # Processos filhos deste processo: list() e cpu_usage() só enxergam os dele
+    self_healing = True  # Reinicia grupos e isola câmeras travadas por conta própria
+
+    def __init__(self, interval=0.5):
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._process_lock = threading.RLock()  # Serializa spawns e encerramentos
+        self._groups = {}  # chave -> _CameraGroup
+        self._group_of = {}  # camera_id -> chave
+        self._health = {}  # camera_id -> {"state", "last_segment_at", "failures"}
+        self._quarantined = set()
+        self._thread = None
+        self._stale_checked = False
+
+    def ensure_ready(self):
+        if shutil.which(Config.FFMPEG_BINARY) is None:
+            raise RuntimeError(f"Executável '{Config.FFMPEG_BINARY}' não encontrado no PATH.")
+
+    def list(self):
+        now = time.time()
+        with self._lock:
+            workers = {}
+            for camera_id, key in self._group_of.items():
+                group = self._groups[key]
+                health = self._health[camera_id]
+                workers[camera_id] = {
+                    "id": f"{CONTAINER_PREFIX}{camera_id}",
+                    "name": f"{CONTAINER_PREFIX}{camera_id}",
+                    "state": "running" if group.process and group.restart_at is None else "restarting",
+                    "spec": group.cameras[camera_id][2],
+                    "group": key,
+                    "pid": group.process.pid if group.process else None,
+                    "health": health["state"],
+                    "last_segment_age": round(now - health["last_segment_at"], 1) if health["last_segment_at"] else None,
+                    "failures": health["failures"],
+                }
+            return workers
+
+    def start(self, camera_id, rtsp_url, profile, group=None):
+        os.makedirs(f"{Config.FFMPEG_LOCAL_OUTPUT_DIR}/{camera_id}", exist_ok=True)
+        spec = stream_spec(camera_id, rtsp_url, profile)
+        with self._lock:
+            self._detach(camera_id)
+            key = self._choose_group(camera_id, group)
+            self._groups.setdefault(key, _CameraGroup(key)).cameras[camera_id] = (rtsp_url, profile, spec)
+            self._group_of[camera_id] = key
+            self._health[camera_id] = {"state": "starting", "last_segment_at": None, "failures": 0}
+            self._schedule_rebuild(self._groups[key])
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._supervise, name="ffmpeg-mux-supervisor", daemon=True)
+                self._thread.start()
+        # O processo é (re)criado pelo supervisor; o primeiro segmento mede o start real
+        return f"{CONTAINER_PREFIX}{camera_id}", {"create_ms": None, "start_ms": None}
+
+    def stop(self, worker_id):
+        match = CONTAINER_NAME_RE.match(worker_id or "")
+        if not match:
+            logger.warning(f"Identificador de worker FFmpeg inválido: {worker_id}")
             return
-        
-        container.stop()
-        container.remove()
-        print(f"Contêiner {container_id} removido com sucesso.")
-    except NotFound:
-        print(f"Contêiner {container_id} não encontrado.")
-    except APIError as e:
-        print(f"Erro ao tentar remover o contêiner {container_id}: {e}")
+        camera_id = int(match.group(1))
+        with self._lock:
+            emptied = self._detach(camera_id)
+            self._health.pop(camera_id, None)
+            self._quarantined.discard(camera_id)
+        if emptied:
+            # Último stream do grupo: encerra já, sem esperar o supervisor
+            self._terminate(emptied)
+
+    def cpu_usage(self, worker_ids, window=0.5):
+        """Uso de CPU do processo do grupo, dividido igualmente entre as câmeras dele."""
+        with self._lock:
+            groups = {}
+            for worker_id in worker_ids:
+                match = CONTAINER_NAME_RE.match(worker_id or "")
+                key = self._group_of.get(int(match.group(1))) if match else None
+                group = self._groups.get(key)
+                if group and group.process and group.process.poll() is None:
+                    groups.setdefault(key, (group.process.pid, len(group.cameras), []))[2].append(worker_id)
+        before = {key: _cpu_seconds(pid) for key, (pid, _, _) in groups.items()}
+        time.sleep(window)
+        usage = {worker_id: None for worker_id in worker_ids}
+        for key, (pid, size, members) in groups.items():
+            after = _cpu_seconds(pid)
+            if before[key] is not None and after is not None:
+                for worker_id in members:
+                    usage[worker_id] = round((after - before[key]) / window * 100 / size, 1)
+        return usage
+
+    def _choose_group(self, camera_id, group):
+        if camera_id in self._quarantined:
+            return f"solo_{camera_id}"
+        base = "group_" + re.sub(r'[^a-zA-Z0-9_.-]', '_', group or "sem_agrupamento")
+        index = 0
+        while True:
+            key = base if index == 0 else f"{base}.{index}"
+            existing = self._groups.get(key)
+            if existing is None or len(existing.cameras) < Config.FFMPEG_MUX_MAX_CAMERAS:
+                return key
+            index += 1
+
+    def _detach(self, camera_id):
+        # Tira a câmera do grupo atual; retorna o grupo se ele ficou vazio
+        key = self._group_of.pop(camera_id, None)
+        group = self._groups.get(key)
+        if group is None:
+            return None
+        group.cameras.pop(camera_id, None)
+        if group.cameras:
+            self._schedule_rebuild(group)
+            return None
+        del self._groups[key]
+        return group
+
+    def _schedule_rebuild(self, group):
+        if group.rebuild_at is None:
+            group.rebuild_at = time.monotonic() + Config.FFMPEG_MUX_DEBOUNCE
+
+    def _supervise(self):
+        while True:
+            time.sleep(self.interval)
+            with self._lock:
+                if not self._groups:
+                    self._thread = None
+                    return
+                groups = list(self._groups.values())
+            now = time.monotonic()
+            for group in groups:
+                if group.rebuild_at is not None and now >= group.rebuild_at:
+                    self._respawn(group)
+                elif group.restart_at is not None:
+                    if now >= group.restart_at:
+                        self._respawn(group)
+                elif group.process is not None:
+                    code = group.process.poll()
+                    if code is not None:
+                        self._on_exit(group, code, now)
+                    else:
+                        self._check_health(group, now)
+
+    def _respawn(self, group):
+        with self._process_lock:
+            with self._lock:
+                if self._groups.get(group.key) is not group:
+                    return
+                group.rebuild_at = None
+                cameras = sorted(group.cameras.items())
+            self._terminate(group, remove_pidfile=False)
+            if not self._stale_checked:
+                # Antes do primeiro spawn desta execução, todo PID de grupo gravado é de uma execução anterior
+                self._kill_stale_groups()
+            command = _multiplexed_command(cameras)
+
+            os.makedirs(Config.FFMPEG_PID_DIR, exist_ok=True)
+            group.log_path = os.path.join(Config.FFMPEG_PID_DIR, f"{group.key}.log")
+            try:
+                with open(group.log_path, 'wb') as log:
+                    group.process = subprocess.Popen(
+                        command, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=log,
+                        start_new_session=True
+                    )
+            except OSError as e:
+                group.process = None
+                group.restart_at = time.monotonic() + group.backoff
+                logger.error(f"Erro ao iniciar o FFmpeg multiplexado '{group.key}': {e}")
+                return
+            _apply_limits(group.process.pid)
+            _write_pidfile(group.key, group.process.pid)
+            group.started = time.monotonic()
+            group.started_wall = time.time()
+            group.restart_at = None
+            logger.info(f"FFmpeg multiplexado '{group.key}' iniciado com {len(cameras)} câmera(s).")
+
+    def _terminate(self, group, remove_pidfile=True):
+        with self._process_lock:
+            if group.process and group.process.poll() is None:
+                _terminate_group(group.process)
+            group.process = None
+            if remove_pidfile:
+                _remove_pidfile(group.key)
+
+    def _kill_stale_groups(self):
+        self._stale_checked = True
+        try:
+            names = os.listdir(Config.FFMPEG_PID_DIR)
+        except FileNotFoundError:
+            return
+        for name in names:
+            key = name[:-len(".pid")]
+            if name.endswith(".pid") and key.startswith(("group_", "solo_")):
+                _kill_stale(key)
+
+    def _on_exit(self, group, code, now):
+        failed = self._culprits(group)
+        with self._lock:
+            if now - group.started >= Config.FFMPEG_RESTART_STABLE:
+                group.backoff = Config.FFMPEG_RESTART_BACKOFF
+            for camera_id in failed:
+                health = self._health.get(camera_id)
+                if health:
+                    health["failures"] += 1
+                    health["state"] = "failing"
+            isolated = self._isolate(group, failed)
+            if self._groups.get(group.key) is group:
+                group.restart_at = now + group.backoff
+                group.backoff = min(group.backoff * 2, Config.FFMPEG_RESTART_BACKOFF_MAX)
+        logger.warning(f"FFmpeg multiplexado '{group.key}' terminou (código {code}); câmeras com falha: "
+                       f"{sorted(failed) or 'desconhecidas'}; isoladas: {sorted(isolated) or 'nenhuma'}.")
+
+    def _culprits(self, group):
+        """Câmeras responsáveis pela queda: as citadas no log de erro do FFmpeg,
+        ou, sem essa pista, as que não gravaram segmento nesta execução."""
+        try:
+            with open(group.log_path, 'rb') as f:
+                log = f.read()[-65536:].decode('utf-8', 'replace')
+        except (OSError, TypeError):
+            log = ""
+        with self._lock:
+            cameras = dict(group.cameras)
+            health = {camera_id: dict(self._health.get(camera_id, {})) for camera_id in cameras}
+        named = {camera_id for camera_id, (rtsp_url, _, _) in cameras.items() if rtsp_url in log}
+        if named:
+            return named
+        return {camera_id for camera_id in cameras if (health[camera_id].get("last_segment_at") or 0) < group.started_wall}
+
+    def _check_health(self, group, now):
+        wall = time.time()
+        segment_time, _ = hls_window(Config.HLS_LOW_LATENCY)
+        stall_after = max(Config.FFMPEG_MUX_STALL_TIMEOUT, segment_time * 5)
+        stalled = set()
+        with self._lock:
+            for camera_id in group.cameras:
+                health = self._health[camera_id]
+                latest = _latest_segment_at(camera_id)
+                if latest and latest >= group.started_wall:
+                    health["last_segment_at"] = latest
+                reference = max(health["last_segment_at"] or 0, group.started_wall)
+                if wall - reference <= stall_after:
+                    if health["last_segment_at"] and health["last_segment_at"] >= group.started_wall:
+                        health["state"] = "healthy"
+                        health["failures"] = 0
+                else:
+                    health["state"] = "stalled"
+                    health["failures"] += 1
+                    stalled.add(camera_id)
+            if not stalled:
+                return
+            isolated = self._isolate(group, stalled)
+        if isolated:
+            logger.warning(f"Câmeras {sorted(isolated)} sem segmentos novos isoladas do grupo '{group.key}'.")
+        else:
+            # Grupo de uma câmera só (ou sem falhas suficientes para isolar): reinicia o processo
+            logger.warning(f"Câmeras {sorted(stalled)} sem segmentos novos; reiniciando '{group.key}'.")
+            self._terminate(group, remove_pidfile=False)
+            with self._lock:
+                group.restart_at = now + group.backoff
+                group.backoff = min(group.backoff * 2, Config.FFMPEG_RESTART_BACKOFF_MAX)
+
+    def _isolate(self, group, failed):
+        # Chamado com self._lock: move para um processo próprio as câmeras que falham repetidamente
+        if len(group.cameras) <= 1:
+            return set()
+        isolated = {
+            camera_id for camera_id in failed
+            if camera_id in group.cameras and self._health[camera_id]["failures"] >= Config.FFMPEG_MUX_QUARANTINE_FAILURES
+        }
+        for camera_id in isolated:
+            rtsp_url, profile, spec = group.cameras.pop(camera_id)
+            self._quarantined.add(camera_id)
+            solo = self._groups.setdefault(f"solo_{camera_id}", _CameraGroup(f"solo_{camera_id}"))
+            solo.cameras[camera_id] = (rtsp_url, profile, spec)
+            self._group_of[camera_id] = solo.key
+            self._schedule_rebuild(solo)
+        if isolated:
+            self._schedule_rebuild(group)
+        return isolated
+
+
+def _multiplexed_command(cameras):
+    """Comando FFmpeg de um grupo: [(camera_id, (rtsp_url, perfil, spec)), ...] em ordem de entrada."""
+    command = [Config.FFMPEG_BINARY, "-nostdin", "-loglevel", "error"]
+    for _, (rtsp_url, profile, _) in cameras:
+        command += ["-rtsp_transport", "tcp", *ffmpeg_input_args(profile), "-i", rtsp_url]
+    for index, (camera_id, (_, profile, _)) in enumerate(cameras):
+        command += ffmpeg_output_args(profile, f"{Config.FFMPEG_LOCAL_OUTPUT_DIR}/{camera_id}", input_index=index)
+    return command
+
+
+def _latest_segment_at(camera_id):
+    # Horário (relógio) do segmento mais recente da câmera, ou None
+    latest = None
+    try:
+        with os.scandir(f"{Config.FFMPEG_LOCAL_OUTPUT_DIR}/{camera_id}") as entries:
+            for entry in entries:
+                if entry.name.endswith('.ts'):
+                    mtime = entry.stat().st_mtime
+                    latest = mtime if latest is None or mtime > latest else latest
+    except FileNotFoundError:
+        pass
+    return latest
+
+
+BACKENDS = {
+    DockerBackend.name: DockerBackend,
+    ProcessBackend.name: ProcessBackend,
+    MultiplexedBackend.name: MultiplexedBackend,
+}
+
+backend = BACKENDS[Config.STREAM_BACKEND]()
+
+
+def ensure_backend():
+    backend.ensure_ready()
+
+
+def list_streams():
+    """Workers existentes por câmera: {camera_id: {"id", "name", "state", "spec"}}."""
+    return backend.list()
+
+
+def start_stream(camera_id, camera_name, rtsp_url, profile=None, group=None):
+    """Inicia o worker FFmpeg da câmera no backend configurado e retorna o seu identificador.
+
+    profile é o perfil efetivo de stream_profiles.profile_for(camera); sem ele
+    a câmera é reencodada com as opções padrão de x264. group (o agrupamento
+    da câmera) só é usado pelo backend multiplexado.
+    """
+    if profile is None:
+        profile = resolve_profile(None, None)
+    ensure_backend()
+    started = time.monotonic()
+    started_at = time.time()
+    worker_id, timings = backend.start(camera_id, rtsp_url, profile, group=group)
+    segment_watcher.watch(camera_id, camera_name, started, started_at, {**timings, "first_segment_ms": None})
+    return worker_id
+
+
+def stop_stream(worker_id):
+    backend.stop(worker_id)
+
+
+def cpu_usage(worker_ids):
+    """{worker_id: % de CPU de um núcleo, ou None se o worker não está rodando}."""
+    return backend.cpu_usage(list(worker_ids))
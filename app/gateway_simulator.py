@@ -0,0 +1,68 @@
+import argparse
+import json
+import random
+import time
+
+import paho.mqtt.client as mqtt
+
+
+def gateway_mac(index):
+    return f"ac233f{index:06x}"
+
+
+def beacon_mac(index):
+    return f"c30000{index:06x}"
+
+
+def build_status(gateway_index, beacons):
+    # Mesmo formato das mensagens /gw/<mac>/status dos gateways reais
+    status = [{"type": "Gateway", "mac": gateway_mac(gateway_index), "timestamp": time.time()}]
+    for beacon in beacons:
+        status.append({
+            "type": "iBeacon",
+            "mac": beacon_mac(beacon),
+            "rssi": random.randint(-90, -40),
+            "timestamp": time.time()
+        })
+    return json.dumps(status)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Publica mensagens sintéticas de gateways para testes de carga do ingest")
+    parser.add_argument('--broker', default='localhost')
+    parser.add_argument('--port', type=int, default=1883)
+    parser.add_argument('--gateways', type=int, default=10)
+    parser.add_argument('--beacons', type=int, default=200, help="Beacons cadastrados (distribuídos entre os gateways)")
+    parser.add_argument('--per-message', type=int, default=50, help="Beacons por mensagem de status")
+    parser.add_argument('--interval', type=float, default=1.0, help="Segundos entre mensagens de cada gateway")
+    parser.add_argument('--duration', type=float, default=60.0)
+    parser.add_argument('--disjoint', action='store_true',
+                        help="Cada beacon é visto por um único gateway (beacon %% gateways), para conferir a presença resultante")
+    args = parser.parse_args()
+
+    client = mqtt.Client()
+    client.connect(args.broker, args.port)
+    client.loop_start()
+
+    sent = 0
+    started = time.monotonic()
+    while time.monotonic() - started < args.duration:
+        cycle = time.monotonic()
+        for gateway in range(args.gateways):
+            if args.disjoint:
+                beacons = list(range(gateway, args.beacons, args.gateways))[:args.per_message]
+            else:
+                beacons = random.sample(range(args.beacons), min(args.per_message, args.beacons))
+            client.publish(f"/gw/{gateway_mac(gateway)}/status", build_status(gateway, beacons))
+            sent += 1
+        time.sleep(max(0.0, args.interval - (time.monotonic() - cycle)))
+
+    elapsed = time.monotonic() - started
+    client.loop_stop()
+    client.disconnect()
+    print(f"{sent} mensagens ({sent * args.per_message} avistamentos) em {elapsed:.1f}s: "
+          f"{sent / elapsed:.1f} msg/s")
+
+
+if __name__ == '__main__':
+    main()
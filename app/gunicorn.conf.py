@@ -0,0 +1,63 @@
+import os
+import subprocess
+import sys
+import threading
+
+# Configuração de produção: gunicorn -c gunicorn.conf.py
+# O master aplica as migrações e mantém um único processo de serviços
+# (services.py: ingest MQTT, manutenção do banco e streams); os workers só
+# atendem requisições (wsgi.py).
+
+SERVICES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'services.py')
+
+wsgi_app = 'wsgi:app'
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:5000')
+workers = int(os.getenv('WEB_CONCURRENCY', 2))
+# Threads por worker: GUNICORN_THREADS para requisições comuns (inclusive as ativações sob demanda, que
+# seguram a thread até STREAM_ACTIVATION_TIMEOUT) mais SSE_MAX_CLIENTS reservadas para /api/maps/<id>/events,
+# cujo cliente segura uma thread enquanto o mapa está aberto. A implantação comporta
+# WEB_CONCURRENCY x SSE_MAX_CLIENTS mapas ao vivo (2 x 32 = 64 por padrão); acima disso o cliente recebe
+# só o estado atual e o EventSource tenta de novo depois, sem tomar as threads das requisições comuns.
+worker_class = 'gthread'
+threads = int(os.getenv('GUNICORN_THREADS', 8)) + int(os.getenv('SSE_MAX_CLIENTS', 32))  # Mesmo padrão de Config.SSE_MAX_CLIENTS
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 60))
+graceful_timeout = int(os.getenv('GUNICORN_GRACEFUL_TIMEOUT', 30))
+keepalive = 5
+accesslog = '-'
+errorlog = '-'
+
+RESTART_DELAY = 5  # Segundos antes de subir de novo um processo de serviços que caiu
+
+_services = None
+_stopping = threading.Event()
+
+
+def on_starting(server):
+    # Migrações uma vez, antes de qualquer worker abrir o banco
+    subprocess.run([sys.executable, SERVICES, 'migrate'], check=True)
+
+
+def when_ready(server):
+    threading.Thread(target=_supervise, args=(server,), name="services-supervisor", daemon=True).start()
+
+
+def _supervise(server):
+    global _services
+    while not _stopping.is_set():
+        _services = subprocess.Popen([sys.executable, SERVICES])
+        code = _services.wait()
+        if _stopping.is_set():
+            return
+        server.log.error(f"Processo de serviços saiu com código {code}; reiniciando em {RESTART_DELAY}s.")
+        _stopping.wait(RESTART_DELAY)
+
+
+def on_exit(server):
+    _stopping.set()
+    if _services is None or _services.poll() is not None:
+        return
+    _services.terminate()
+    try:
+        _services.wait(timeout=graceful_timeout)
+    except subprocess.TimeoutExpired:
+        _services.kill()
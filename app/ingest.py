@@ -0,0 +1,200 @@
+import json
+import logging
+import queue
+import threading
+import time
+from datetime import datetime
+
+from mac_index import mac_index, normalize_mac
+from location_writer import location_writer
+from presence import GatewayPeopleManager
+from presence_sync import partition_of
+from status_board import status_board
+
+logger = logging.getLogger(__name__)
+
+STAGES = ("queue", "decode", "resolve")
+
+
+def gateway_mac_from_topic(topic):
+    # Tópico no formato /gw/<mac>/status
+    return normalize_mac(topic.split('/')[2])
+
+
+def handle_gateway_message(gateway_mac, payload, received_at, timings=None):
+    """Decodifica uma mensagem de status do gateway e atualiza presença e logs."""
+    started = time.monotonic()
+    entries = json.loads(payload.decode('utf-8'))
+    decoded = time.monotonic()
+
+    logger.debug(f"Mensagem recebida do gateway {gateway_mac}: {entries}")
+
+    # Resolve o gateway uma única vez por mensagem, direto do índice em memória
+    gateway = mac_index.gateway_by_mac(gateway_mac)
+    seen_at = datetime.utcfromtimestamp(received_at)
+
+    people = []
+    for entry in entries:
+        if entry.get("type") == "iBeacon":
+            person = mac_index.person_by_mac(entry.get("mac"))
+            if person:
+                people.append(person)
+
+                # Registra movimentação (gravada em lote pelo location_writer)
+                if gateway:
+                    location_writer.record(person['id'], gateway['id'], seen_at)
+
+    # Atualiza a presença do gateway de uma só vez (pessoas inativas expiram no scheduler)
+    GatewayPeopleManager().add_people_to_gateway(gateway_mac, people, received_at)
+
+    if timings is not None:
+        timings["decode"].add(decoded - started)
+        timings["resolve"].add(time.monotonic() - decoded)
+
+
+class _StageStats:
+    __slots__ = ("count", "total", "max")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds):
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+
+class _Worker:
+    def __init__(self, index, queue_size):
+        self.index = index
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.timings = {stage: _StageStats() for stage in STAGES}
+        self.processed = 0
+        self.errors = 0
+        self.dropped = 0
+        self.thread = None
+
+
+class IngestPipeline:
+    """Pipeline de ingest MQTT em estágios.
+
+    O callback do paho só enfileira o payload bruto, sem decodificar nem
+    acessar o banco, para nunca travar o loop de rede. Um pool de workers
+    decodifica e resolve as mensagens, e o location_writer grava em lote.
+
+    Cada gateway é sempre atendido pelo mesmo worker (partição pelo MAC), o
+    que preserva a ordem das mensagens dele. As filas são limitadas: com a
+    fila cheia a mensagem nova é descartada e contada, já que o QoS 0 não
+    permite segurar o broker e a próxima mensagem do gateway substitui a
+    perdida.
+    """
+
+    def __init__(self):
+        self.workers = []
+        self.queue_size = 10000
+        self.worker_count = 4
+        self.partition = None  # (índice, total) quando o ingest roda particionado entre processos
+        self._stopping = threading.Event()
+
+    def init_app(self, app):
+        self.worker_count = max(1, app.config['INGEST_WORKERS'])
+        self.queue_size = app.config['INGEST_QUEUE_SIZE']
+
+    def start(self):
+        per_worker = max(1, self.queue_size // self.worker_count)
+        self.workers = [_Worker(index, per_worker) for index in range(self.worker_count)]
+        for worker in self.workers:
+            worker.thread = threading.Thread(
+                target=self._run, args=(worker,), name=f"ingest-worker-{worker.index}", daemon=True
+            )
+            worker.thread.start()
+        logger.info(f"Pipeline de ingest iniciado com {self.worker_count} workers.")
+
+    def stop(self, timeout=5):
+        self._stopping.set()
+        for worker in self.workers:
+            worker.thread.join(timeout=timeout)
+
+    def submit(self, topic, payload):
+        """Enfileira uma mensagem bruta. Chamado pela thread de rede do MQTT."""
+        try:
+            gateway_mac = gateway_mac_from_topic(topic)
+        except IndexError:
+            logger.warning(f"Tópico MQTT inesperado: {topic}")
+            return False
+        if self.partition and partition_of(gateway_mac, self.partition[1]) != self.partition[0]:
+            # Gateway atendido por outro processo de ingest
+            return False
+        worker = self.workers[hash(gateway_mac) % len(self.workers)]
+        try:
+            worker.queue.put_nowait((gateway_mac, payload, time.time(), time.monotonic()))
+            return True
+        except queue.Full:
+            worker.dropped += 1
+            return False
+
+    def _run(self, worker):
+        while not self._stopping.is_set():
+            try:
+                gateway_mac, payload, received_at, enqueued = worker.queue.get(timeout=1)
+            except queue.Empty:
+                continue
+            worker.timings["queue"].add(time.monotonic() - enqueued)
+            try:
+                handle_gateway_message(gateway_mac, payload, received_at, worker.timings)
+                worker.processed += 1
+            except Exception as e:
+                worker.errors += 1
+                logger.error(f"Erro ao processar mensagem MQTT: {e}")
+
+    def stats(self):
+        stages = {}
+        for stage in STAGES:
+            count = sum(w.timings[stage].count for w in self.workers)
+            total = sum(w.timings[stage].total for w in self.workers)
+            stages[stage] = {
+                "count": count,
+                "avg_ms": round(total / count * 1000, 3) if count else 0.0,
+                "max_ms": round(max((w.timings[stage].max for w in self.workers), default=0.0) * 1000, 3)
+            }
+        return {
+            "workers": len(self.workers),
+            "queue_depth": sum(w.queue.qsize() for w in self.workers),
+            "queue_capacity": sum(w.queue.maxsize for w in self.workers),
+            "processed": sum(w.processed for w in self.workers),
+            "dropped": sum(w.dropped for w in self.workers),
+            "errors": sum(w.errors for w in self.workers),
+            "stages": stages,
+            "writer": location_writer.stats()
+        }
+
+    def publish_status(self):
+        # Os workers da API não rodam o pipeline: leem estas estatísticas em /api/ingest/stats
+        status_board.publish(f"ingest-{self.partition[0] if self.partition else 0}", self.stats())
+
+
+def merge_stats(snapshots):
+    """Soma as estatísticas publicadas por vários pipelines ({nome: stats()}), um por processo de ingest."""
+    snapshots = list(snapshots.values())
+    merged = {key: sum(s[key] for s in snapshots)
+              for key in ("workers", "queue_depth", "queue_capacity", "processed", "dropped", "errors")}
+    merged["stages"] = {}
+    for stage in STAGES:
+        count = sum(s["stages"][stage]["count"] for s in snapshots)
+        total_ms = sum(s["stages"][stage]["avg_ms"] * s["stages"][stage]["count"] for s in snapshots)
+        merged["stages"][stage] = {
+            "count": count,
+            "avg_ms": round(total_ms / count, 3) if count else 0.0,
+            "max_ms": max((s["stages"][stage]["max_ms"] for s in snapshots), default=0.0)
+        }
+    writers = [s["writer"] for s in snapshots]
+    merged["writer"] = {key: sum(w[key] for w in writers) for key in ("pending", "open_logs", "batches", "rows")}
+    merged["writer"]["max_flush_ms"] = max((w["max_flush_ms"] for w in writers), default=0.0)
+    merged["processes"] = len(snapshots)
+    return merged
+
+
+ingest = IngestPipeline()
@@ -0,0 +1,116 @@
+import argparse
+import multiprocessing
+import os
+import tempfile
+import time
+
+from gateway_simulator import beacon_mac, build_status, gateway_mac
+
+
+def _create_app(database_uri):
+    from flask import Flask
+    from config import Config
+    from database import init_db
+
+    app = Flask(__name__)
+    app.config.from_object(Config)
+    app.config['SQLALCHEMY_DATABASE_URI'] = database_uri
+    init_db(app)
+    return app
+
+
+def prepare_database(database_uri, gateways, beacons):
+    from models import db, Gateway, Person
+
+    app = _create_app(database_uri)
+    with app.app_context():
+        db.create_all()
+        db.session.add_all([Gateway(name=f"gw-{index}", mac=gateway_mac(index)) for index in range(gateways)])
+        db.session.add_all([Person(name=f"pessoa-{index}", ibeacon_mac=beacon_mac(index)) for index in range(beacons)])
+        db.session.commit()
+
+
+def run_partition(database_uri, partition, partitions, args, results):
+    """Um processo de ingest com as mensagens que o broker entregaria à sua partição."""
+    import random
+    from ingest import ingest
+    from location_writer import location_writer
+    from mac_index import mac_index
+    from presence import BUFFER_TIME
+    from presence_sync import partition_of
+
+    app = _create_app(database_uri)
+    location_writer.init_app(app, buffer_time=BUFFER_TIME)
+    ingest.init_app(app)
+    ingest.partition = (partition, partitions)
+    with app.app_context():
+        mac_index.load()
+
+    # Mensagens geradas antes da medição: só o ingest entra no tempo
+    owned = [index for index in range(args.gateways) if partition_of(gateway_mac(index), partitions) == partition]
+    messages = []
+    for _ in range(args.messages // args.gateways):
+        for index in owned:
+            beacons = random.sample(range(args.beacons), min(args.per_message, args.beacons))
+            messages.append((f"/gw/{gateway_mac(index)}/status", build_status(index, beacons).encode()))
+
+    location_writer.start()
+    ingest.start()
+    started = time.monotonic()
+    for topic, payload in messages:
+        while not ingest.submit(topic, payload):
+            time.sleep(0.001)  # Fila cheia: segura o "broker" em vez de descartar
+    while ingest.stats()["processed"] + ingest.stats()["errors"] < len(messages):
+        time.sleep(0.01)
+    elapsed = time.monotonic() - started
+    location_writer.stop()
+    stats = ingest.stats()
+    results.put({
+        "partition": partition,
+        "gateways": len(owned),
+        "messages": stats["processed"],
+        "errors": stats["errors"],
+        "seconds": round(elapsed, 2),
+        "msg_per_s": round(stats["processed"] / elapsed, 1) if elapsed else 0.0,
+        "decode_avg_ms": stats["stages"]["decode"]["avg_ms"],
+        "resolve_avg_ms": stats["stages"]["resolve"]["avg_ms"],
+        "flush_max_ms": stats["writer"]["max_flush_ms"],
+    })
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Mede a vazão do ingest particionado por processo, sem broker: cada processo recebe "
+                    "só as mensagens dos seus gateways, como nas assinaturas por partição")
+    parser.add_argument('--partitions', default="1,2,4", help="Quantidades de processos a medir, separadas por vírgula")
+    parser.add_argument('--gateways', type=int, default=40)
+    parser.add_argument('--beacons', type=int, default=400)
+    parser.add_argument('--per-message', type=int, default=50, help="Beacons por mensagem de status")
+    parser.add_argument('--messages', type=int, default=4000, help="Mensagens no total, divididas entre os gateways")
+    args = parser.parse_args()
+
+    context = multiprocessing.get_context("spawn")
+    for partitions in [int(value) for value in args.partitions.split(",")]:
+        with tempfile.TemporaryDirectory() as directory:
+            database_uri = f"sqlite:///{os.path.join(directory, 'benchmark.db')}"
+            prepare_database(database_uri, args.gateways, args.beacons)
+            results = context.Queue()
+            processes = [context.Process(target=run_partition, args=(database_uri, partition, partitions, args, results))
+                         for partition in range(partitions)]
+            for process in processes:
+                process.start()
+            rows = sorted((results.get() for _ in processes), key=lambda row: row["partition"])
+            for process in processes:
+                process.join()
+
+        total = sum(row["messages"] for row in rows)
+        slowest = max(row["seconds"] for row in rows)
+        print(f"\n{partitions} processo(s): {total} mensagens em {slowest}s, {total / slowest:.1f} msg/s no total")
+        for row in rows:
+            print(f"  partição {row['partition']}: {row['gateways']} gateways, {row['messages']} msg, "
+                  f"{row['msg_per_s']} msg/s (decode {row['decode_avg_ms']} ms, resolve {row['resolve_avg_ms']} ms, "
+                  f"maior flush {row['flush_max_ms']} ms, erros {row['errors']})")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+import argparse
+import logging
+import signal
+import sys
+import threading
+
+from flask import Flask
+
+from config import Config
+from database import init_db
+from log_config import setup_logging
+from mac_index import mac_index
+from location_writer import location_writer
+from ingest import ingest
+from presence import GatewayPeopleManager, BUFFER_TIME
+from presence_sync import PresencePublisher, PartitionSubscriptions, connect
+from scheduler import scheduler
+
+logger = logging.getLogger(__name__)
+
+
+def create_worker_app():
+    # App mínimo: só banco e configuração, sem rotas nem contêineres
+    app = Flask(__name__)
+    app.config.from_object(Config)
+    init_db(app)
+    return app
+
+
+def run_worker(partition, partitions):
+    """Processo de ingest que atende apenas os gateways da sua partição.
+
+    Cada gateway cai sempre na mesma partição (crc32 do MAC), então a presença
+    e os LocationLogs dele têm um único dono. A presença calculada é publicada
+    no broker e aplicada pelo processo da API.
+    """
+    app = create_worker_app()
+    location_writer.init_app(app, buffer_time=BUFFER_TIME)
+    ingest.init_app(app)
+    ingest.partition = (partition, partitions)
+    subscriptions = PartitionSubscriptions(app.config['MQTT_TOPIC'], partition, partitions)
+    # O fechamento de logs inativos fica restrito aos gateways desta partição
+    location_writer.gateway_filter = subscriptions.gateway_ids
+
+    with app.app_context():
+        mac_index.load()
+
+    client = connect(app.config, client_id=f"camanager-ingest-{partition}")
+    publisher = PresencePublisher(client, app.config['MQTT_PRESENCE_TOPIC'])
+    publisher.attach(GatewayPeopleManager())
+
+    def reload_index():
+        with app.app_context():
+            mac_index.load()
+        topics = subscriptions.sync(client)
+        logger.info(f"Índice de MACs recarregado na partição {partition} ({topics} tópicos assinados).")
+
+    def on_message(client, userdata, msg):
+        if msg.topic == app.config['MQTT_INDEX_TOPIC']:
+            # Recarrega fora da thread de rede para não atrasar o loop do MQTT
+            threading.Thread(target=reload_index, daemon=True).start()
+            return
+        ingest.submit(msg.topic, msg.payload)
+
+    def shutdown(signal_received, frame):
+        logger.info(f"Encerrando processo de ingest da partição {partition}...")
+        client.disconnect()
+        scheduler.shutdown()
+        ingest.stop()
+        location_writer.stop()
+        sys.exit(0)
+
+    signal.signal(signal.SIGINT, shutdown)
+    signal.signal(signal.SIGTERM, shutdown)
+
+    location_writer.start()
+    ingest.start()
+    scheduler.add_job(GatewayPeopleManager().remove_inactive_people, 1)
+    scheduler.add_job(publisher.republish_all, BUFFER_TIME / 2)
+    scheduler.add_job(ingest.publish_status, app.config['STATUS_INTERVAL'])
+    scheduler.start()
+
+    def on_connect(client, *args):
+        client.subscribe(app.config['MQTT_INDEX_TOPIC'])
+        subscriptions.sync(client, reconnected=True)
+
+    client.on_connect = on_connect
+    client.on_message = on_message
+    logger.info(f"Processo de ingest iniciado: partição {partition + 1} de {partitions}.")
+    client.loop_forever()
+
+
+if __name__ == '__main__':
+    setup_logging()
+    parser = argparse.ArgumentParser(description="Processo de ingest MQTT particionado por MAC do gateway")
+    parser.add_argument('--partition', type=int, required=True)
+    parser.add_argument('--partitions', type=int, required=True)
+    args = parser.parse_args()
+    run_worker(args.partition, args.partitions)
@@ -0,0 +1,109 @@
+import json
+from urllib.parse import urlencode
+
+from flask import Response, jsonify, request, stream_with_context
+from sqlalchemy import select
+
+from config import Config
+from models import db
+
+STREAM_FORMATS = ('json', 'ndjson')
+
+
+def field(*columns, value=None):
+    """Campo de uma listagem: as colunas que ele lê e como montar o valor a partir da linha.
+
+    Sem value, o campo é a própria (primeira) coluna.
+    """
+    if value is None:
+        key = columns[0].key
+        value = lambda row: getattr(row, key)
+    return columns, value
+
+
+class ListingError(ValueError):
+    pass
+
+
+def _params(fields):
+    names = [name.strip() for name in request.args.get('fields', '').split(',') if name.strip()]
+    unknown = [name for name in names if name not in fields]
+    if unknown:
+        raise ListingError(f"Campos inválidos: {', '.join(unknown)}. Use: {', '.join(fields)}")
+    limit = request.args.get('limit', type=int)
+    if limit is not None and not 1 <= limit <= Config.LIST_MAX_LIMIT:
+        raise ListingError(f"limit deve estar entre 1 e {Config.LIST_MAX_LIMIT}")
+    stream = request.args.get('stream')
+    if stream is not None and stream not in STREAM_FORMATS:
+        raise ListingError(f"stream inválido. Use um de: {', '.join(STREAM_FORMATS)}")
+    return names or list(fields), limit, request.args.get('after', type=int), stream
+
+
+def list_rows(fields, key, where=(), join=None, envelope=None):
+    """Listagem com paginação por chave, projeção de campos e modo streaming.
+
+    Parâmetros da requisição:
+      fields=a,b   só os campos pedidos; o SELECT lê apenas as colunas deles
+      limit=N      página de até N linhas, ordenada por key
+      after=ID     continua depois do cursor (cabeçalhos X-Next-Cursor/Link)
+      stream=json  array JSON gerado linha a linha (ou 'ndjson', uma linha por objeto)
+
+    As linhas vêm de um cursor com yield_per, então exportações completas em
+    modo streaming usam memória constante e começam a responder na hora. Sem
+    parâmetros a resposta é a mesma lista JSON de antes. envelope=(chave,
+    dados) embrulha a lista num objeto {**dados, chave: [...]}.
+    """
+    try:
+        names, limit, after, stream = _params(fields)
+    except ListingError as e:
+        return jsonify({"error": str(e)}), 400
+
+    columns = {key.key: key}
+    for name in names:
+        for column in fields[name][0]:
+            columns.setdefault(column.key, column)
+    query = select(*columns.values())
+    if join is not None:
+        query = query.select_from(join)
+    query = query.where(*where).order_by(key)
+    if after is not None:
+        query = query.where(key > after)
+    if limit is not None:
+        query = query.limit(limit)
+    result = db.session.execute(query.execution_options(yield_per=Config.LIST_YIELD_PER))
+
+    def serialize(row):
+        return {name: fields[name][1](row) for name in names}
+
+    if stream:
+        return Response(stream_with_context(_stream(result, serialize, stream, envelope)),
+                        mimetype='application/x-ndjson' if stream == 'ndjson' else 'application/json')
+
+    items, last = [], None
+    for row in result:
+        items.append(serialize(row))
+        last = getattr(row, key.key)
+    response = jsonify({**envelope[1], envelope[0]: items} if envelope else items)
+    if limit is not None and len(items) == limit:
+        args = request.args.to_dict()
+        args['after'] = last
+        response.headers['X-Next-Cursor'] = str(last)
+        response.headers['Link'] = f'<{request.base_url}?{urlencode(args)}>; rel="next"'
+    return response
+
+
+def _stream(result, serialize, stream, envelope):
+    if stream == 'ndjson':
+        for row in result:
+            yield json.dumps(serialize(row), ensure_ascii=False) + '\n'
+        return
+    if envelope:
+        head = json.dumps(envelope[1], ensure_ascii=False)[:-1]
+        yield f'{head}{", " if envelope[1] else ""}"{envelope[0]}": ['
+    else:
+        yield '['
+    separator = ''
+    for row in result:
+        yield separator + json.dumps(serialize(row), ensure_ascii=False)
+        separator = ','
+    yield ']}' if envelope else ']'
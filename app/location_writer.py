@@ -0,0 +1,239 @@
+import logging
+import threading
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, insert, select, update
+
+from models import db, LocationLog
+
+logger = logging.getLogger(__name__)
+
+
+class LocationLogWriter:
+    """Gravação write-behind dos LocationLogs vindos do ingest MQTT.
+
+    Os avistamentos são agregados em memória por (pessoa, gateway) e gravados
+    em lote: um INSERT em massa para visitas novas, um UPDATE em massa para as
+    visitas abertas e um único commit por lote. O estado dos logs abertos fica
+    em memória, então o caminho quente não faz SELECT.
+
+    O fechamento dos logs inativos roda na mesma thread, logo depois de um
+    flush, para um lote atrasado nunca regravar o last_seen de um log já
+    fechado. Lotes que falham voltam para a fila e são regravados no próximo
+    flush; até lá o fechamento não roda.
+    """
+
+    def __init__(self):
+        self.app = None
+        self.flush_interval = 1.0
+        self.batch_size = 500
+        self.buffer_time = timedelta(seconds=5)
+        self.sweep_interval = 5.0
+        self.gateway_filter = None  # callable() -> ids dos gateways deste processo (ingest particionado)
+        self._lock = threading.Lock()
+        self._pending = {}  # (person_id, gateway_id) -> último avistamento ainda não gravado
+        self._open = {}  # (person_id, gateway_id) -> {"id", "entry_time", "last_seen"}
+        self._requeued = False  # O último flush devolveu algum lote para a fila
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._thread = None
+        self._batches = 0
+        self._rows = 0
+        self._last_flush = 0.0
+        self._max_flush = 0.0
+
+    def init_app(self, app, buffer_time):
+        self.app = app
+        self.flush_interval = app.config['LOCATION_LOG_FLUSH_INTERVAL']
+        self.batch_size = app.config['LOCATION_LOG_BATCH_SIZE']
+        self.buffer_time = timedelta(seconds=buffer_time)
+        self.sweep_interval = app.config['LOCATION_LOG_SWEEP_INTERVAL']
+
+    def start(self):
+        with self.app.app_context():
+            self._load_open_logs()
+        self._thread = threading.Thread(target=self._run, name="location-log-writer", daemon=True)
+        self._thread.start()
+        logger.info(f"Gravação em lote de logs iniciada ({len(self._open)} logs abertos carregados).")
+
+    def stop(self):
+        """Interrompe a thread de gravação após um último flush."""
+        self._stopping.set()
+        self._wakeup.set()
+        if self._thread:
+            self._thread.join(timeout=self.flush_interval + 5)
+
+    def record(self, person_id, gateway_id, seen_at=None):
+        """Registra um avistamento. Não acessa o banco."""
+        seen_at = seen_at or datetime.utcnow()
+        with self._lock:
+            self._pending[(person_id, gateway_id)] = seen_at
+            full = len(self._pending) >= self.batch_size
+        if full:
+            self._wakeup.set()
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        self._requeued = False
+        if pending:
+            started = time.monotonic()
+            items = list(pending.items())
+            with self.app.app_context():
+                for start in range(0, len(items), self.batch_size):
+                    self._write_batch(items[start:start + self.batch_size])
+            self._last_flush = time.monotonic() - started
+            self._max_flush = max(self._max_flush, self._last_flush)
+        self._evict_stale()
+
+    def stats(self):
+        return {
+            "pending": len(self._pending),
+            "open_logs": len(self._open),
+            "batches": self._batches,
+            "rows": self._rows,
+            "last_flush_ms": round(self._last_flush * 1000, 3),
+            "max_flush_ms": round(self._max_flush * 1000, 3)
+        }
+
+    def close_inactive_logs(self):
+        """Fecha, com um único UPDATE, os logs abertos sem avistamento recente.
+
+        A saída é o último avistamento e a duração é calculada no próprio banco.
+        A margem inclui o intervalo de flush para não fechar visitas cujo
+        avistamento mais recente ainda está no buffer em memória. Chamado pela
+        thread de gravação; com gateway_filter, só fecha os logs dos gateways
+        deste processo, que são os únicos que ele grava.
+        """
+        threshold = datetime.utcnow() - self.buffer_time - timedelta(seconds=self.flush_interval)
+        last_seen = func.coalesce(LocationLog.last_seen, LocationLog.entry_time)
+        conditions = [LocationLog.exit_time.is_(None), last_seen < threshold]
+        if self.gateway_filter is not None:
+            conditions.append(LocationLog.gateway_id.in_(self.gateway_filter()))
+        with self.app.app_context():
+            result = db.session.execute(
+                update(LocationLog)
+                .where(*conditions)
+                .values(exit_time=last_seen, duration=_duration_expr(db.engine.dialect.name, last_seen))
+                .execution_options(synchronize_session=False)
+            )
+            db.session.commit()
+        if result.rowcount:
+            logger.info(f"{result.rowcount} logs de localização inativos fechados.")
+
+    def _run(self):
+        next_sweep = time.monotonic() + self.sweep_interval
+        while not self._stopping.is_set():
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self._safe_flush()
+            if time.monotonic() >= next_sweep:
+                next_sweep = time.monotonic() + self.sweep_interval
+                self._safe_sweep()
+        self._safe_flush()
+
+    def _safe_flush(self):
+        try:
+            self.flush()
+        except Exception as e:
+            logger.error(f"Erro ao gravar lote de logs de localização: {e}")
+
+    def _safe_sweep(self):
+        if self._requeued:
+            # Lote reenfileirado: não fecha visitas com avistamentos ainda não gravados. Os
+            # avistamentos que só chegaram depois do flush estão dentro da margem do fechamento
+            return
+        try:
+            self.close_inactive_logs()
+        except Exception as e:
+            logger.error(f"Erro ao fechar logs de localização inativos: {e}")
+
+    def _load_open_logs(self):
+        rows = db.session.execute(
+            select(
+                LocationLog.id,
+                LocationLog.person_id,
+                LocationLog.gateway_id,
+                LocationLog.entry_time,
+                func.coalesce(LocationLog.last_seen, LocationLog.entry_time)
+            ).where(LocationLog.exit_time.is_(None)).order_by(LocationLog.entry_time)
+        )
+        self._open = {
+            (person_id, gateway_id): {"id": log_id, "entry_time": entry_time, "last_seen": last_seen}
+            for log_id, person_id, gateway_id, entry_time, last_seen in rows
+        }
+        self._evict_stale()
+
+    def _write_batch(self, batch):
+        new_keys, inserts, updates, closes = [], [], [], []
+        for key, seen_at in batch:
+            current = self._open.get(key)
+            if current and seen_at - current['last_seen'] <= self.buffer_time:
+                updates.append({"id": current['id'], "last_seen": seen_at})
+                continue
+            if current:
+                # A pessoa saiu e voltou: fecha a visita anterior antes de abrir outra
+                closes.append({
+                    "id": current['id'],
+                    "exit_time": current['last_seen'],
+                    "duration": current['last_seen'] - current['entry_time']
+                })
+            new_keys.append(key)
+            inserts.append({"person_id": key[0], "gateway_id": key[1], "entry_time": seen_at, "last_seen": seen_at})
+
+        try:
+            if updates:
+                db.session.execute(update(LocationLog), updates)
+            if closes:
+                db.session.execute(update(LocationLog), closes)
+            new_ids = []
+            if inserts:
+                new_ids = db.session.scalars(
+                    insert(LocationLog).returning(LocationLog.id, sort_by_parameter_order=True),
+                    inserts
+                ).all()
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Erro ao gravar lote com {len(batch)} avistamentos; tentando de novo no próximo flush: {e}")
+            self._requeue(batch)
+            return
+
+        self._batches += 1
+        self._rows += len(batch)
+
+        # Só atualiza o estado em memória depois do commit
+        reopened = set(new_keys)
+        for key, seen_at in batch:
+            if key in self._open and key not in reopened:
+                self._open[key]['last_seen'] = seen_at
+        for key, log_id, row in zip(new_keys, new_ids, inserts):
+            self._open[key] = {"id": log_id, "entry_time": row['entry_time'], "last_seen": row['last_seen']}
+
+    def _requeue(self, batch):
+        # Avistamentos mais novos recebidos desde o flush têm precedência
+        self._requeued = True
+        with self._lock:
+            for key, seen_at in batch:
+                if key not in self._pending or self._pending[key] < seen_at:
+                    self._pending[key] = seen_at
+
+    def _evict_stale(self):
+        # Logs sem avistamento recente ficam a cargo do fechamento de logs inativos
+        threshold = datetime.utcnow() - self.buffer_time
+        for key in [key for key, state in self._open.items() if state['last_seen'] < threshold]:
+            del self._open[key]
+
+
+def _duration_expr(dialect_name, exit_time):
+    if dialect_name == 'sqlite':
+        # No SQLite o Interval é gravado como DATETIME (epoch + duração)
+        return func.strftime(
+            '%Y-%m-%d %H:%M:%f',
+            func.julianday(exit_time) - func.julianday(LocationLog.entry_time) + func.julianday('1970-01-01')
+        )
+    return exit_time - LocationLog.entry_time
+
+
+location_writer = LocationLogWriter()
@@ -0,0 +1,105 @@
+import re
+import threading
+
+from models import Person, Gateway
+
+_MAC_SEPARATORS = re.compile(r'[^0-9a-f]')
+
+
+def normalize_mac(mac):
+    """Normaliza um endereço MAC para hexadecimal minúsculo sem separadores."""
+    if not mac:
+        return ''
+    return _MAC_SEPARATORS.sub('', mac.lower())
+
+
+def person_entry(person):
+    return {
+        "id": person.id,
+        "name": person.name,
+        "sector": person.sector,
+        "ibeacon_mac": person.ibeacon_mac
+    }
+
+
+def gateway_entry(gateway):
+    return {
+        "id": gateway.id,
+        "name": gateway.name,
+        "mac": gateway.mac,
+        "sector": gateway.sector
+    }
+
+
+class MacIndex:
+    """Índice residente MAC -> Pessoa e MAC -> Gateway usado pelo ingest MQTT.
+
+    As entradas são dicionários simples (nunca instâncias ORM), para que possam
+    ser lidas pela thread MQTT sem sessão do banco. As escritas substituem o
+    dicionário inteiro, então leitores nunca veem um índice pela metade.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._people = {}
+        self._gateways = {}
+        self._listeners = []
+
+    def add_listener(self, callback):
+        """Registra callback() chamado após cada alteração feita pelas rotas de cadastro."""
+        self._listeners.append(callback)
+
+    def _changed(self):
+        for callback in self._listeners:
+            callback()
+
+    def load(self):
+        """Carrega o índice a partir do banco. Requer um app context ativo."""
+        people = {normalize_mac(p.ibeacon_mac): person_entry(p) for p in Person.query.all()}
+        gateways = {normalize_mac(g.mac): gateway_entry(g) for g in Gateway.query.all()}
+        with self._lock:
+            self._people = people
+            self._gateways = gateways
+
+    def person_by_mac(self, mac):
+        return self._people.get(normalize_mac(mac))
+
+    def gateway_by_mac(self, mac):
+        return self._gateways.get(normalize_mac(mac))
+
+    def gateways(self):
+        """MAC normalizado -> gateway; o dicionário nunca é alterado, só substituído."""
+        return self._gateways
+
+    def put_person(self, person, old_mac=None):
+        with self._lock:
+            people = dict(self._people)
+            if old_mac:
+                people.pop(normalize_mac(old_mac), None)
+            people[normalize_mac(person.ibeacon_mac)] = person_entry(person)
+            self._people = people
+        self._changed()
+
+    def remove_person(self, mac):
+        with self._lock:
+            people = dict(self._people)
+            people.pop(normalize_mac(mac), None)
+            self._people = people
+        self._changed()
+
+    def put_gateway(self, gateway):
+        with self._lock:
+            gateways = dict(self._gateways)
+            gateways[normalize_mac(gateway.mac)] = gateway_entry(gateway)
+            self._gateways = gateways
+        self._changed()
+
+    def remove_gateway(self, mac):
+        with self._lock:
+            gateways = dict(self._gateways)
+            gateways.pop(normalize_mac(mac), None)
+            self._gateways = gateways
+        self._changed()
+
+
+mac_index = MacIndex()
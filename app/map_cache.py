@@ -0,0 +1,124 @@
+import hashlib
+import json
+import os
+import threading
+import uuid
+import zlib
+
+from sqlalchemy.orm import joinedload, selectinload
+
+from config import Config
+from models import db, Map, CameraMapPosition, GatewayMapPosition
+
+
+class MapLayoutCache:
+    """Cache da parte estática dos mapas (imagem e posições de câmeras e gateways).
+
+    O layout é montado com eager loading (selectin para as posições e join para
+    câmera/gateway), uma consulta por relacionamento em vez de uma por linha.
+    Uma geração é incrementada a cada invalidação, para que um carregamento em
+    andamento não grave no cache um layout já desatualizado.
+
+    Cada worker WSGI tem o próprio cache, mas a invalidação acontece só no
+    worker que atendeu a alteração. Por isso invalidate() também regrava o
+    arquivo MAP_CACHE_VERSION_FILE com uma versão nova, e cada get() compara a
+    versão gravada com a que viu por último: se outro processo invalidou, o
+    cache local inteiro é descartado.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._layouts = {}
+        self._generation = 0
+        self._version = None
+
+    def get(self, map_id):
+        version = _shared_version()
+        if version != self._version:
+            self._forget()
+            self._version = version
+        layout = self._layouts.get(map_id)
+        if layout is not None:
+            return layout
+        generation = self._generation
+        layout = self._load(map_id)
+        if layout is not None:
+            with self._lock:
+                if generation == self._generation:
+                    self._layouts[map_id] = layout
+        return layout
+
+    def invalidate(self, map_id=None):
+        """Remove um mapa do cache, ou todos quando map_id não é informado, também nos outros processos."""
+        self._forget(map_id)
+        _bump_shared_version()
+
+    def _forget(self, map_id=None):
+        with self._lock:
+            self._generation += 1
+            if map_id is None:
+                self._layouts = {}
+            else:
+                self._layouts.pop(map_id, None)
+
+    def _load(self, map_id):
+        map = db.session.get(Map, map_id, options=[
+            selectinload(Map.camera_positions).joinedload(CameraMapPosition.camera),
+            selectinload(Map.gateway_positions).joinedload(GatewayMapPosition.gateway),
+        ])
+        if not map:
+            return None
+
+        cameras = [{
+            "camera_id": position.camera.id,
+            "name": position.camera.name,
+            "pos_x": position.pos_x,
+            "pos_y": position.pos_y
+        } for position in map.camera_positions if position.camera]
+
+        gateways = [({
+            "gateway_id": position.gateway.id,
+            "name": position.gateway.name,
+            "pos_x": position.pos_x,
+            "pos_y": position.pos_y
+        }, position.gateway.mac) for position in map.gateway_positions if position.gateway]
+
+        layout = {
+            "map_id": map.id,
+            "name": map.name,
+            "image_url": map.image_url,
+            "cameras": cameras,
+            "gateways": [gateway for gateway, _ in gateways],
+            "gateway_macs": [mac for _, mac in gateways],
+        }
+        layout["etag"] = hashlib.sha1(json.dumps(layout, sort_keys=True).encode('utf-8')).hexdigest()[:16]
+        return layout
+
+
+def _shared_version():
+    try:
+        with open(Config.MAP_CACHE_VERSION_FILE) as f:
+            return f.read()
+    except FileNotFoundError:
+        return None
+
+
+def _bump_shared_version():
+    # Gravado num temporário e trocado com os.replace: o leitor nunca vê o arquivo vazio
+    os.makedirs(os.path.dirname(Config.MAP_CACHE_VERSION_FILE), exist_ok=True)
+    temporary = f"{Config.MAP_CACHE_VERSION_FILE}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(temporary, "w") as f:
+        f.write(uuid.uuid4().hex)
+    os.replace(temporary, Config.MAP_CACHE_VERSION_FILE)
+
+
+def presence_token(people_by_gateway):
+    """Resumo barato da presença, usado para compor o ETag do mapa."""
+    summary = repr([
+        [(person['id'], person.get('name'), person.get('sector')) for person in people]
+        for people in people_by_gateway
+    ])
+    return format(zlib.crc32(summary.encode('utf-8')), '08x')
+
+
+map_layouts = MapLayoutCache()
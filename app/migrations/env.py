@@ -0,0 +1,68 @@
+import os
+import sys
+from logging.config import fileConfig
+
+from alembic import context
+from sqlalchemy import create_engine
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import Config  # noqa: E402
+from database import database_url  # noqa: E402
+from models import db  # noqa: E402
+
+config = context.config
+target_metadata = db.metadata
+
+# Partições de arquivo do LocationLog são criadas em tempo de execução (retention.py)
+EXCLUDED_TABLE_PREFIXES = ("location_log_archive_",)
+
+
+def include_object(object, name, type_, reflected, compare_to):
+    if type_ == "table" and name.startswith(EXCLUDED_TABLE_PREFIXES):
+        return False
+    return True
+
+
+def run_migrations_offline():
+    context.configure(
+        url=database_url(Config.SQLALCHEMY_DATABASE_URI),
+        target_metadata=target_metadata,
+        include_object=include_object,
+        literal_binds=True,
+        render_as_batch=True,
+    )
+    with context.begin_transaction():
+        context.run_migrations()
+
+
+def run_migrations_online():
+    # A aplicação passa a conexão já aberta (database.migrate); pela CLI abre uma a partir do Config,
+    # com o SQLite relativo resolvido para instance/ como na aplicação
+    connection = config.attributes.get("connection")
+    if connection is None:
+        if config.config_file_name:
+            fileConfig(config.config_file_name, disable_existing_loggers=False)
+        with create_engine(database_url(Config.SQLALCHEMY_DATABASE_URI)).connect() as connection:
+            _run(connection)
+            connection.commit()
+    else:
+        _run(connection)
+
+
+def _run(connection):
+    context.configure(
+        connection=connection,
+        target_metadata=target_metadata,
+        include_object=include_object,
+        # ALTER TABLE no SQLite é limitado: as migrações recriam a tabela quando preciso
+        render_as_batch=connection.dialect.name == "sqlite",
+    )
+    with context.begin_transaction():
+        context.run_migrations()
+
+
+if context.is_offline_mode():
+    run_migrations_offline()
+else:
+    run_migrations_online()
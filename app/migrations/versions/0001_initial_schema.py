@@ -0,0 +1,116 @@
+"""Esquema inicial com os índices das consultas quentes
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0001'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'camera',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('name', sa.String(80), nullable=False),
+        sa.Column('rtsp_url', sa.String(255), nullable=False),
+        sa.Column('agrupamento', sa.String(80), nullable=True),
+        sa.Column('container_id', sa.String(255), nullable=True),
+        sa.Column('stream_profile', sa.String(20), nullable=True),
+        sa.Column('source_codec', sa.String(20), nullable=True),
+        sa.Column('encoder_preset', sa.String(20), nullable=True),
+        sa.Column('encoder_tune', sa.String(20), nullable=True),
+        sa.Column('resolutions', sa.String(100), nullable=True),
+        sa.Column('bitrates', sa.String(100), nullable=True),
+        sa.Column('pinned', sa.Boolean(), nullable=False, server_default='0'),
+    )
+    op.create_index('ix_camera_name_agrupamento', 'camera', ['name', 'agrupamento'])
+
+    op.create_table(
+        'map',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('name', sa.String(100), nullable=False),
+        sa.Column('image_url', sa.String(255), nullable=False),
+    )
+
+    op.create_table(
+        'gateway',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('name', sa.String(100), nullable=False),
+        sa.Column('mac', sa.String(17), nullable=False, unique=True),
+        sa.Column('sector', sa.String(100), nullable=True),
+    )
+
+    op.create_table(
+        'person',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('name', sa.String(100), nullable=False),
+        sa.Column('sector', sa.String(100), nullable=True),
+        sa.Column('ibeacon_mac', sa.String(17), nullable=False, unique=True),
+    )
+
+    op.create_table(
+        'camera_map_position',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('map_id', sa.Integer(), sa.ForeignKey('map.id'), nullable=False),
+        sa.Column('camera_id', sa.Integer(), sa.ForeignKey('camera.id'), nullable=False),
+        sa.Column('pos_x', sa.Float(), nullable=False),
+        sa.Column('pos_y', sa.Float(), nullable=False),
+    )
+    op.create_index('ix_camera_map_position_map_id', 'camera_map_position', ['map_id'])
+
+    op.create_table(
+        'gateway_map_position',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('map_id', sa.Integer(), sa.ForeignKey('map.id'), nullable=False),
+        sa.Column('gateway_id', sa.Integer(), sa.ForeignKey('gateway.id'), nullable=False),
+        sa.Column('pos_x', sa.Float(), nullable=False),
+        sa.Column('pos_y', sa.Float(), nullable=False),
+    )
+    op.create_index('ix_gateway_map_position_map_id', 'gateway_map_position', ['map_id'])
+
+    op.create_table(
+        'location_log',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('person_id', sa.Integer(), sa.ForeignKey('person.id'), nullable=False),
+        sa.Column('gateway_id', sa.Integer(), sa.ForeignKey('gateway.id'), nullable=False),
+        sa.Column('entry_time', sa.DateTime(), nullable=False),
+        sa.Column('exit_time', sa.DateTime(), nullable=True),
+        sa.Column('duration', sa.Interval(), nullable=True),
+        sa.Column('last_seen', sa.DateTime(), nullable=True),
+        sa.Column('rolled_up', sa.Boolean(), nullable=False, server_default='0'),
+    )
+    op.create_index('ix_location_log_person_gateway_exit', 'location_log', ['person_id', 'gateway_id', 'exit_time'])
+    op.create_index('ix_location_log_exit_last_seen', 'location_log', ['exit_time', 'last_seen'])
+    op.create_index('ix_location_log_person_entry', 'location_log', ['person_id', 'entry_time'])
+    op.create_index('ix_location_log_gateway_id', 'location_log', ['gateway_id', 'id'])
+    op.create_index('ix_location_log_rolled_up_exit', 'location_log', ['rolled_up', 'exit_time'])
+
+    op.create_table(
+        'presence_rollup',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('person_id', sa.Integer(), sa.ForeignKey('person.id'), nullable=False),
+        sa.Column('gateway_id', sa.Integer(), sa.ForeignKey('gateway.id'), nullable=False),
+        sa.Column('granularity', sa.String(5), nullable=False),
+        sa.Column('bucket_start', sa.DateTime(), nullable=False),
+        sa.Column('dwell_seconds', sa.Float(), nullable=False),
+        sa.Column('visits', sa.Integer(), nullable=False),
+        sa.UniqueConstraint('person_id', 'granularity', 'bucket_start', 'gateway_id', name='uq_presence_rollup_bucket'),
+    )
+    op.create_index('ix_presence_rollup_granularity_bucket', 'presence_rollup', ['granularity', 'bucket_start', 'gateway_id'])
+
+
+def downgrade():
+    op.drop_table('presence_rollup')
+    op.drop_table('location_log')
+    op.drop_table('gateway_map_position')
+    op.drop_table('camera_map_position')
+    op.drop_table('person')
+    op.drop_table('gateway')
+    op.drop_table('map')
+    op.drop_table('camera')
@@ -1,15 +1,31 @@
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import inspect, text
+from sqlalchemy.schema import CreateColumn
 from datetime import datetime, timedelta
 
 db = SQLAlchemy()
 
 class Camera(db.Model):
+    __table_args__ = (
+        # Verificação de nome duplicado no agrupamento (cadastro de câmeras)
+        db.Index('ix_camera_name_agrupamento', 'name', 'agrupamento'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(80), nullable=False)
     rtsp_url = db.Column(db.String(255), nullable=False)
     agrupamento = db.Column(db.String(80), nullable=True)
     container_id = db.Column(db.String(255), nullable=True)  # Identificador do contêiner
 
+    # Perfil de stream: 'auto' (passthrough quando o codec permite), 'passthrough' ou 'transcode'
+    stream_profile = db.Column(db.String(20), nullable=True, default='auto')
+    source_codec = db.Column(db.String(20), nullable=True)  # Codec de vídeo sondado na URL RTSP
+    encoder_preset = db.Column(db.String(20), nullable=True)  # Preset x264 (padrão em STREAM_X264_PRESET)
+    encoder_tune = db.Column(db.String(20), nullable=True)  # Tune x264, ex.: 'zerolatency'
+    resolutions = db.Column(db.String(100), nullable=True)  # Escada de resoluções, ex.: '1280x720,640x360'
+    bitrates = db.Column(db.String(100), nullable=True)  # Bitrates da escada, ex.: '2000k,600k'
+    pinned = db.Column(db.Boolean, nullable=False, default=False, server_default='0')  # Mantém o stream ligado no modo sob demanda
+
 
 class Map(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -21,7 +37,7 @@ class Map(db.Model):
 
 class CameraMapPosition(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    map_id = db.Column(db.Integer, db.ForeignKey('map.id'), nullable=False)
+    map_id = db.Column(db.Integer, db.ForeignKey('map.id'), nullable=False, index=True)
     camera_id = db.Column(db.Integer, db.ForeignKey('camera.id'), nullable=False)
     pos_x = db.Column(db.Float, nullable=False)
     pos_y = db.Column(db.Float, nullable=False)
@@ -41,7 +57,7 @@ class Gateway(db.Model):
 
 class GatewayMapPosition(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    map_id = db.Column(db.Integer, db.ForeignKey('map.id'), nullable=False)
+    map_id = db.Column(db.Integer, db.ForeignKey('map.id'), nullable=False, index=True)
     gateway_id = db.Column(db.Integer, db.ForeignKey('gateway.id'), nullable=False)
     pos_x = db.Column(db.Float, nullable=False)
     pos_y = db.Column(db.Float, nullable=False)
@@ -59,15 +75,68 @@ class Person(db.Model):
 
 
 class LocationLog(db.Model):
+    __table_args__ = (
+        # Busca do log aberto por (pessoa, gateway)
+        db.Index('ix_location_log_person_gateway_exit', 'person_id', 'gateway_id', 'exit_time'),
+        # Varredura de logs abertos inativos
+        db.Index('ix_location_log_exit_last_seen', 'exit_time', 'last_seen'),
+        # Logs de uma pessoa por período (relatório de logs)
+        db.Index('ix_location_log_person_entry', 'person_id', 'entry_time'),
+        # Histórico de um gateway paginado pelo id do log
+        db.Index('ix_location_log_gateway_id', 'gateway_id', 'id'),
+        # Logs fechados ainda não consolidados nos rollups
+        db.Index('ix_location_log_rolled_up_exit', 'rolled_up', 'exit_time'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     person_id = db.Column(db.Integer, db.ForeignKey('person.id'), nullable=False)
     gateway_id = db.Column(db.Integer, db.ForeignKey('gateway.id'), nullable=False)
     entry_time = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
     exit_time = db.Column(db.DateTime, nullable=True)
     duration = db.Column(db.Interval, nullable=True)
+    last_seen = db.Column(db.DateTime, nullable=True)  # Último avistamento enquanto o log está aberto
+    rolled_up = db.Column(db.Boolean, nullable=False, default=False, server_default='0')  # Já somado em PresenceRollup
 
     def close_log(self):
         """Fecha o log atualizando o horário de saída e a duração."""
         if not self.exit_time:
             self.exit_time = datetime.utcnow()
             self.duration = self.exit_time - self.entry_time
+
+
+class PresenceRollup(db.Model):
+    """Permanência e visitas por pessoa × gateway × hora/dia (UTC), somadas a partir dos LocationLogs fechados."""
+    __table_args__ = (
+        # Chave do upsert e consultas de permanência de uma pessoa por período
+        db.UniqueConstraint('person_id', 'granularity', 'bucket_start', 'gateway_id', name='uq_presence_rollup_bucket'),
+        # Ocupação por gateway e período
+        db.Index('ix_presence_rollup_granularity_bucket', 'granularity', 'bucket_start', 'gateway_id'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    person_id = db.Column(db.Integer, db.ForeignKey('person.id'), nullable=False)
+    gateway_id = db.Column(db.Integer, db.ForeignKey('gateway.id'), nullable=False)
+    granularity = db.Column(db.String(5), nullable=False)  # 'hour' ou 'day'
+    bucket_start = db.Column(db.DateTime, nullable=False)
+    dwell_seconds = db.Column(db.Float, nullable=False, default=0.0)
+    visits = db.Column(db.Integer, nullable=False, default=0)  # Visitas iniciadas no intervalo
+
+
+def upgrade_schema():
+    """Adiciona colunas e índices novos em tabelas que já existem.
+
+    O db.create_all() só cria tabelas ausentes, então bancos criados antes de
+    uma coluna ou índice ser declarado precisam deste complemento.
+    """
+    inspector = inspect(db.engine)
+    with db.engine.begin() as connection:
+        for table in db.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {column['name'] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in existing:
+                    ddl = CreateColumn(column).compile(dialect=connection.dialect)
+                    connection.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {ddl}"))
+            for index in table.indexes:
+                index.create(connection, checkfirst=True)
@@ -0,0 +1,196 @@
+import heapq
+import threading
+import time
+
+from mac_index import normalize_mac
+
+BUFFER_TIME = 5  # Segundos para considerar uma pessoa "fora do local"
+GATEWAY_ACTIVE_WINDOW = 5  # Segundos sem mensagem para considerar um gateway inativo
+GATEWAY_SEEN_TTL = 300  # Segundos até esquecer um gateway que parou de enviar mensagens
+STRIPES = 16
+
+
+class _Stripe:
+    """Estado mutável de um grupo de gateways, protegido por um único lock."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.gateways = {}  # gateway_mac -> {person_id: {"person", "last_seen"}}
+        self.deadlines = []  # heap de (expira_em, gateway_mac, person_id)
+
+
+class GatewayPeopleManager:
+    """Presença de pessoas por gateway, compartilhada entre a thread MQTT e o Flask.
+
+    O estado mutável é dividido em faixas (lock striping) por MAC do gateway,
+    cada uma com seu lock e seu heap de expiração. Avistamentos são O(1) e só
+    os prazos vencidos são visitados na expiração.
+
+    Leitores nunca pegam lock: cada gateway publica uma tupla imutável com as
+    pessoas presentes, trocada inteira (copy-on-write) quando alguém entra ou
+    sai. Assim uma leitura nunca vê um gateway atualizado pela metade.
+    """
+    _instance = None
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super(GatewayPeopleManager, cls).__new__(cls)
+            cls._instance._init_state()
+        return cls._instance
+
+    def _init_state(self):
+        self.buffer_time = BUFFER_TIME
+        self._stripes = [_Stripe() for _ in range(STRIPES)]
+        self._publish_lock = threading.Lock()
+        self._snapshots = {}  # gateway_mac -> tupla de pessoas (copy-on-write)
+        self._seen_lock = threading.Lock()
+        self._gateway_seen = {}  # gateway_mac -> última mensagem (copy-on-write nas chaves)
+        self._listeners = []
+
+    def add_listener(self, callback):
+        """Registra callback(gateway_mac, pessoas) chamado quando alguém entra ou sai de um gateway.
+
+        O callback roda com o lock da faixa do gateway e deve ser rápido.
+        """
+        self._listeners.append(callback)
+
+    def _stripe(self, gateway_mac):
+        return self._stripes[hash(gateway_mac) % STRIPES]
+
+    def add_person_to_gateway(self, gateway_mac, person, seen_at=None):
+        self.add_people_to_gateway(gateway_mac, [person], seen_at)
+
+    def add_people_to_gateway(self, gateway_mac, persons, seen_at=None):
+        """Registra os avistamentos de uma mensagem do gateway de uma só vez."""
+        gateway_mac = normalize_mac(gateway_mac)
+        seen_at = seen_at or time.time()
+        self._mark_gateway_seen(gateway_mac, seen_at)
+
+        stripe = self._stripe(gateway_mac)
+        with stripe.lock:
+            people = stripe.gateways.setdefault(gateway_mac, {})
+            changed = False
+            for person in persons:
+                entry = people.get(person['id'])
+                if entry is None:
+                    people[person['id']] = {"person": person, "last_seen": seen_at}
+                    heapq.heappush(stripe.deadlines, (seen_at + self.buffer_time, gateway_mac, person['id']))
+                    changed = True
+                else:
+                    if entry['person'] is not person:
+                        entry['person'] = person
+                        changed = True
+                    entry['last_seen'] = seen_at
+            if changed:
+                self._publish(gateway_mac, people)
+            elif not people:
+                del stripe.gateways[gateway_mac]
+
+    def replace_people_of_gateway(self, gateway_mac, persons, seen_at, gateway_seen=None):
+        """Substitui a presença de um gateway por um snapshot vindo de outro processo."""
+        gateway_mac = normalize_mac(gateway_mac)
+        if gateway_seen:
+            self._mark_gateway_seen(gateway_mac, gateway_seen)
+
+        stripe = self._stripe(gateway_mac)
+        with stripe.lock:
+            current = stripe.gateways.get(gateway_mac, {})
+            people = {}
+            for person in persons:
+                people[person['id']] = {"person": person, "last_seen": seen_at}
+                if person['id'] not in current:
+                    heapq.heappush(stripe.deadlines, (seen_at + self.buffer_time, gateway_mac, person['id']))
+            if people:
+                stripe.gateways[gateway_mac] = people
+            else:
+                stripe.gateways.pop(gateway_mac, None)
+            if people or current:
+                self._publish(gateway_mac, people)
+
+    def remove_inactive_people(self, now=None):
+        """Remove as pessoas cujo último avistamento passou do BUFFER_TIME."""
+        now = now or time.time()
+        for stripe in self._stripes:
+            with stripe.lock:
+                changed = self._expire_stripe(stripe, now)
+                for gateway_mac in changed:
+                    people = stripe.gateways.get(gateway_mac, {})
+                    if not people:
+                        stripe.gateways.pop(gateway_mac, None)
+                    self._publish(gateway_mac, people)
+        self._forget_silent_gateways(now)
+
+    def _expire_stripe(self, stripe, now):
+        changed = set()
+        deadlines = stripe.deadlines
+        while deadlines and deadlines[0][0] < now:
+            _, gateway_mac, person_id = heapq.heappop(deadlines)
+            people = stripe.gateways.get(gateway_mac)
+            entry = people.get(person_id) if people else None
+            if entry is None:
+                continue
+            expires_at = entry['last_seen'] + self.buffer_time
+            if expires_at >= now:
+                # Vista novamente desde o agendamento: apenas reagenda
+                heapq.heappush(deadlines, (expires_at, gateway_mac, person_id))
+                continue
+            del people[person_id]
+            changed.add(gateway_mac)
+        return changed
+
+    def _publish(self, gateway_mac, people):
+        # Chamado com o lock da faixa do gateway, o que ordena as publicações dele
+        snapshot = tuple(entry['person'] for entry in people.values())
+        with self._publish_lock:
+            if snapshot and gateway_mac in self._snapshots:
+                self._snapshots[gateway_mac] = snapshot
+            else:
+                snapshots = dict(self._snapshots)
+                if snapshot:
+                    snapshots[gateway_mac] = snapshot
+                else:
+                    snapshots.pop(gateway_mac, None)
+                self._snapshots = snapshots
+        for callback in self._listeners:
+            callback(gateway_mac, snapshot)
+
+    def _mark_gateway_seen(self, gateway_mac, seen_at):
+        # Mesmo lock da limpeza, que troca o dicionário inteiro: sem ele a atualização
+        # poderia cair no dicionário antigo e se perder
+        with self._seen_lock:
+            if gateway_mac in self._gateway_seen:
+                self._gateway_seen[gateway_mac] = seen_at
+                return
+            gateway_seen = dict(self._gateway_seen)
+            gateway_seen[gateway_mac] = seen_at
+            self._gateway_seen = gateway_seen
+
+    def _forget_silent_gateways(self, now):
+        if not any(now - seen_at > GATEWAY_SEEN_TTL for seen_at in self._gateway_seen.values()):
+            return
+        with self._seen_lock:
+            self._gateway_seen = {
+                gateway_mac: seen_at for gateway_mac, seen_at in self._gateway_seen.items()
+                if now - seen_at <= GATEWAY_SEEN_TTL
+            }
+
+    def get_people_by_gateway(self, gateway_mac):
+        return list(self._snapshots.get(normalize_mac(gateway_mac), ()))
+
+    def get_all_data(self):
+        return {gateway_mac: list(people) for gateway_mac, people in self._snapshots.items()}
+
+    def get_last_message_at(self, gateway_mac):
+        return self._gateway_seen.get(normalize_mac(gateway_mac))
+
+    def get_gateway_states(self):
+        """Lista (gateway_mac, última mensagem, pessoas) de todos os gateways conhecidos."""
+        snapshots = self._snapshots
+        return [
+            (gateway_mac, seen_at, list(snapshots.get(gateway_mac, ())))
+            for gateway_mac, seen_at in self._gateway_seen.items()
+        ]
+
+    def get_active_gateways(self, window=GATEWAY_ACTIVE_WINDOW):
+        now = time.time()
+        return [gateway_mac for gateway_mac, seen_at in self._gateway_seen.items() if now - seen_at <= window]
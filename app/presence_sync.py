@@ -0,0 +1,151 @@
+import json
+import logging
+import time
+import zlib
+
+import paho.mqtt.client as mqtt
+
+from mac_index import mac_index, normalize_mac
+from presence import GatewayPeopleManager
+
+logger = logging.getLogger(__name__)
+
+ANNOUNCE_INTERVAL = 5.0  # Segundos entre anúncios do mesmo gateway não cadastrado
+
+
+def partition_of(gateway_mac, partitions):
+    # crc32 é estável entre processos (o hash() do Python não é)
+    return zlib.crc32(gateway_mac.encode()) % partitions
+
+
+def presence_topic(prefix, gateway_mac):
+    return f"{prefix}/{gateway_mac}"
+
+
+def gateway_topics(topic_pattern, gateway_mac):
+    """Tópicos exatos de um gateway no padrão MQTT_TOPIC (/gw/+/status), nas grafias usuais do MAC."""
+    mac = normalize_mac(gateway_mac)
+    return {topic_pattern.replace('+', variant, 1) for variant in (mac, mac.upper(), gateway_mac)}
+
+
+class PartitionSubscriptions:
+    """Assinaturas MQTT de um processo de ingest: só os tópicos dos seus gateways.
+
+    O curinga /gw/+/status entregaria toda mensagem a todos os processos; aqui
+    cada um assina os tópicos exatos dos gateways cadastrados cujo crc32 cai na
+    sua partição, e o broker entrega cada mensagem uma única vez. sync() é
+    chamado na conexão e a cada recarga do índice de MACs.
+    """
+
+    def __init__(self, topic_pattern, partition, partitions):
+        self.topic_pattern = topic_pattern
+        self.partition = partition
+        self.partitions = partitions
+        self._topics = set()
+
+    def gateway_ids(self):
+        return [gateway['id'] for mac, gateway in mac_index.gateways().items()
+                if partition_of(mac, self.partitions) == self.partition]
+
+    def sync(self, client, reconnected=False):
+        if reconnected:
+            self._topics = set()  # Sessão nova: o broker não guarda as assinaturas anteriores
+        wanted = set()
+        for mac, gateway in mac_index.gateways().items():
+            if partition_of(mac, self.partitions) == self.partition:
+                wanted |= gateway_topics(self.topic_pattern, gateway['mac'])
+        removed, added = self._topics - wanted, wanted - self._topics
+        if removed:
+            client.unsubscribe(sorted(removed))
+        if added:
+            client.subscribe([(topic, 0) for topic in sorted(added)])
+        self._topics = wanted
+        return len(wanted)
+
+
+class PresencePublisher:
+    """Publica no broker a presença calculada por um worker de ingest.
+
+    Cada gateway tem uma mensagem retida com as pessoas presentes, publicada
+    quando alguém entra ou sai e repetida periodicamente para que o processo
+    da API possa expirar gateways de um worker que morreu.
+    """
+
+    def __init__(self, client, prefix):
+        self.client = client
+        self.prefix = prefix
+
+    def attach(self, manager):
+        manager.add_listener(self._on_change)
+
+    def _on_change(self, gateway_mac, people):
+        self._send(gateway_mac, people, GatewayPeopleManager().get_last_message_at(gateway_mac))
+
+    def republish_all(self):
+        for gateway_mac, gateway_seen, people in GatewayPeopleManager().get_gateway_states():
+            self._send(gateway_mac, people, gateway_seen)
+
+    def _send(self, gateway_mac, people, gateway_seen):
+        payload = json.dumps({"people": list(people), "seen_at": time.time(), "gateway_seen": gateway_seen})
+        self.client.publish(presence_topic(self.prefix, gateway_mac), payload, retain=True)
+
+
+class PresenceConsumer:
+    """Aplica no GatewayPeopleManager do processo da API a presença publicada pelos workers."""
+
+    def __init__(self, prefix):
+        self.prefix = prefix
+
+    def subscribe(self, client):
+        client.subscribe(f"{self.prefix}/+")
+
+    def handles(self, topic):
+        return topic.startswith(f"{self.prefix}/")
+
+    def on_message(self, msg):
+        try:
+            gateway_mac = msg.topic[len(self.prefix) + 1:]
+            data = json.loads(msg.payload.decode('utf-8'))
+            GatewayPeopleManager().replace_people_of_gateway(
+                gateway_mac, data.get("people", []), data.get("seen_at", 0), data.get("gateway_seen")
+            )
+        except Exception as e:
+            logger.error(f"Erro ao aplicar presença recebida de {msg.topic}: {e}")
+
+
+class GatewayDiscovery:
+    """Anuncia gateways ainda não cadastrados, listados em /api/gateways/active para cadastro.
+
+    Como os processos de ingest só assinam os gateways cadastrados, uma única
+    assinatura curinga por implantação olha o tópico das mensagens (sem
+    decodificar o JSON) e publica uma presença vazia para os MACs
+    desconhecidos, no máximo a cada ANNOUNCE_INTERVAL segundos por gateway.
+    """
+
+    def __init__(self, client, prefix):
+        self.publisher = PresencePublisher(client, prefix)
+        self._announced = {}  # MAC -> time.time() do último anúncio
+
+    def on_message(self, msg):
+        parts = msg.topic.split('/')
+        if len(parts) < 3:
+            return
+        gateway_mac = normalize_mac(parts[2])  # Tópico no formato /gw/<mac>/status
+        if mac_index.gateway_by_mac(gateway_mac):
+            return
+        now = time.time()
+        if now - self._announced.get(gateway_mac, 0.0) < ANNOUNCE_INTERVAL:
+            return
+        self._announced[gateway_mac] = now
+        self.publisher._send(gateway_mac, [], now)
+
+
+def notify_index_changed(client, topic):
+    """Avisa os workers de ingest que pessoas ou gateways mudaram no banco."""
+    client.publish(topic, str(time.time()))
+
+
+def connect(config, client_id=None):
+    client = mqtt.Client(client_id=client_id or "")
+    client.connect(config['MQTT_BROKER'], config['MQTT_PORT'])
+    return client
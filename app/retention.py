@@ -0,0 +1,273 @@
+import csv
+import gzip
+import logging
+import os
+import re
+import threading
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import Column, Index, MetaData, Table, delete, inspect, insert, select, text, union_all
+from sqlalchemy.exc import OperationalError, ProgrammingError
+
+from models import db, LocationLog, Gateway
+
+logger = logging.getLogger(__name__)
+
+PARTITION_PREFIX = "location_log_archive_"
+PARTITION_RE = re.compile(r"^location_log_archive_(\d{4})(\d{2})$")
+ARCHIVED_COLUMNS = ('id', 'person_id', 'gateway_id', 'entry_time', 'exit_time', 'duration')
+
+
+def partition_name(moment):
+    return f"{PARTITION_PREFIX}{moment:%Y%m}"
+
+
+def _month_start(moment):
+    return moment.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def _next_month(moment):
+    return (_month_start(moment) + timedelta(days=32)).replace(day=1)
+
+
+def _months_between(start, end):
+    # Início de cada mês que tem algum instante em [start, end)
+    month = _month_start(start)
+    while month < end and start < end:
+        yield month
+        month = _next_month(month)
+
+
+class LocationLogRetention:
+    """Retenção do LocationLog: tabela principal quente, partições mensais frias.
+
+    A cada execução, logs fechados há mais de LOCATION_LOG_HOT_DAYS e já
+    consolidados nos rollups (rolled_up) são movidos em lotes para
+    location_log_archive_AAAAMM, conforme o mês de entrada; cada lote é um
+    INSERT por partição e um DELETE na mesma transação. Com
+    LOCATION_LOG_ARCHIVE_MONTHS, partições mais antigas são exportadas para
+    CSV gzip em LOCATION_LOG_EXPORT_DIR e removidas do banco. Depois disso
+    roda ANALYZE e, no SQLite, um incremental_vacuum limitado, para devolver
+    as páginas livres aos poucos. O incremental_vacuum exige o banco em
+    auto_vacuum=INCREMENTAL, conversão feita uma única vez fora deste job
+    (enable_incremental_vacuum, via `python services.py vacuum`), porque o
+    VACUUM completo segura o banco por mais que o busy_timeout.
+
+    Meses exportados para CSV não voltam nas consultas: exported_between
+    informa quais são, para a API avisar o cliente.
+    """
+
+    def __init__(self):
+        self.app = None
+        self._metadata = MetaData()
+        self._partitions = {}  # nome -> Table
+        self._lock = threading.Lock()
+        self._last = {}
+        self._vacuum_warned = False
+
+    def init_app(self, app):
+        self.app = app
+
+    def run(self):
+        config = self.app.config
+        started = time.monotonic()
+        with self._lock, self.app.app_context():
+            self._load_partitions()
+            moved = self._archive(datetime.utcnow() - timedelta(days=config['LOCATION_LOG_HOT_DAYS']),
+                                  config['LOCATION_LOG_ARCHIVE_BATCH'])
+            exported = []
+            if config['LOCATION_LOG_ARCHIVE_MONTHS']:
+                exported = self._export_cold(config['LOCATION_LOG_ARCHIVE_MONTHS'], config['LOCATION_LOG_EXPORT_DIR'])
+            self._maintain(config['LOCATION_LOG_VACUUM_PAGES'], analyze=bool(moved or exported))
+        self._last = {
+            "moved": moved,
+            "exported_partitions": exported,
+            "partitions": sorted(self._partitions),
+            "duration_ms": round((time.monotonic() - started) * 1000, 1),
+        }
+        if moved or exported:
+            logger.info(f"Retenção de logs de localização: {self._last}")
+        return self._last
+
+    def stats(self):
+        return dict(self._last)
+
+    def partitions_between(self, start, end, reload=False):
+        """Partições que podem ter logs com entrada em [start, end).
+
+        A lista fica em cache por processo; um mês sem partição conhecida
+        recarrega a lista do banco, já que outro processo pode ter arquivado ou
+        exportado meses desde a última leitura.
+        """
+        names = [partition_name(month) for month in _months_between(start, end)]
+        with self._lock:
+            if reload or any(name not in self._partitions for name in names):
+                self._load_partitions()
+            return [self._partitions[name] for name in names if name in self._partitions]
+
+    def exported_between(self, start, end):
+        """Partições do período que só existem como CSV em LOCATION_LOG_EXPORT_DIR."""
+        export_dir = self.app.config['LOCATION_LOG_EXPORT_DIR']
+        return [partition_name(month) for month in _months_between(start, end)
+                if os.path.exists(os.path.join(export_dir, f"{partition_name(month)}.csv.gz"))]
+
+    def person_logs(self, person_id, start, end):
+        """Logs de uma pessoa com entrada em [start, end), da tabela principal e das partições no período.
+
+        Retorna linhas com gateway, entry_time, exit_time e duration, em ordem de entrada.
+        """
+        def logs_from(table):
+            return (
+                select(Gateway.name.label('gateway'), table.c.entry_time, table.c.exit_time, table.c.duration)
+                .join(Gateway, Gateway.id == table.c.gateway_id)
+                .where(table.c.person_id == person_id, table.c.entry_time >= start, table.c.entry_time < end)
+            )
+
+        def run(partitions):
+            queries = [logs_from(LocationLog.__table__)] + [logs_from(table) for table in partitions]
+            query = union_all(*queries).subquery() if len(queries) > 1 else queries[0].subquery()
+            return db.session.execute(select(query).order_by(query.c.entry_time)).all()
+
+        try:
+            return run(self.partitions_between(start, end))
+        except (OperationalError, ProgrammingError):
+            # Partição exportada e removida por outro processo: relê a lista e tenta de novo
+            db.session.rollback()
+            return run(self.partitions_between(start, end, reload=True))
+
+    def gateway_logs(self, gateway_id):
+        """Logs de um gateway, da tabela principal e de todas as partições, como subquery.
+
+        As colunas são as de ARCHIVED_COLUMNS; o id do log se mantém no
+        arquivamento e serve de chave de paginação na união. A lista de
+        partições é relida a cada chamada, já que não há período para conferir.
+        """
+        with self._lock:
+            self._load_partitions()
+            tables = [LocationLog.__table__, *self._partitions.values()]
+        queries = [select(*[table.c[column] for column in ARCHIVED_COLUMNS]).where(table.c.gateway_id == gateway_id)
+                   for table in tables]
+        return (union_all(*queries) if len(queries) > 1 else queries[0]).subquery()
+
+    def _load_partitions(self):
+        names = {name for name in inspect(db.engine).get_table_names() if PARTITION_RE.match(name)}
+        for name in set(self._partitions) - names:
+            self._metadata.remove(self._partitions.pop(name))
+        for name in names - set(self._partitions):
+            self._partitions[name] = self._table(name)
+
+    def _table(self, name):
+        if name in self._metadata.tables:
+            return self._metadata.tables[name]
+        source = LocationLog.__table__.c
+        return Table(
+            name, self._metadata,
+            *[Column(column, source[column].type, primary_key=source[column].primary_key,
+                     nullable=source[column].nullable, autoincrement=False) for column in ARCHIVED_COLUMNS],
+            Index(f"ix_{name}_person_entry", 'person_id', 'entry_time'),
+            Index(f"ix_{name}_gateway_entry", 'gateway_id', 'entry_time'),
+        )
+
+    def _partition(self, name):
+        table = self._partitions.get(name)
+        if table is None:
+            table = self._table(name)
+            table.create(db.engine, checkfirst=True)
+            self._partitions[name] = table
+            logger.info(f"Partição de arquivo {name} criada.")
+        return table
+
+    def _archive(self, cutoff, batch_size):
+        moved = 0
+        columns = [getattr(LocationLog, column) for column in ARCHIVED_COLUMNS]
+        while True:
+            rows = db.session.execute(
+                select(*columns)
+                .where(LocationLog.exit_time.is_not(None), LocationLog.exit_time < cutoff,
+                       LocationLog.rolled_up.is_(True))
+                .order_by(LocationLog.id)
+                .limit(batch_size)
+            ).all()
+            if not rows:
+                break
+            by_partition = {}
+            for row in rows:
+                by_partition.setdefault(partition_name(row.entry_time), []).append(dict(row._mapping))
+            tables = {name: self._partition(name) for name in by_partition}
+            try:
+                for name, partition_rows in by_partition.items():
+                    db.session.execute(insert(tables[name]), partition_rows)
+                db.session.execute(
+                    delete(LocationLog)
+                    .where(LocationLog.id.in_([row.id for row in rows]))
+                    .execution_options(synchronize_session=False)
+                )
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                raise
+            moved += len(rows)
+            if len(rows) < batch_size:
+                break
+        return moved
+
+    def _export_cold(self, months, export_dir):
+        # Partições anteriores a `months` meses saem do banco para CSV gzip
+        oldest_kept = _month_start(datetime.utcnow())
+        for _ in range(months):
+            oldest_kept = _month_start(oldest_kept - timedelta(days=1))
+        exported = []
+        os.makedirs(export_dir, exist_ok=True)
+        for name in sorted(self._partitions):
+            year, month = PARTITION_RE.match(name).groups()
+            if datetime(int(year), int(month), 1) >= oldest_kept:
+                continue
+            table = self._partitions[name]
+            path = os.path.join(export_dir, f"{name}.csv.gz")
+            with gzip.open(path + ".tmp", "wt", newline="") as f:
+                writer = csv.writer(f)
+                writer.writerow(ARCHIVED_COLUMNS)
+                result = db.session.execute(select(table).order_by(table.c.id).execution_options(yield_per=5000))
+                for row in result:
+                    writer.writerow(["" if value is None else value for value in row])
+            os.replace(path + ".tmp", path)
+            table.drop(db.engine)
+            del self._partitions[name]
+            self._metadata.remove(table)
+            exported.append(name)
+            logger.info(f"Partição {name} exportada para {path} e removida do banco.")
+        return exported
+
+    def _maintain(self, vacuum_pages, analyze):
+        db.session.commit()
+        with db.engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+            if analyze:
+                connection.execute(text(f"ANALYZE {LocationLog.__tablename__}"))
+            if connection.dialect.name != 'sqlite':
+                return
+            if connection.execute(text("PRAGMA auto_vacuum")).scalar() != 2:
+                if not self._vacuum_warned:
+                    self._vacuum_warned = True
+                    logger.warning("Banco sem auto_vacuum incremental; as páginas livres não são devolvidas. "
+                                   "Converta uma vez, com a API parada: python services.py vacuum")
+                return
+            free = connection.execute(text("PRAGMA freelist_count")).scalar()
+            if free:
+                connection.execute(text(f"PRAGMA incremental_vacuum({min(free, vacuum_pages)})"))
+
+    def enable_incremental_vacuum(self):
+        """Converte o SQLite para auto_vacuum=INCREMENTAL (VACUUM completo, uma única vez)."""
+        with self.app.app_context():
+            with db.engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+                if connection.dialect.name != 'sqlite':
+                    return False
+                if connection.execute(text("PRAGMA auto_vacuum")).scalar() == 2:
+                    return False
+                logger.info("Convertendo o banco para auto_vacuum incremental (VACUUM completo).")
+                connection.execute(text("PRAGMA auto_vacuum = INCREMENTAL"))
+                connection.execute(text("VACUUM"))
+                return True
+
+
+location_log_retention = LocationLogRetention()
@@ -0,0 +1,211 @@
+import logging
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+
+from models import db, LocationLog, PresenceRollup, Gateway
+
+logger = logging.getLogger(__name__)
+
+GRANULARITIES = {
+    'hour': timedelta(hours=1),
+    'day': timedelta(days=1),
+}
+
+
+def bucket_start(moment, granularity):
+    if granularity == 'day':
+        return moment.replace(hour=0, minute=0, second=0, microsecond=0)
+    return moment.replace(minute=0, second=0, microsecond=0)
+
+
+def split_interval(entry_time, exit_time, granularity):
+    """Divide [entrada, saída) nos intervalos da granularidade: [(início do intervalo, segundos)]."""
+    step = GRANULARITIES[granularity]
+    parts = []
+    start = bucket_start(entry_time, granularity)
+    while start < exit_time:
+        end = start + step
+        seconds = (min(end, exit_time) - max(start, entry_time)).total_seconds()
+        if seconds > 0:
+            parts.append((start, seconds))
+        start = end
+    return parts
+
+
+class PresenceRollups:
+    """Compactador incremental dos LocationLogs em PresenceRollup.
+
+    A cada execução, até ROLLUP_BATCH_SIZE logs fechados e ainda não
+    consolidados (rolled_up) têm a permanência dividida por hora e por dia e
+    somada com upsert; os logs são marcados na mesma transação, então cada
+    visita entra uma única vez. Logs abertos entram quando são fechados,
+    alguns segundos após o último avistamento. Na primeira execução o
+    histórico existente é consolidado em lotes.
+    """
+
+    def __init__(self):
+        self.app = None
+        self.batch_size = 5000
+        self._rows = 0
+        self._last_run = 0.0
+
+    def init_app(self, app):
+        self.app = app
+        self.batch_size = app.config['ROLLUP_BATCH_SIZE']
+
+    def compact(self):
+        started = time.monotonic()
+        total = 0
+        with self.app.app_context():
+            while True:
+                count = self._compact_batch()
+                total += count
+                if count < self.batch_size:
+                    break
+        self._rows += total
+        self._last_run = time.monotonic() - started
+        if total:
+            logger.info(f"{total} logs de localização consolidados nos rollups em {self._last_run * 1000:.0f} ms.")
+        return total
+
+    def stats(self):
+        return {"rows": self._rows, "last_run_ms": round(self._last_run * 1000, 3)}
+
+    def _compact_batch(self):
+        logs = db.session.execute(
+            select(LocationLog.id, LocationLog.person_id, LocationLog.gateway_id,
+                   LocationLog.entry_time, LocationLog.exit_time)
+            .where(LocationLog.rolled_up.is_(False), LocationLog.exit_time.is_not(None))
+            .order_by(LocationLog.id)
+            .limit(self.batch_size)
+        ).all()
+        if not logs:
+            return 0
+
+        totals = defaultdict(lambda: [0.0, 0])  # (pessoa, gateway, granularidade, início) -> [segundos, visitas]
+        for _, person_id, gateway_id, entry_time, exit_time in logs:
+            for granularity in GRANULARITIES:
+                totals[(person_id, gateway_id, granularity, bucket_start(entry_time, granularity))][1] += 1
+                for start, seconds in split_interval(entry_time, exit_time, granularity):
+                    totals[(person_id, gateway_id, granularity, start)][0] += seconds
+
+        rows = [{
+            "person_id": person_id,
+            "gateway_id": gateway_id,
+            "granularity": granularity,
+            "bucket_start": start,
+            "dwell_seconds": seconds,
+            "visits": visits,
+        } for (person_id, gateway_id, granularity, start), (seconds, visits) in totals.items()]
+
+        try:
+            statement = _insert(db.engine.dialect.name)
+            statement = statement.on_conflict_do_update(
+                index_elements=['person_id', 'granularity', 'bucket_start', 'gateway_id'],
+                set_={
+                    "dwell_seconds": PresenceRollup.dwell_seconds + statement.excluded.dwell_seconds,
+                    "visits": PresenceRollup.visits + statement.excluded.visits,
+                }
+            )
+            db.session.execute(statement, rows)
+            db.session.execute(
+                update(LocationLog)
+                .where(LocationLog.id.in_([log.id for log in logs]))
+                .values(rolled_up=True)
+                .execution_options(synchronize_session=False)
+            )
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        return len(logs)
+
+
+def _insert(dialect_name):
+    # Upsert (ON CONFLICT DO UPDATE) com a mesma API nos dois bancos suportados
+    if dialect_name == 'postgresql':
+        return postgresql.insert(PresenceRollup)
+    return sqlite.insert(PresenceRollup)
+
+
+def occupancy(start, end, granularity, gateway_id=None, sector=None):
+    """Ocupação por gateway e intervalo: pessoas distintas, visitas, permanência e ocupação média."""
+    query = (
+        select(
+            PresenceRollup.gateway_id,
+            Gateway.name,
+            Gateway.sector,
+            PresenceRollup.bucket_start,
+            func.count(func.distinct(PresenceRollup.person_id)),
+            func.sum(PresenceRollup.visits),
+            func.sum(PresenceRollup.dwell_seconds),
+        )
+        .join(Gateway, Gateway.id == PresenceRollup.gateway_id)
+        .where(
+            PresenceRollup.granularity == granularity,
+            PresenceRollup.bucket_start >= start,
+            PresenceRollup.bucket_start < end,
+        )
+        .group_by(PresenceRollup.gateway_id, Gateway.name, Gateway.sector, PresenceRollup.bucket_start)
+        .order_by(PresenceRollup.bucket_start, PresenceRollup.gateway_id)
+    )
+    if gateway_id is not None:
+        query = query.where(PresenceRollup.gateway_id == gateway_id)
+    if sector:
+        query = query.where(Gateway.sector == sector)
+
+    bucket_seconds = GRANULARITIES[granularity].total_seconds()
+    return [{
+        "gateway_id": row_gateway_id,
+        "gateway": name,
+        "sector": row_sector,
+        "bucket_start": start_at.isoformat(),
+        "people": people,
+        "visits": visits,
+        "dwell_seconds": round(dwell, 1),
+        # Média de pessoas presentes ao longo do intervalo
+        "avg_occupancy": round(dwell / bucket_seconds, 3),
+    } for row_gateway_id, name, row_sector, start_at, people, visits, dwell in db.session.execute(query)]
+
+
+def person_dwell(person_id, start, end, granularity):
+    """Permanência de uma pessoa por intervalo e gateway, com o total por gateway."""
+    rows = db.session.execute(
+        select(PresenceRollup.bucket_start, PresenceRollup.gateway_id, Gateway.name,
+               PresenceRollup.dwell_seconds, PresenceRollup.visits)
+        .join(Gateway, Gateway.id == PresenceRollup.gateway_id)
+        .where(
+            PresenceRollup.person_id == person_id,
+            PresenceRollup.granularity == granularity,
+            PresenceRollup.bucket_start >= start,
+            PresenceRollup.bucket_start < end,
+        )
+        .order_by(PresenceRollup.bucket_start, PresenceRollup.gateway_id)
+    ).all()
+
+    buckets, totals = [], {}
+    for start_at, gateway_id, name, dwell, visits in rows:
+        buckets.append({
+            "bucket_start": start_at.isoformat(),
+            "gateway_id": gateway_id,
+            "gateway": name,
+            "dwell_seconds": round(dwell, 1),
+            "visits": visits,
+        })
+        total = totals.setdefault(gateway_id, {"gateway_id": gateway_id, "gateway": name, "dwell_seconds": 0.0, "visits": 0})
+        total["dwell_seconds"] += dwell
+        total["visits"] += visits
+    for total in totals.values():
+        total["dwell_seconds"] = round(total["dwell_seconds"], 1)
+    return {
+        "buckets": buckets,
+        "gateways": sorted(totals.values(), key=lambda total: total["dwell_seconds"], reverse=True),
+        "dwell_seconds": round(sum(total["dwell_seconds"] for total in totals.values()), 1),
+    }
+
+
+presence_rollups = PresenceRollups()
@@ -0,0 +1,530 @@
+import base64
+import hashlib
+import logging
+import os
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from urllib.parse import urlsplit, urlunsplit, unquote
+
+logger = logging.getLogger(__name__)
+
+FAILURE_CACHE_TTL = 5  # Segundos: falhas expiram antes para permitir corrigir a câmera e revalidar
+RTSP_DEFAULT_PORT = 554
+USER_AGENT = "camanager-probe"
+
+# Nomes de codec no mesmo formato do FFmpeg, para comparar com os perfis de stream
+SDP_CODECS = {"H264": "h264", "H265": "hevc", "MP4V-ES": "mpeg4", "JPEG": "mjpeg"}
+FOURCC_CODECS = {"avc1": "h264", "h264": "h264", "hev1": "hevc", "hvc1": "hevc", "h265": "hevc", "hevc": "hevc"}
+
+
+class RtspProbeError(Exception):
+    def __init__(self, kind, message=""):
+        super().__init__(message or kind)
+        self.kind = kind
+
+
+# --- Sondagem nativa: OPTIONS/DESCRIBE (e opcionalmente um pacote RTP) sem decodificar vídeo ---
+
+class _BitReader:
+    def __init__(self, data):
+        self.data = data
+        self.pos = 0
+
+    def u(self, bits):
+        value = 0
+        for _ in range(bits):
+            byte = self.data[self.pos >> 3]
+            value = (value << 1) | ((byte >> (7 - (self.pos & 7))) & 1)
+            self.pos += 1
+        return value
+
+    def ue(self):
+        zeros = 0
+        while self.u(1) == 0:
+            zeros += 1
+        return (1 << zeros) - 1 + self.u(zeros)
+
+    def se(self):
+        value = self.ue()
+        return (value + 1) // 2 if value & 1 else -(value // 2)
+
+
+def _skip_scaling_list(reader, size):
+    last, next_scale = 8, 8
+    for _ in range(size):
+        if next_scale != 0:
+            next_scale = (last + reader.se() + 256) % 256
+        last = next_scale or last
+
+
+def parse_h264_sps(nal):
+    """Extrai largura, altura e fps de um SPS H.264 (sprop-parameter-sets do SDP)."""
+    rbsp = bytearray()
+    zeros = 0
+    for byte in nal[1:]:
+        if zeros >= 2 and byte == 3:
+            zeros = 0
+            continue
+        rbsp.append(byte)
+        zeros = zeros + 1 if byte == 0 else 0
+
+    reader = _BitReader(bytes(rbsp))
+    profile_idc = reader.u(8)
+    reader.u(16)  # constraint flags e level
+    reader.ue()  # seq_parameter_set_id
+    chroma_format_idc = 1
+    if profile_idc in (100, 110, 122, 244, 44, 83, 86, 118, 128, 138, 139, 134, 135):
+        chroma_format_idc = reader.ue()
+        if chroma_format_idc == 3:
+            reader.u(1)
+        reader.ue()
+        reader.ue()
+        reader.u(1)
+        if reader.u(1):
+            for i in range(12 if chroma_format_idc == 3 else 8):
+                if reader.u(1):
+                    _skip_scaling_list(reader, 16 if i < 6 else 64)
+    reader.ue()  # log2_max_frame_num_minus4
+    poc_type = reader.ue()
+    if poc_type == 0:
+        reader.ue()
+    elif poc_type == 1:
+        reader.u(1)
+        reader.se()
+        reader.se()
+        for _ in range(reader.ue()):
+            reader.se()
+    reader.ue()  # max_num_ref_frames
+    reader.u(1)
+    width_mbs = reader.ue() + 1
+    height_map_units = reader.ue() + 1
+    frame_mbs_only = reader.u(1)
+    if not frame_mbs_only:
+        reader.u(1)
+    reader.u(1)  # direct_8x8_inference_flag
+
+    width = width_mbs * 16
+    height = (2 - frame_mbs_only) * height_map_units * 16
+    if reader.u(1):  # frame_cropping_flag
+        left, right, top, bottom = reader.ue(), reader.ue(), reader.ue(), reader.ue()
+        crop_x = 1 if chroma_format_idc in (0, 3) else 2
+        crop_y = (2 - frame_mbs_only) * (2 if chroma_format_idc == 1 else 1)
+        width -= (left + right) * crop_x
+        height -= (top + bottom) * crop_y
+
+    fps = None
+    if reader.u(1):  # vui_parameters_present_flag
+        if reader.u(1) and reader.u(8) == 255:  # aspect_ratio_info
+            reader.u(32)
+        if reader.u(1):  # overscan_info_present_flag
+            reader.u(1)
+        if reader.u(1):  # video_signal_type_present_flag
+            reader.u(4)
+            if reader.u(1):
+                reader.u(24)
+        if reader.u(1):  # chroma_loc_info_present_flag
+            reader.ue()
+            reader.ue()
+        if reader.u(1):  # timing_info_present_flag
+            num_units_in_tick = reader.u(32)
+            time_scale = reader.u(32)
+            if num_units_in_tick:
+                fps = round(time_scale / (2 * num_units_in_tick), 2)
+    return {"width": width, "height": height, "fps": fps}
+
+
+def parse_sdp(sdp):
+    """Lê codec, resolução, fps e URL de controle da primeira trilha de vídeo do SDP."""
+    info = {"codec": None, "width": None, "height": None, "fps": None, "audio_codec": None, "control": None}
+    media = None
+    video_seen = False
+    for line in sdp.splitlines():
+        line = line.strip()
+        if line.startswith("m="):
+            media = line[2:].split(" ")[0]
+            if media == "video" and video_seen:
+                media = "ignored"  # Só a primeira trilha de vídeo interessa
+            video_seen = video_seen or media == "video"
+            continue
+        if not line.startswith("a="):
+            continue
+        name, _, value = line[2:].partition(":")
+        if media == "audio" and name == "rtpmap" and not info["audio_codec"]:
+            info["audio_codec"] = value.split(" ", 1)[-1].split("/")[0].lower()
+        if media != "video":
+            continue
+        if name == "rtpmap":
+            encoding = value.split(" ", 1)[-1].split("/")[0].upper()
+            info["codec"] = SDP_CODECS.get(encoding, encoding.lower())
+        elif name in ("framerate", "x-framerate"):
+            try:
+                info["fps"] = float(value)
+            except ValueError:
+                pass
+        elif name == "x-dimensions":
+            width, _, height = value.partition(",")
+            if width.isdigit() and height.isdigit():
+                info["width"], info["height"] = int(width), int(height)
+        elif name == "control":
+            info["control"] = value
+        elif name == "fmtp" and "sprop-parameter-sets=" in value and not info["width"]:
+            sps = value.split("sprop-parameter-sets=", 1)[1].split(";")[0].split(",")[0].strip()
+            try:
+                parsed = parse_h264_sps(base64.b64decode(sps + "=" * (-len(sps) % 4)))
+                info["width"], info["height"] = parsed["width"], parsed["height"]
+                info["fps"] = info["fps"] or parsed["fps"]
+            except (ValueError, IndexError):
+                logger.debug(f"SPS H.264 não interpretável no SDP: {sps}")
+    return info
+
+
+class _RtspConnection:
+    """Conexão RTSP mínima sobre TCP, com autenticação Basic/Digest e prazo total."""
+
+    def __init__(self, rtsp_url, timeout):
+        parts = urlsplit(rtsp_url)
+        if parts.scheme != "rtsp" or not parts.hostname:
+            raise RtspProbeError("connect", f"URL RTSP inválida: {rtsp_url}")
+        self.username = unquote(parts.username or "")
+        self.password = unquote(parts.password or "")
+        host_port = parts.hostname if not parts.port else f"{parts.hostname}:{parts.port}"
+        if ":" in parts.hostname:
+            host_port = f"[{parts.hostname}]" + (f":{parts.port}" if parts.port else "")
+        self.url = urlunsplit(("rtsp", host_port, parts.path or "/", parts.query, ""))
+        self.deadline = time.monotonic() + timeout
+        self.cseq = 0
+        self.challenge = None
+        self.buffer = b""
+        self.sock = socket.create_connection((parts.hostname, parts.port or RTSP_DEFAULT_PORT), timeout=timeout)
+
+    def close(self):
+        try:
+            self.sock.close()
+        except OSError:
+            pass
+
+    def request(self, method, url=None, headers=None):
+        for attempt in range(2):
+            self.send(method, url, headers)
+            status, response_headers, body = self._read_response()
+            if status == 401 and attempt == 0 and self.username and "www-authenticate" in response_headers:
+                self.challenge = self._parse_challenge(response_headers["www-authenticate"])
+                continue
+            return status, response_headers, body
+        return status, response_headers, body
+
+    def send(self, method, url=None, headers=None):
+        """Envia uma requisição sem esperar a resposta (usado no TEARDOWN)."""
+        url = url or self.url
+        self.cseq += 1
+        lines = [f"{method} {url} RTSP/1.0", f"CSeq: {self.cseq}", f"User-Agent: {USER_AGENT}"]
+        for name, value in (headers or {}).items():
+            lines.append(f"{name}: {value}")
+        if self.challenge:
+            lines.append(f"Authorization: {self._authorization(method, url)}")
+        self.sock.sendall(("\r\n".join(lines) + "\r\n\r\n").encode("utf-8"))
+
+    def read_interleaved(self, channel=0):
+        """Lê quadros RTP intercalados ($) até encontrar um do canal pedido."""
+        while True:
+            marker = self._read_exact(1)
+            if marker != b"$":
+                # Mensagem RTSP no meio do fluxo: descarta até o fim dos cabeçalhos
+                self._read_until(b"\r\n\r\n")
+                continue
+            header = self._read_exact(3)
+            packet = self._read_exact(int.from_bytes(header[1:3], "big"))
+            if header[0] == channel:
+                return packet
+
+    def _read_response(self):
+        # Quadros RTP intercalados podem chegar antes da resposta (após o PLAY)
+        while self._peek(1) == b"$":
+            header = self._read_exact(4)
+            self._read_exact(int.from_bytes(header[2:4], "big"))
+        head = self._read_until(b"\r\n\r\n").decode("utf-8", "replace")
+        lines = head.split("\r\n")
+        status_line = lines[0].split(" ", 2)
+        if len(status_line) < 2 or not status_line[0].startswith("RTSP/") or not status_line[1].isdigit():
+            raise RtspProbeError("connect", f"Resposta não RTSP: {lines[0]}")
+        headers = {}
+        for line in lines[1:]:
+            name, _, value = line.partition(":")
+            name = name.strip().lower()
+            if name == "www-authenticate" and name in headers:
+                headers[name] += "\n" + value.strip()
+            elif name:
+                headers[name] = value.strip()
+        body = self._read_exact(int(headers.get("content-length", 0) or 0))
+        return int(status_line[1]), headers, body
+
+    def _parse_challenge(self, header):
+        challenges = header.split("\n")
+        chosen = next((c for c in challenges if c.lower().startswith("digest")), challenges[0])
+        scheme, _, params = chosen.partition(" ")
+        values = {}
+        for part in params.split(","):
+            key, _, value = part.strip().partition("=")
+            if key:
+                values[key.lower()] = value.strip().strip('"')
+        values["scheme"] = scheme.lower()
+        return values
+
+    def _authorization(self, method, url):
+        challenge = self.challenge
+        if challenge["scheme"] != "digest":
+            token = base64.b64encode(f"{self.username}:{self.password}".encode("utf-8")).decode("ascii")
+            return f"Basic {token}"
+
+        def md5(text):
+            return hashlib.md5(text.encode("utf-8")).hexdigest()
+
+        realm, nonce = challenge.get("realm", ""), challenge.get("nonce", "")
+        ha1 = md5(f"{self.username}:{realm}:{self.password}")
+        ha2 = md5(f"{method}:{url}")
+        fields = [f'username="{self.username}"', f'realm="{realm}"', f'nonce="{nonce}"', f'uri="{url}"']
+        if "auth" in challenge.get("qop", "").split(","):
+            cnonce = os.urandom(8).hex()
+            nc = f"{self.cseq:08x}"
+            response = md5(f"{ha1}:{nonce}:{nc}:{cnonce}:auth:{ha2}")
+            fields += ["qop=auth", f"nc={nc}", f'cnonce="{cnonce}"']
+        else:
+            response = md5(f"{ha1}:{nonce}:{ha2}")
+        fields.append(f'response="{response}"')
+        if "opaque" in challenge:
+            fields.append(f'opaque="{challenge["opaque"]}"')
+        return "Digest " + ", ".join(fields)
+
+    def _recv(self):
+        remaining = self.deadline - time.monotonic()
+        if remaining <= 0:
+            raise socket.timeout("prazo da sondagem RTSP esgotado")
+        self.sock.settimeout(remaining)
+        chunk = self.sock.recv(65536)
+        if not chunk:
+            raise RtspProbeError("read", "Conexão RTSP encerrada pelo servidor")
+        self.buffer += chunk
+
+    def _peek(self, size):
+        while len(self.buffer) < size:
+            self._recv()
+        return self.buffer[:size]
+
+    def _read_exact(self, size):
+        self._peek(size)
+        data, self.buffer = self.buffer[:size], self.buffer[size:]
+        return data
+
+    def _read_until(self, marker):
+        while marker not in self.buffer:
+            self._recv()
+        data, _, self.buffer = self.buffer.partition(marker)
+        return data
+
+
+def _control_url(base_url, control):
+    if not control or control == "*":
+        return base_url
+    if control.startswith("rtsp://"):
+        return control
+    return base_url.rstrip("/") + "/" + control
+
+
+def _read_packet(connection, base_url, control):
+    """SETUP intercalado no TCP, PLAY e o payload type do primeiro pacote RTP."""
+    status, headers, _ = connection.request("SETUP", url=_control_url(base_url, control), headers={
+        "Transport": "RTP/AVP/TCP;unicast;interleaved=0-1"
+    })
+    if status != 200:
+        raise RtspProbeError("read", f"SETUP respondeu {status}")
+    session = headers.get("session", "").split(";")[0]
+    status, _, _ = connection.request("PLAY", url=base_url, headers={"Session": session, "Range": "npt=0.000-"})
+    if status != 200:
+        raise RtspProbeError("read", f"PLAY respondeu {status}")
+    packet = connection.read_interleaved()
+    connection.send("TEARDOWN", url=base_url, headers={"Session": session})
+    return packet[1] & 0x7F if len(packet) > 1 else None
+
+
+def _probe_native(rtsp_url, timeout, read_packet):
+    connection = _RtspConnection(rtsp_url, timeout)
+    try:
+        status, _, _ = connection.request("OPTIONS")
+        if status == 401:
+            return {"ok": False, "error": "unauthorized"}
+
+        status, headers, body = connection.request("DESCRIBE", headers={"Accept": "application/sdp"})
+        if status == 401:
+            return {"ok": False, "error": "unauthorized"}
+        if status != 200:
+            return {"ok": False, "error": "read"}
+
+        info = parse_sdp(body.decode("utf-8", "replace"))
+        if not info["codec"]:
+            return {"ok": False, "error": "read"}
+        control = info.pop("control")
+        result = dict(info, ok=True, error=None)
+
+        if read_packet:
+            # DESCRIBE e SDP válidos já confirmam a câmera: câmera só UDP (461) ou lenta para
+            # mandar o primeiro pacote não reprova a URL, só fica o aviso
+            try:
+                result["rtp_payload_type"] = _read_packet(connection, headers.get("content-base", connection.url), control)
+            except (RtspProbeError, OSError) as e:
+                logger.warning(f"Câmera {connection.url} respondeu ao DESCRIBE mas não entregou RTP: {e}")
+                result["warning"] = "rtp"
+        return result
+    finally:
+        connection.close()
+
+
+# --- Sondagem com decodificação de um quadro (OpenCV), só quando pedida explicitamente ---
+
+def _fourcc_to_codec(fourcc):
+    fourcc = int(fourcc)
+    if not fourcc:
+        return None
+    name = "".join(chr((fourcc >> (8 * i)) & 0xFF) for i in range(4)).strip().lower()
+    return FOURCC_CODECS.get(name, name) or None
+
+
+def _probe_opencv(rtsp_url, timeout):
+    try:
+        import cv2  # Import tardio: o OpenCV só é carregado quando a decodificação é pedida
+    except ImportError:
+        return {"ok": False, "error": "decode_unavailable"}
+
+    timeout_ms = int(timeout * 1000)
+    cap = cv2.VideoCapture(rtsp_url, cv2.CAP_FFMPEG, [
+        cv2.CAP_PROP_OPEN_TIMEOUT_MSEC, timeout_ms,
+        cv2.CAP_PROP_READ_TIMEOUT_MSEC, timeout_ms,
+    ])
+    try:
+        if not cap.isOpened():
+            return {"ok": False, "error": "connect"}
+        ret, _ = cap.read()
+        if not ret:
+            return {"ok": False, "error": "read"}
+        return {
+            "ok": True,
+            "error": None,
+            "codec": _fourcc_to_codec(cap.get(cv2.CAP_PROP_FOURCC)),
+            "width": int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)) or None,
+            "height": int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)) or None,
+            "fps": round(cap.get(cv2.CAP_PROP_FPS), 2) or None,
+        }
+    finally:
+        cap.release()
+
+
+class RtspProber:
+    """Validação de URLs RTSP fora da thread da requisição.
+
+    Por padrão a sondagem é nativa: OPTIONS/DESCRIBE sobre TCP, leitura do SDP
+    e, com RTSP_PROBE_READ_PACKET, de um pacote RTP (sem ele a URL ainda passa,
+    com warning 'rtp'), sem decodificar vídeo. A decodificação de um quadro
+    pelo OpenCV só acontece quando pedida explicitamente.
+
+    As sondagens rodam num pool limitado de threads, com prazo total por
+    sondagem e um prazo rígido na espera pelo resultado, contado a partir do
+    início da sondagem (o tempo na fila do pool não conta). Resultados ficam num
+    cache curto por URL, e sondagens simultâneas da mesma URL compartilham a
+    mesma execução.
+    """
+
+    def __init__(self):
+        self.timeout = 5.0
+        self.cache_ttl = 30.0
+        self.read_packet = False
+        self._executor = None
+        self._lock = threading.Lock()
+        self._cache = {}  # (url, decode) -> (expira_em, resultado)
+        self._in_flight = {}  # (url, decode) -> Future
+        self._running = {}  # (url, decode) -> time.monotonic() do início da sondagem
+
+    def init_app(self, app):
+        self.timeout = app.config['RTSP_PROBE_TIMEOUT']
+        self.cache_ttl = app.config['RTSP_PROBE_CACHE_TTL']
+        self.read_packet = app.config['RTSP_PROBE_READ_PACKET']
+        self._executor = ThreadPoolExecutor(max_workers=app.config['RTSP_PROBE_WORKERS'], thread_name_prefix="rtsp-probe")
+
+    def probe(self, rtsp_url, decode=False):
+        return self._result(rtsp_url, decode, self._submit(rtsp_url, decode))
+
+    def probe_many(self, rtsp_urls, decode=False):
+        """Sonda várias URLs em paralelo, preservando a ordem da entrada."""
+        submitted = [(rtsp_url, self._submit(rtsp_url, decode)) for rtsp_url in rtsp_urls]
+        return [self._result(rtsp_url, decode, submission) for rtsp_url, submission in submitted]
+
+    def _submit(self, rtsp_url, decode):
+        key = (rtsp_url, decode)
+        now = time.monotonic()
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached and cached[0] > now:
+                return dict(cached[1], cached=True)
+            future = self._in_flight.get(key)
+            if future is None:
+                future = self._executor.submit(self._run, rtsp_url, decode)
+                self._in_flight[key] = future
+            return future
+
+    def _result(self, rtsp_url, decode, submission):
+        if isinstance(submission, dict):
+            return submission
+        # Prazo rígido: mesmo que a sondagem passe do timeout, a requisição não espera além
+        # dele depois que ela começou; enquanto está na fila, espera o pool liberar uma thread
+        while True:
+            with self._lock:
+                began = self._running.get((rtsp_url, decode))
+            if began is None:
+                remaining = self.timeout + 1
+            else:
+                remaining = max(0.0, self.timeout + 1 - (time.monotonic() - began))
+            try:
+                return dict(submission.result(timeout=remaining), cached=False)
+            except FutureTimeoutError:
+                if began is not None:
+                    break
+        logger.error(f"Tempo esgotado ao validar fluxo RTSP: {rtsp_url}")
+        return {"url": rtsp_url, "ok": False, "error": "timeout", "mode": "decode" if decode else "native",
+                "latency_ms": None, "cached": False}
+
+    def _run(self, rtsp_url, decode):
+        started = time.monotonic()
+        with self._lock:
+            self._running[(rtsp_url, decode)] = started
+        try:
+            if decode:
+                result = _probe_opencv(rtsp_url, self.timeout)
+            else:
+                result = _probe_native(rtsp_url, self.timeout, self.read_packet)
+        except RtspProbeError as e:
+            logger.error(f"Erro ao validar fluxo RTSP {rtsp_url}: {e}")
+            result = {"ok": False, "error": e.kind}
+        except socket.timeout:
+            result = {"ok": False, "error": "timeout"}
+        except Exception as e:
+            logger.error(f"Erro ao validar fluxo RTSP {rtsp_url}: {e}")
+            result = {"ok": False, "error": "connect"}
+        result["url"] = rtsp_url
+        result["mode"] = "decode" if decode else "native"
+        result["latency_ms"] = round((time.monotonic() - started) * 1000, 1)
+
+        ttl = self.cache_ttl if result["ok"] else min(self.cache_ttl, FAILURE_CACHE_TTL)
+        with self._lock:
+            self._cache[(rtsp_url, decode)] = (time.monotonic() + ttl, result)
+            self._in_flight.pop((rtsp_url, decode), None)
+            self._running.pop((rtsp_url, decode), None)
+            self._prune_cache()
+        return result
+
+    def _prune_cache(self):
+        now = time.monotonic()
+        for key in [key for key, (expires, _) in self._cache.items() if expires <= now]:
+            del self._cache[key]
+
+
+rtsp_prober = RtspProber()
@@ -0,0 +1,38 @@
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class BackgroundScheduler:
+    """Executa tarefas periódicas em threads daemon, uma por tarefa."""
+
+    def __init__(self):
+        self._jobs = []
+        self._threads = []
+        self._stopping = threading.Event()
+
+    def add_job(self, func, interval, name=None):
+        self._jobs.append((func, interval, name or func.__name__))
+
+    def start(self):
+        for func, interval, name in self._jobs:
+            thread = threading.Thread(target=self._run_job, args=(func, interval, name), name=name, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+            logger.info(f"Tarefa periódica '{name}' agendada a cada {interval}s.")
+
+    def shutdown(self, timeout=5):
+        self._stopping.set()
+        for thread in self._threads:
+            thread.join(timeout=timeout)
+
+    def _run_job(self, func, interval, name):
+        while not self._stopping.wait(interval):
+            try:
+                func()
+            except Exception as e:
+                logger.error(f"Erro na tarefa periódica '{name}': {e}")
+
+
+scheduler = BackgroundScheduler()
@@ -0,0 +1,45 @@
+import argparse
+import logging
+import signal
+import threading
+
+from app import create_app, start_deployment_services, stop_deployment_services
+
+logger = logging.getLogger(__name__)
+
+
+def run_services():
+    """Processo de serviços da implantação, iniciado uma única vez pelo master do gunicorn.
+
+    Sobe o ingest MQTT (processos por partição ou um pipeline neste processo,
+    conforme INGEST_MODE), os jobs de manutenção do banco e o dono
+    dos streams (reconciliação, monitor de saúde e streams sob demanda). Os
+    workers WSGI só atendem requisições, então escalar WEB_CONCURRENCY não
+    duplica ingest nem jobs. No SIGTERM para tudo isso sem derrubar os
+    contêineres FFmpeg, que a próxima reconciliação reaproveita.
+    """
+    create_app(migrate_schema=False)
+    stopping = threading.Event()
+    signal.signal(signal.SIGINT, lambda signal_received, frame: stopping.set())
+    signal.signal(signal.SIGTERM, lambda signal_received, frame: stopping.set())
+
+    start_deployment_services()
+    logger.info("Processo de serviços iniciado.")
+    stopping.wait()
+
+    logger.info("Encerrando processo de serviços; streams continuam no ar.")
+    stop_deployment_services()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Serviços de fundo do camanager (ingest, manutenção e streams)")
+    parser.add_argument('command', nargs='?', choices=('run', 'migrate', 'vacuum'), default='run')
+    args = parser.parse_args()
+    if args.command == 'migrate':
+        create_app()
+    elif args.command == 'vacuum':
+        # Conversão única do SQLite para auto_vacuum incremental; segura o banco, rode com a API parada
+        from retention import location_log_retention
+        location_log_retention.enable_incremental_vacuum()
+    else:
+        run_services()
@@ -21,6 +21,23 @@ docker build -t $FFMPEG_IMAGE_NAME -f Dockerfile.ffmpeg .
 
 echo "===== Imagens construídas com sucesso ====="
 
+# Opcional: saída HLS em RAM (HLS_TMPFS=true). O tamanho é o mesmo "required_bytes" de
+# GET /api/streams/stats: câmeras cadastradas x janela da playlist x bitrate, mais
+# HLS_TMPFS_CAMERAS câmeras ainda não cadastradas com o perfil padrão. HLS_TMPFS_SIZE
+# (ex.: 512m) fixa o tamanho à mão.
+if [ "$HLS_TMPFS" = "true" ] && [ -z "$HLS_TMPFS_SIZE" ]; then
+  HLS_TMPFS_SIZE=$(docker run --rm -v "$PWD":/app $APP_IMAGE_NAME python stream_storage.py --extra "${HLS_TMPFS_CAMERAS:-0}")
+fi
+if [ -n "$HLS_TMPFS_SIZE" ] && [ -n "$CAMERAS_OUTPUT_DIR" ]; then
+  echo "===== Montando tmpfs de $HLS_TMPFS_SIZE em $CAMERAS_OUTPUT_DIR ====="
+  mkdir -p "$CAMERAS_OUTPUT_DIR"
+  if mountpoint -q "$CAMERAS_OUTPUT_DIR"; then
+    mount -o remount,size=$HLS_TMPFS_SIZE "$CAMERAS_OUTPUT_DIR"
+  else
+    mount -t tmpfs -o size=$HLS_TMPFS_SIZE,mode=0777 tmpfs "$CAMERAS_OUTPUT_DIR"
+  fi
+fi
+
 echo "===== Iniciando o Docker Compose ====="
 
 # Rodar o docker-compose
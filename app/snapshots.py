@@ -0,0 +1,132 @@
+import hashlib
+import logging
+import os
+import subprocess
+import threading
+import time
+from collections import OrderedDict
+
+from config import Config
+from stream_health import parse_media_playlist
+from stream_profiles import media_playlist
+
+logger = logging.getLogger(__name__)
+
+
+class SnapshotCache:
+    """Miniaturas JPEG das câmeras, extraídas do segmento HLS mais recente.
+
+    Cada segmento começa em um keyframe, então o FFmpeg decodifica só o
+    primeiro quadro (-skip_frame nokey) do último segmento da playlist, sem
+    abrir a câmera de novo. As imagens ficam num LRU limitado a
+    SNAPSHOT_CACHE_SIZE câmeras; dentro de SNAPSHOT_TTL a imagem é servida
+    direto do cache, e depois disso só é extraída de novo se houver segmento
+    novo. Sem segmento (stream parado) a última imagem continua sendo servida.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # camera_id -> dict(jpeg, etag, segment, checked_at, modified_at)
+        self._extracting = {}  # camera_id -> threading.Lock
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, camera_id):
+        """Entrada com jpeg, etag e modified_at (epoch do segmento), ou None se não há imagem."""
+        entry = self._cached(camera_id, fresh=True)
+        if entry is not None:
+            return entry
+
+        with self._lock:
+            lock = self._extracting.setdefault(camera_id, threading.Lock())
+        with lock:
+            # Outra requisição pode ter extraído enquanto esperávamos
+            entry = self._cached(camera_id, fresh=True)
+            if entry is not None:
+                return entry
+            self.misses += 1
+            return self._refresh(camera_id)
+
+    def forget(self, camera_id):
+        with self._lock:
+            self._entries.pop(camera_id, None)
+            self._extracting.pop(camera_id, None)
+
+    def stats(self):
+        with self._lock:
+            return {"cameras": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+    def _cached(self, camera_id, fresh):
+        with self._lock:
+            entry = self._entries.get(camera_id)
+            if entry is None or (fresh and time.monotonic() - entry["checked_at"] >= Config.SNAPSHOT_TTL):
+                return None
+            self._entries.move_to_end(camera_id)
+            self.hits += 1
+            return entry
+
+    def _refresh(self, camera_id):
+        with self._lock:
+            previous = self._entries.get(camera_id)
+        segment = _newest_segment(camera_id)
+        if segment is None or (previous and previous["segment"] == segment):
+            if previous:
+                previous["checked_at"] = time.monotonic()
+            return previous
+
+        path, mtime = segment
+        jpeg = _extract_keyframe(path)
+        if jpeg is None:
+            return previous
+        entry = {
+            "jpeg": jpeg,
+            "etag": hashlib.sha1(jpeg).hexdigest()[:16],
+            "segment": segment,
+            "checked_at": time.monotonic(),
+            "modified_at": mtime,
+        }
+        with self._lock:
+            self._entries[camera_id] = entry
+            self._entries.move_to_end(camera_id)
+            while len(self._entries) > Config.SNAPSHOT_CACHE_SIZE:
+                evicted, _ = self._entries.popitem(last=False)
+                self._extracting.pop(evicted, None)
+        return entry
+
+
+def _newest_segment(camera_id):
+    # (caminho, mtime) do último segmento da playlist: o FFmpeg só o lista depois de fechado,
+    # enquanto o .ts mais novo em disco ainda está sendo gravado
+    directory = f"{Config.FFMPEG_LOCAL_OUTPUT_DIR}/{camera_id}"
+    playlist = media_playlist(directory)
+    if playlist is None:
+        return None
+    _, _, segments = parse_media_playlist(playlist[1])
+    if not segments:
+        return None
+    path = f"{directory}/{segments[-1][0]}"
+    try:
+        return path, os.stat(path).st_mtime
+    except FileNotFoundError:
+        # Segmento removido pelo delete_segments
+        return None
+
+
+def _extract_keyframe(path):
+    command = [
+        Config.FFMPEG_BINARY, "-v", "error", "-skip_frame", "nokey", "-i", path,
+        "-frames:v", "1", "-vf", f"scale={Config.SNAPSHOT_WIDTH}:-2", "-q:v", str(Config.SNAPSHOT_QUALITY),
+        "-f", "image2", "-c:v", "mjpeg", "pipe:1"
+    ]
+    try:
+        result = subprocess.run(command, capture_output=True, timeout=Config.SNAPSHOT_TIMEOUT)
+    except (OSError, subprocess.TimeoutExpired) as e:
+        logger.error(f"Erro ao extrair snapshot de {path}: {e}")
+        return None
+    if result.returncode != 0 or not result.stdout:
+        logger.warning(f"FFmpeg não gerou snapshot de {path}: {result.stderr.decode(errors='replace').strip()[-200:]}")
+        return None
+    return result.stdout
+
+
+snapshots = SnapshotCache()
@@ -0,0 +1,86 @@
+import json
+import logging
+import os
+import threading
+import time
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+RECHECK_INTERVAL = 0.5  # Segundos em que uma leitura reaproveita o último stat do arquivo
+
+
+class StatusBoard:
+    """Estado de observabilidade compartilhado entre processos.
+
+    Ingest, reconciliação e monitor de saúde rodam no processo de serviços e
+    nos processos de ingest, mas as rotas de estatísticas são atendidas pelos
+    workers WSGI. Cada dono grava periodicamente um JSON em STATUS_DIR
+    (arquivo temporário + os.replace, então o leitor nunca vê um arquivo pela
+    metade) e os workers leem esse arquivo, relendo só quando o mtime muda.
+    Publicações mais velhas que STATUS_MAX_AGE (dono parado ou caído) são
+    ignoradas.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._cache = {}  # nome -> (verificado em, mtime_ns, dados)
+
+    def publish(self, name, data):
+        os.makedirs(Config.STATUS_DIR, exist_ok=True)
+        path = _path(name)
+        temporary = f"{path}.{os.getpid()}.tmp"
+        with open(temporary, "w", encoding="utf-8") as f:
+            json.dump({"published_at": time.time(), "data": data}, f, default=str)
+        os.replace(temporary, path)
+
+    def read(self, name, max_age=None):
+        """Dados publicados com o nome, ou None se não há publicação recente."""
+        max_age = Config.STATUS_MAX_AGE if max_age is None else max_age
+        now = time.monotonic()
+        with self._lock:
+            cached = self._cache.get(name)
+        if cached and now - cached[0] < RECHECK_INTERVAL:
+            entry = cached[2]
+        else:
+            entry = self._load(name, cached, now)
+        if entry is None or time.time() - entry["published_at"] > max_age:
+            return None
+        return entry["data"]
+
+    def read_all(self, prefix, max_age=None):
+        """{nome: dados} de todas as publicações recentes cujo nome começa com prefix."""
+        try:
+            names = [name[:-len(".json")] for name in os.listdir(Config.STATUS_DIR)
+                     if name.startswith(prefix) and name.endswith(".json")]
+        except FileNotFoundError:
+            return {}
+        published = {name: self.read(name, max_age) for name in sorted(names)}
+        return {name: data for name, data in published.items() if data is not None}
+
+    def _load(self, name, cached, now):
+        try:
+            mtime = os.stat(_path(name)).st_mtime_ns
+        except FileNotFoundError:
+            entry, mtime = None, None
+        else:
+            if cached and cached[1] == mtime:
+                entry = cached[2]
+            else:
+                try:
+                    with open(_path(name), encoding="utf-8") as f:
+                        entry = json.load(f)
+                except (OSError, ValueError) as e:
+                    logger.warning(f"Estado '{name}' ilegível: {e}")
+                    entry, mtime = None, None
+        with self._lock:
+            self._cache[name] = (now, mtime, entry)
+        return entry
+
+
+def _path(name):
+    return os.path.join(Config.STATUS_DIR, f"{name}.json")
+
+
+status_board = StatusBoard()
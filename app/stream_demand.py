@@ -0,0 +1,155 @@
+import logging
+import os
+import re
+import time
+
+from config import Config
+from models import db, Camera
+from stream_profiles import hls_window, media_playlist_mtime
+
+logger = logging.getLogger(__name__)
+
+STREAM_PATH_RE = re.compile(r"^/streams/(\d+)/")  # /streams/<camera_id>/stream.m3u8, segmentos...
+TOUCH_INTERVAL = 1.0  # Segundos entre atualizações do marcador de uma câmera
+RETRY_AFTER = 10.0  # Segundos antes de tentar de novo um start que falhou
+
+
+class StreamDemand:
+    """Liga o FFmpeg de uma câmera só enquanto alguém assiste (STREAM_ON_DEMAND).
+
+    O nginx consulta /api/streams/access (auth_request) a cada playlist ou
+    segmento pedido em /streams/<id>/. O pedido renova o mtime de um arquivo
+    marcador em STREAM_DEMAND_DIR, visível para todos os processos (workers
+    WSGI e processo de serviços). O reconciliador, dono dos streams, confere
+    os marcadores (due()) a cada STREAM_REQUEST_POLL: sobe o worker das
+    câmeras com espectador e para o das que estão sem pedidos há
+    STREAM_IDLE_TIMEOUT segundos. Enquanto a playlist não existe ou está
+    velha, o pedido espera ela ser gravada, para o player não receber 404.
+    Câmeras fixadas (pinned) ficam sempre ligadas.
+    """
+
+    def __init__(self):
+        self.app = None
+        self._touched = {}  # camera_id -> time.monotonic() da última atualização do marcador
+        self._requested = {}  # camera_id -> time.monotonic() do último start pedido ao reconciliador
+
+    @property
+    def enabled(self):
+        return Config.STREAM_ON_DEMAND
+
+    def init_app(self, app):
+        self.app = app
+
+    def start(self):
+        if not self.enabled:
+            return
+        os.makedirs(Config.STREAM_DEMAND_DIR, exist_ok=True)
+        logger.info(f"Streams sob demanda: workers ociosos param após {Config.STREAM_IDLE_TIMEOUT:g}s.")
+
+    def wanted(self, camera):
+        """Se o worker da câmera deve estar rodando agora."""
+        if not self.enabled or camera.pinned:
+            return True
+        last = _last_access(camera.id)
+        return last is not None and time.time() - last < Config.STREAM_IDLE_TIMEOUT
+
+    def access(self, uri):
+        """Registra um pedido em /streams/; retorna False se a câmera não existe."""
+        match = STREAM_PATH_RE.match(uri or "")
+        if not match:
+            return True
+        camera_id = int(match.group(1))
+        live = not self.enabled or _playlist_fresh(camera_id)
+        if not live:
+            with self.app.app_context():
+                if db.session.get(Camera, camera_id) is None:
+                    return False
+        now = time.monotonic()
+        if now - self._touched.get(camera_id, 0.0) >= TOUCH_INTERVAL:
+            self._touched[camera_id] = now
+            _touch(camera_id)
+        if live:
+            return True
+        # O dono dos streams vê o marcador e sobe o worker; o pedido espera a playlist nova
+        _wait_for_playlist(camera_id, time.time(), Config.STREAM_ACTIVATION_TIMEOUT)
+        return True
+
+    def due(self):
+        """Câmeras cujo worker deve subir (espectador novo) ou parar (ociosa).
+
+        Só o reconciliador sobe e para workers e grava container_id; ele chama
+        isto a cada volta e reconcilia quando a resposta não é vazia. Um start
+        que não vingou só é pedido de novo após RETRY_AFTER segundos.
+        """
+        if not self.enabled:
+            return set()
+        now = time.monotonic()
+        due = set()
+        with self.app.app_context():
+            for camera in Camera.query.all():
+                if not self.wanted(camera):
+                    if camera.container_id:
+                        logger.info(f"Câmera {camera.name} sem espectadores há {Config.STREAM_IDLE_TIMEOUT:g}s; parando stream.")
+                        due.add(camera.id)
+                elif camera.container_id:
+                    self._requested.pop(camera.id, None)
+                elif now - self._requested.get(camera.id, -RETRY_AFTER) >= RETRY_AFTER:
+                    logger.info(f"Espectador na câmera {camera.name}; iniciando stream.")
+                    self._requested[camera.id] = now
+                    due.add(camera.id)
+        return due
+
+    def stats(self):
+        now = time.time()
+        viewed = {}
+        try:
+            with os.scandir(Config.STREAM_DEMAND_DIR) as entries:
+                for entry in entries:
+                    if entry.name.isdigit():
+                        viewed[int(entry.name)] = round(now - entry.stat().st_mtime, 1)
+        except FileNotFoundError:
+            pass
+        return {"enabled": self.enabled, "idle_timeout": Config.STREAM_IDLE_TIMEOUT, "viewed": viewed}
+
+
+def _marker(camera_id):
+    return os.path.join(Config.STREAM_DEMAND_DIR, str(camera_id))
+
+
+def _touch(camera_id):
+    path = _marker(camera_id)
+    try:
+        os.utime(path)
+    except FileNotFoundError:
+        os.makedirs(Config.STREAM_DEMAND_DIR, exist_ok=True)
+        open(path, "a").close()
+
+
+def _last_access(camera_id):
+    try:
+        return os.stat(_marker(camera_id)).st_mtime
+    except FileNotFoundError:
+        return None
+
+
+def _playlist_fresh(camera_id):
+    # Playlist de mídia regravada há menos de três segmentos: o stream está no ar
+    segment_time, _ = hls_window(Config.HLS_LOW_LATENCY)
+    mtime = media_playlist_mtime(f"{Config.FFMPEG_LOCAL_OUTPUT_DIR}/{camera_id}")
+    return mtime is not None and time.time() - mtime < 3 * segment_time
+
+
+def _wait_for_playlist(camera_id, started, timeout):
+    # Segura o pedido até o FFmpeg gravar a playlist, para o player não receber 404
+    directory = f"{Config.FFMPEG_LOCAL_OUTPUT_DIR}/{camera_id}"
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        mtime = media_playlist_mtime(directory)
+        if mtime is not None and mtime >= started:
+            return True
+        time.sleep(0.2)
+    logger.warning(f"Playlist da câmera {camera_id} não apareceu em {timeout:g}s.")
+    return False
+
+
+stream_demand = StreamDemand()
@@ -0,0 +1,353 @@
+import ctypes
+import ctypes.util
+import logging
+import os
+import select
+import statistics
+import struct
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+from config import Config
+from models import Camera
+from ffmpeg_manager import backend, list_streams
+from stream_profiles import media_playlist, media_playlist_mtime
+from stream_demand import stream_demand
+from stream_reconciler import stream_reconciler
+from status_board import status_board
+
+logger = logging.getLogger(__name__)
+
+# Constantes de inotify(7)
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE_SELF = 0x00000400
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = os.O_CLOEXEC
+EVENT_HEADER = struct.Struct("iIII")
+
+ARRIVALS_KEPT = 20  # Segmentos usados na média de intervalo e bitrate
+
+
+class _Inotify:
+    """inotify via libc (ctypes), sem dependência extra; None fora do Linux."""
+
+    def __init__(self):
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self._libc = libc
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1")
+
+    @classmethod
+    def create(cls):
+        try:
+            return cls()
+        except (OSError, AttributeError) as e:
+            logger.warning(f"inotify indisponível ({e}); o monitor de streams vai usar polling.")
+            return None
+
+    def add_watch(self, path, mask):
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(path), mask)
+        if wd < 0:
+            raise OSError(ctypes.get_errno(), f"inotify_add_watch {path}")
+        return wd
+
+    def read(self, timeout):
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return []
+        try:
+            data = os.read(self.fd, 65536)
+        except BlockingIOError:
+            return []
+        events, offset = [], 0
+        while offset < len(data):
+            wd, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = data[offset:offset + length].rstrip(b"\0").decode("utf-8", "replace")
+            offset += length
+            events.append((wd, mask, name))
+        return events
+
+    def close(self):
+        os.close(self.fd)
+
+
+class _CameraHealth:
+    def __init__(self, camera_id):
+        self.camera_id = camera_id
+        self.state = "starting"
+        self.since = time.monotonic()  # Início do estado atual / do último (re)start
+        self.last_update = None  # Última atualização da playlist (relógio)
+        self.last_segment_at = None  # Chegada do segmento mais novo (monotônico)
+        self.media_sequence = None
+        self.target_duration = None
+        self.segments = set()
+        self.arrivals = deque(maxlen=ARRIVALS_KEPT)  # (chegada, duração, bytes)
+        self.latency = None
+        self.restarts = 0
+        self.backoff = Config.STREAM_HEALTH_RESTART_BACKOFF
+        self.next_restart = 0.0
+
+    def to_dict(self):
+        now = time.monotonic()
+        intervals = [b[0] - a[0] for a, b in zip(self.arrivals, list(self.arrivals)[1:])]
+        duration = sum(arrival[1] for arrival in self.arrivals)
+        return {
+            "state": self.state,
+            "media_sequence": self.media_sequence,
+            "last_segment_age_s": round(now - self.last_segment_at, 1) if self.last_segment_at else None,
+            "segment_interval_s": round(statistics.fmean(intervals), 2) if intervals else None,
+            "segment_jitter_s": round(statistics.pstdev(intervals), 2) if len(intervals) > 1 else None,
+            "bitrate_kbps": round(sum(arrival[2] for arrival in self.arrivals) * 8 / duration / 1000) if duration else None,
+            "latency_s": round(self.latency, 2) if self.latency is not None else None,
+            "restarts": self.restarts,
+        }
+
+
+def parse_media_playlist(text):
+    """Sequência, duração alvo e segmentos [(nome, duração, program_date_time)] de uma playlist HLS."""
+    sequence, target, segments = 0, None, []
+    duration, date_time = None, None
+    for line in text.splitlines():
+        line = line.strip()
+        if line.startswith("#EXT-X-MEDIA-SEQUENCE:"):
+            sequence = int(line.split(":", 1)[1])
+        elif line.startswith("#EXT-X-TARGETDURATION:"):
+            target = float(line.split(":", 1)[1])
+        elif line.startswith("#EXTINF:"):
+            duration = float(line.split(":", 1)[1].split(",", 1)[0])
+        elif line.startswith("#EXT-X-PROGRAM-DATE-TIME:"):
+            try:
+                date_time = datetime.fromisoformat(line.split(":", 1)[1].replace("Z", "+00:00")).timestamp()
+            except ValueError:
+                date_time = None
+        elif line and not line.startswith("#"):
+            segments.append((line, duration or 0.0, date_time))
+            duration, date_time = None, None
+    return sequence, target, segments
+
+
+class StreamHealthMonitor:
+    """Acompanha a saída HLS de cada câmera e reinicia streams travados.
+
+    A thread do monitor recebe, via inotify, as gravações de stream.m3u8 e dos
+    segmentos em FFMPEG_LOCAL_OUTPUT_DIR/<id> (com polling do mtime quando
+    inotify não está disponível). Cada atualização da playlist registra os
+    segmentos novos: intervalo de chegada, bitrate (tamanho / EXTINF), avanço
+    da media sequence e atraso em relação ao EXT-X-PROGRAM-DATE-TIME. Uma
+    câmera sem segmento novo por STREAM_HEALTH_STALL_FACTOR durações de
+    segmento fica 'stalled'; se o worker sumiu (contêiner removido pelo
+    auto_remove) fica 'missing'. Nos dois casos o stream é reiniciado pelo
+    reconciliador, com backoff exponencial por câmera.
+    """
+
+    def __init__(self):
+        self.app = None
+        self._lock = threading.Lock()
+        self._health = {}  # camera_id -> _CameraHealth
+        self._watches = {}  # wd -> camera_id (None para o diretório raiz)
+        self._watched = set()
+        self._inotify = None
+        self._stopping = threading.Event()
+        self._thread = None
+
+    def init_app(self, app):
+        self.app = app
+
+    def start(self):
+        if self._thread is not None:
+            return
+        os.makedirs(Config.FFMPEG_LOCAL_OUTPUT_DIR, exist_ok=True)
+        self._inotify = _Inotify.create()
+        if self._inotify:
+            self._watches[self._inotify.add_watch(Config.FFMPEG_LOCAL_OUTPUT_DIR, IN_CREATE)] = None
+            # Streams já no ar (subidos pela reconciliação) não geram IN_CREATE
+            for name in os.listdir(Config.FFMPEG_LOCAL_OUTPUT_DIR):
+                if name.isdigit():
+                    self._watch(int(name))
+        self._thread = threading.Thread(target=self._run, name="stream-health", daemon=True)
+        self._thread.start()
+        logger.info(f"Monitor de streams iniciado ({'inotify' if self._inotify else 'polling'}).")
+
+    def stop(self):
+        self._stopping.set()
+
+    def health(self, camera_id):
+        if self._thread is None:
+            # Monitor rodando no processo de serviços: usa o estado que ele publica
+            return (status_board.read("stream-health") or {}).get(str(camera_id))
+        with self._lock:
+            health = self._health.get(camera_id)
+            return health.to_dict() if health else None
+
+    def snapshot(self):
+        with self._lock:
+            return {camera_id: health.to_dict() for camera_id, health in self._health.items()}
+
+    def _run(self):
+        last_check = 0.0
+        while not self._stopping.is_set():
+            if self._inotify:
+                for wd, mask, name in self._inotify.read(timeout=1.0):
+                    self._on_event(wd, mask, name)
+            else:
+                self._stopping.wait(1.0)
+                self._poll()
+            now = time.monotonic()
+            if now - last_check >= Config.STREAM_HEALTH_CHECK_INTERVAL:
+                last_check = now
+                try:
+                    self._check()
+                    status_board.publish("stream-health", self.snapshot())
+                except Exception as e:
+                    logger.error(f"Erro na verificação de saúde dos streams: {e}")
+
+    def _on_event(self, wd, mask, name):
+        camera_id = self._watches.get(wd)
+        if mask & IN_IGNORED:
+            # Diretório removido (câmera excluída)
+            self._watches.pop(wd, None)
+            self._watched.discard(camera_id)
+            return
+        if camera_id is None:
+            if mask & IN_ISDIR and name.isdigit():
+                self._watch(int(name))
+            return
+        if name.endswith(".m3u8"):
+            self._on_playlist(camera_id)
+
+    def _watch(self, camera_id):
+        if not self._inotify or camera_id in self._watched:
+            return
+        try:
+            wd = self._inotify.add_watch(f"{Config.FFMPEG_LOCAL_OUTPUT_DIR}/{camera_id}",
+                                         IN_CLOSE_WRITE | IN_MOVED_TO | IN_DELETE_SELF)
+        except OSError:
+            return
+        self._watches[wd] = camera_id
+        self._watched.add(camera_id)
+        self._on_playlist(camera_id)
+
+    def _poll(self):
+        with self._lock:
+            cameras = list(self._health.values())
+        for health in cameras:
+            mtime = media_playlist_mtime(f"{Config.FFMPEG_LOCAL_OUTPUT_DIR}/{health.camera_id}")
+            if mtime is None:
+                continue
+            if health.last_update is None or mtime > health.last_update:
+                self._on_playlist(health.camera_id)
+
+    def _on_playlist(self, camera_id):
+        directory = f"{Config.FFMPEG_LOCAL_OUTPUT_DIR}/{camera_id}"
+        playlist = media_playlist(directory)
+        if playlist is None:
+            return
+        sequence, target, segments = parse_media_playlist(playlist[1])
+
+        now, wall = time.monotonic(), time.time()
+        with self._lock:
+            health = self._health.get(camera_id)
+            if health is None:
+                return
+            health.last_update = wall
+            health.target_duration = target
+            known, health.segments = health.segments, {name for name, _, _ in segments}
+            if health.media_sequence is not None and sequence + len(segments) <= health.media_sequence:
+                return
+            for name, duration, date_time in segments:
+                if name in known:
+                    continue
+                try:
+                    size = os.stat(f"{directory}/{name}").st_size
+                except FileNotFoundError:
+                    size = 0
+                health.arrivals.append((now, duration, size))
+                health.last_segment_at = now
+                if date_time is not None:
+                    health.latency = max(0.0, wall - (date_time + duration))
+            health.media_sequence = sequence + len(segments)
+            if health.state != "healthy" and health.last_segment_at and health.last_segment_at >= health.since:
+                health.state = "healthy"
+                health.since = now
+
+    def _check(self):
+        with self.app.app_context():
+            cameras = {camera.id: stream_demand.wanted(camera) for camera in Camera.query.all()}
+        workers = list_streams()
+        now = time.monotonic()
+
+        restart = []
+        with self._lock:
+            for camera_id in list(self._health):
+                if camera_id not in cameras:
+                    del self._health[camera_id]
+            for camera_id, wanted in cameras.items():
+                health = self._health.get(camera_id)
+                if health is None:
+                    health = self._health[camera_id] = _CameraHealth(camera_id)
+                if not wanted:
+                    # Parado de propósito pelo modo sob demanda
+                    if health.state != "idle":
+                        health.state = "idle"
+                        health.since = now
+                    continue
+                if health.state == "idle":
+                    # Religado por um espectador: conta a carência de início a partir de agora
+                    health.state = "starting"
+                    health.since = now
+                worker = workers.get(camera_id)
+                segment = (health.target_duration or Config.HLS_SEGMENT_TIME)
+                stall_after = max(Config.STREAM_HEALTH_STALL_FACTOR * segment, Config.STREAM_HEALTH_MIN_STALL)
+                reference = max(health.last_segment_at or 0.0, health.since)
+
+                if worker is None or worker["state"] not in ("running", "restarting"):
+                    state = "missing"
+                elif now - reference > max(stall_after, Config.STREAM_HEALTH_STARTUP_GRACE if health.state == "starting" else 0):
+                    state = "stalled"
+                else:
+                    if health.state == "healthy" and now - health.since > Config.FFMPEG_RESTART_STABLE:
+                        health.backoff = Config.STREAM_HEALTH_RESTART_BACKOFF
+                    continue
+                if health.state != state:
+                    logger.warning(f"Stream da câmera {camera_id}: {health.state} -> {state}.")
+                    health.state = state
+                # Backends que se autorrecuperam (multiplexado) cuidam das próprias falhas de saída
+                if state == "stalled" and getattr(backend, "self_healing", False):
+                    continue
+                if now >= health.next_restart:
+                    health.next_restart = now + health.backoff
+                    health.backoff = min(health.backoff * 2, Config.STREAM_HEALTH_RESTART_BACKOFF_MAX)
+                    restart.append(camera_id)
+
+        # Diretórios criados antes do watch da raiz ou de um diretório recriado
+        for camera_id in cameras:
+            if camera_id not in self._watched:
+                self._watch(camera_id)
+
+        for camera_id in restart:
+            self._restart(camera_id)
+
+    def _restart(self, camera_id):
+        # Só o reconciliador sobe e para workers: o reinício entra na fila dele
+        logger.info(f"Pedindo reinício do stream da câmera {camera_id}.")
+        stream_reconciler.request(camera_id)
+        with self._lock:
+            health = self._health.get(camera_id)
+            if health:
+                health.restarts += 1
+                health.state = "starting"
+                health.since = time.monotonic()
+                # O novo FFmpeg recomeça a numeração da playlist e dos segmentos
+                health.media_sequence = None
+                health.segments = set()
+
+
+stream_health = StreamHealthMonitor()
@@ -0,0 +1,215 @@
+import os
+import re
+
+from config import Config
+
+STREAM_PROFILES = ('auto', 'passthrough', 'transcode')
+PASSTHROUGH_CODECS = {'h264'}  # Codecs que os navegadores tocam em HLS sem reencodar
+X264_PRESETS = ('ultrafast', 'superfast', 'veryfast', 'faster', 'fast', 'medium', 'slow', 'slower', 'veryslow')
+X264_TUNES = ('film', 'animation', 'grain', 'stillimage', 'fastdecode', 'zerolatency')
+
+RESOLUTION_RE = re.compile(r"^(?:(\d{2,5})x)?(\d{2,5})$")  # "1280x720" ou só a altura, "720"
+BITRATE_RE = re.compile(r"^\d+[kKmM]?$")
+
+
+def _split(value):
+    return [item.strip() for item in (value or '').split(',') if item.strip()]
+
+
+def parse_ladder(resolutions, bitrates):
+    """Converte as listas "1280x720,640x360" e "2000k,600k" em renditions.
+
+    As listas são pareadas por posição; a mais curta é completada com None
+    (resolução da origem ou bitrate livre).
+    """
+    sizes, rates = _split(resolutions), _split(bitrates)
+    renditions = []
+    for i in range(max(len(sizes), len(rates))):
+        size = sizes[i] if i < len(sizes) else None
+        match = RESOLUTION_RE.match(size) if size else None
+        renditions.append({
+            "width": int(match.group(1)) if match and match.group(1) else None,
+            "height": int(match.group(2)) if match else None,
+            "bitrate": rates[i].lower() if i < len(rates) else None,
+        })
+    return renditions
+
+
+def stream_settings_error(data, source_codec=None):
+    """Valida os campos de perfil de uma requisição; retorna a mensagem de erro ou None."""
+    profile = data.get('stream_profile')
+    if profile is not None and profile not in STREAM_PROFILES:
+        return f"Perfil de stream inválido. Use um de: {', '.join(STREAM_PROFILES)}"
+    if profile == 'passthrough' and source_codec and source_codec not in PASSTHROUGH_CODECS:
+        return f"O codec de origem ({source_codec}) não permite passthrough; use 'transcode'"
+    if data.get('encoder_preset') and data['encoder_preset'] not in X264_PRESETS:
+        return f"Preset x264 inválido. Use um de: {', '.join(X264_PRESETS)}"
+    if data.get('encoder_tune') and data['encoder_tune'] not in X264_TUNES:
+        return f"Tune x264 inválido. Use um de: {', '.join(X264_TUNES)}"
+    if any(not RESOLUTION_RE.match(size) for size in _split(data.get('resolutions'))):
+        return "Resoluções inválidas. Use, por exemplo, '1280x720,640x360' ou '720,360'"
+    if any(not BITRATE_RE.match(rate) for rate in _split(data.get('bitrates'))):
+        return "Bitrates inválidos. Use, por exemplo, '2000k,600k'"
+    return None
+
+
+def resolve_profile(stream_profile, source_codec, preset=None, tune=None, resolutions=None, bitrates=None):
+    """Perfil efetivo de uma câmera.
+
+    'auto' escolhe passthrough (-c:v copy) quando o codec sondado já é
+    compatível com o navegador e nenhuma escada de resolução/bitrate foi
+    pedida; caso contrário reencoda com x264.
+    """
+    ladder = parse_ladder(resolutions, bitrates)
+    stream_profile = stream_profile or 'auto'
+    if stream_profile == 'auto':
+        passthrough = source_codec in PASSTHROUGH_CODECS and not ladder
+    else:
+        passthrough = stream_profile == 'passthrough'
+    low_latency = Config.HLS_LOW_LATENCY
+    if passthrough:
+        return {"mode": "copy", "low_latency": low_latency}
+    return {
+        "mode": "x264",
+        "preset": preset or Config.STREAM_X264_PRESET,
+        # Em baixa latência o x264 não segura quadros para lookahead/B-frames
+        "tune": tune or Config.STREAM_X264_TUNE or ('zerolatency' if low_latency else None),
+        "renditions": ladder or [{"width": None, "height": None, "bitrate": None}],
+        "low_latency": low_latency,
+    }
+
+
+def profile_for(camera):
+    return resolve_profile(camera.stream_profile, camera.source_codec, camera.encoder_preset,
+                           camera.encoder_tune, camera.resolutions, camera.bitrates)
+
+
+def profile_label(profile):
+    """Nome curto do perfil efetivo, usado para agrupar o custo de CPU."""
+    if profile["mode"] == "copy":
+        return "passthrough"
+    renditions = "+".join(f"{_size(r)}@{r['bitrate'] or 'auto'}" for r in profile["renditions"])
+    return f"x264/{profile['preset']}{'/' + profile['tune'] if profile['tune'] else ''}/{renditions}"
+
+
+def _size(rendition):
+    if not rendition["height"]:
+        return "origem"
+    return f"{rendition['width']}x{rendition['height']}" if rendition["width"] else f"{rendition['height']}p"
+
+
+def _scale(rendition):
+    # -2 mantém a proporção com largura par, exigida pelo x264
+    return f"{rendition['width'] or -2}:{rendition['height']}"
+
+
+def _rate_args(rendition, index=None):
+    if not rendition["bitrate"]:
+        return []
+    suffix = f":{index}" if index is not None else ""
+    bitrate = rendition["bitrate"]
+    number, unit = int(re.match(r"\d+", bitrate).group()), bitrate.lstrip("0123456789")
+    return [f"-b:v{suffix}", bitrate, f"-maxrate{suffix}", bitrate, f"-bufsize{suffix}", f"{number * 2}{unit}"]
+
+
+def hls_window(low_latency):
+    """(duração do segmento em segundos, segmentos na playlist) do modo escolhido."""
+    if low_latency:
+        return Config.HLS_LL_SEGMENT_TIME, Config.HLS_LL_LIST_SIZE
+    return Config.HLS_SEGMENT_TIME, Config.HLS_LIST_SIZE
+
+
+def ffmpeg_input_args(profile):
+    # Sem buffer de entrada no modo de baixa latência: o quadro vai direto para o encoder
+    return ["-fflags", "nobuffer"] if profile.get("low_latency") else []
+
+
+def ffmpeg_output_args(profile, output_dir, input_index=None):
+    """Argumentos de codificação e saída HLS para o perfil efetivo.
+
+    input_index mapeia explicitamente a entrada de um comando com várias
+    câmeras (worker multiplexado); sem ele o FFmpeg usa a única entrada.
+
+    Ao reencodar, os keyframes são forçados a cada segmento (e o scene cut
+    desligado) para que os segmentos tenham exatamente HLS_SEGMENT_TIME; em
+    passthrough os cortes seguem o GOP da câmera. O muxer hls do FFmpeg não
+    gera partes LL-HLS (EXT-X-PART), então o modo de baixa latência usa
+    segmentos curtos e gravação atômica (temp_file). EXT-X-PROGRAM-DATE-TIME
+    vai em todos os modos para o monitor de saúde medir a latência.
+    """
+    segment_time, list_size = hls_window(profile.get("low_latency"))
+    flags = "delete_segments+independent_segments+program_date_time"
+    if profile.get("low_latency"):
+        flags += "+temp_file"
+    hls = ["-f", "hls", "-hls_time", f"{segment_time:g}", "-hls_list_size", str(list_size), "-hls_flags", flags]
+    audio = ["-c:a", "aac", "-b:a", "32k"]
+    source = input_index or 0
+    maps = ["-map", f"{source}:v:0", "-map", f"{source}:a:0?"] if input_index is not None else []
+
+    if profile["mode"] == "copy":
+        return [*maps, "-c:v", "copy", *audio, *hls, f"{output_dir}/stream.m3u8"]
+
+    x264 = [
+        "-preset", profile["preset"], *(["-tune", profile["tune"]] if profile["tune"] else []),
+        "-force_key_frames", f"expr:gte(t,n_forced*{segment_time:g})", "-sc_threshold", "0"
+    ]
+    renditions = profile["renditions"]
+    if len(renditions) == 1:
+        rendition = renditions[0]
+        scale = ["-vf", f"scale={_scale(rendition)}"] if rendition["height"] else []
+        return [*maps, "-c:v", "libx264", *x264, *scale, *_rate_args(rendition), *audio, *hls, f"{output_dir}/stream.m3u8"]
+
+    # Escada de bitrates: um decode, um scale por rendition e uma playlist master
+    # (stream.m3u8) apontando para stream_0.m3u8, stream_1.m3u8...; as variantes
+    # são só de vídeo, já que nem toda câmera tem áudio para mapear em cada uma.
+    # Os rótulos do grafo levam o índice da entrada: no worker multiplexado os
+    # grafos de todas as câmeras ficam no mesmo comando e não podem se repetir
+    label = f"c{source}v"
+    outputs = "".join(f"[{label}{i}]" for i in range(len(renditions)))
+    filters = [f"[{source}:v]split={len(renditions)}{outputs}"]
+    args = []
+    for i, rendition in enumerate(renditions):
+        if rendition["height"]:
+            filters.append(f"[{label}{i}]scale={_scale(rendition)}[{label}{i}o]")
+        else:
+            filters.append(f"[{label}{i}]null[{label}{i}o]")
+        args += ["-map", f"[{label}{i}o]", f"-c:v:{i}", "libx264", *_rate_args(rendition, i)]
+    return [
+        "-filter_complex", ";".join(filters), *args, *x264, *hls,
+        "-master_pl_name", "stream.m3u8",
+        "-var_stream_map", " ".join(f"v:{i}" for i in range(len(renditions))),
+        f"{output_dir}/stream_%v.m3u8"
+    ]
+
+
+def media_playlist(output_dir):
+    """(caminho, texto) da playlist de mídia de uma saída HLS, ou None se ela ainda não existe.
+
+    Na escada de bitrates stream.m3u8 é a playlist master, gravada uma vez só;
+    os segmentos (e o mtime que acompanha o stream) estão na primeira variante.
+    """
+    path = f"{output_dir}/stream.m3u8"
+    try:
+        with open(path) as f:
+            text = f.read()
+        if "#EXT-X-STREAM-INF" in text:
+            variant = next((line.strip() for line in text.splitlines() if line.strip() and not line.startswith("#")), None)
+            if variant is None:
+                return None
+            path = f"{output_dir}/{variant}"
+            with open(path) as f:
+                text = f.read()
+    except FileNotFoundError:
+        return None
+    return path, text
+
+
+def media_playlist_mtime(output_dir):
+    """mtime da playlist de mídia (ver media_playlist), ou None."""
+    playlist = media_playlist(output_dir)
+    if playlist is None:
+        return None
+    try:
+        return os.stat(playlist[0]).st_mtime
+    except FileNotFoundError:
+        return None
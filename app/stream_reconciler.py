@@ -0,0 +1,256 @@
+import logging
+import os
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from config import Config
+from models import db, Camera
+from rtsp_probe import rtsp_prober
+from stream_profiles import profile_for
+from stream_demand import stream_demand
+from stream_storage import output_storage
+from status_board import status_board
+from ffmpeg_manager import (
+    backend, cpu_usage, ensure_backend, list_streams, segment_watcher, start_stream, stop_stream, stream_spec
+)
+
+logger = logging.getLogger(__name__)
+
+SERVER_WAIT_TIMEOUT = 30  # Segundos esperando o servidor HTTP antes de reconciliar mesmo assim
+
+
+class StreamReconciler:
+    """Alinha os contêineres FFmpeg com as câmeras do banco após o início da API.
+
+    Os contêineres ffmpeg_* são listados em uma única chamada ao Docker e
+    comparados com as câmeras: contêineres em execução com a mesma
+    configuração (label de spec) são mantidos, os demais são recriados, e
+    contêineres de câmeras removidas são parados. No modo sob demanda as
+    câmeras não fixadas e sem espectador ficam paradas. Starts e stops rodam
+    em um pool limitado; o banco só é tocado pela thread do reconciliador.
+
+    Depois da primeira reconciliação a thread atende os pedidos de request():
+    as rotas de câmeras rodam nos workers WSGI, que não são donos dos workers
+    FFmpeg (os backends 'process' e 'multiplexed' guardam estado no processo),
+    então só gravam o banco e deixam um marcador por câmera em
+    STREAM_REQUEST_DIR, que o processo de serviços consome e reconcilia. O
+    monitor de saúde (reinícios) e o modo sob demanda (stream_demand.due())
+    também passam por esta thread, então starts, stops e a gravação de
+    container_id de uma câmera nunca correm em paralelo.
+    """
+
+    def __init__(self):
+        self.app = None
+        self.workers = 4
+        self._thread = None
+        self._stopping = threading.Event()
+        self._last = {}
+
+    def init_app(self, app):
+        self.app = app
+        self.workers = app.config['FFMPEG_RECONCILE_WORKERS']
+
+    def start(self, wait_for=None, then=None):
+        """Reconcilia em segundo plano; wait_for=(host, porta) espera a API aceitar conexões.
+
+        then é chamado ao fim da primeira reconciliação, com ou sem erro.
+        """
+        self._thread = threading.Thread(target=self._run, args=(wait_for, then), name="stream-reconciler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopping.set()
+
+    def request(self, camera_id):
+        """Pede ao dono dos streams que aplique a câmera criada, alterada ou removida.
+
+        Chamado depois do commit: a reconciliação lê o banco já atualizado e
+        reinicia o worker da câmera (que pode ter mudado de URL, perfil ou
+        agrupamento, ou travado), sobe o de uma câmera nova ou para o de uma
+        removida.
+        """
+        os.makedirs(Config.STREAM_REQUEST_DIR, exist_ok=True)
+        open(os.path.join(Config.STREAM_REQUEST_DIR, str(camera_id)), "a").close()
+
+    def _run(self, wait_for, then):
+        if wait_for:
+            _wait_for_server(*wait_for)
+        self._reconcile_safely(_take_requests())
+        if then:
+            then()
+        while not self._stopping.wait(Config.STREAM_REQUEST_POLL):
+            requested = _take_requests()
+            if requested:
+                logger.info(f"Reconciliação pedida para as câmeras {sorted(requested)}.")
+            try:
+                demanded = stream_demand.due()
+            except Exception as e:
+                logger.error(f"Erro ao conferir os streams sob demanda: {e}")
+                demanded = set()
+            if requested or demanded:
+                self._reconcile_safely(requested)
+
+    def _reconcile_safely(self, restart=()):
+        try:
+            self.reconcile(restart)
+        except Exception as e:
+            logger.error(f"Erro na reconciliação dos contêineres FFmpeg: {e}")
+
+    def reconcile(self, restart=()):
+        """Alinha os workers com o banco; as câmeras em restart são recriadas mesmo com a mesma configuração."""
+        started = time.monotonic()
+        existing = list_streams()
+
+        with self.app.app_context():
+            self._probe_unknown_codecs()
+            all_cameras = Camera.query.all()
+            cameras = {
+                camera.id: (camera.name, camera.rtsp_url, profile_for(camera), camera.agrupamento)
+                for camera in all_cameras
+            }
+            # No modo sob demanda só as câmeras fixadas (ou já assistidas) sobem agora
+            idle = {camera.id for camera in all_cameras if not stream_demand.wanted(camera)}
+
+        kept, to_start, to_stop = [], [], []
+        for camera_id, (name, rtsp_url, profile, group) in cameras.items():
+            container = existing.get(camera_id)
+            if camera_id in idle:
+                if container:
+                    to_stop.append(container["id"])
+                continue
+            if (camera_id not in restart and container and container["state"] == "running"
+                    and container["spec"] == stream_spec(camera_id, rtsp_url, profile)):
+                kept.append((camera_id, container["id"]))
+                continue
+            if container:
+                # Parado, em erro ou com configuração antiga: recriar
+                to_stop.append(container["id"])
+            to_start.append((camera_id, name, rtsp_url, profile, group))
+        orphans = [container["id"] for camera_id, container in existing.items() if camera_id not in cameras]
+        for camera_id in set(restart) - cameras.keys():
+            # Câmera removida pela API
+            segment_watcher.forget(camera_id)
+        if to_start:
+            # Sem a imagem nenhum start funcionaria: falha uma vez, antes de parar contêineres
+            ensure_backend()
+
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="ffmpeg-reconcile") as pool:
+            list(pool.map(stop_stream, to_stop + orphans))
+            futures = {
+                pool.submit(start_stream, camera_id, name, rtsp_url, profile, group): camera_id
+                for camera_id, name, rtsp_url, profile, group in to_start
+            }
+            started_ids, failed = {}, []
+            for future in as_completed(futures):
+                camera_id = futures[future]
+                try:
+                    started_ids[camera_id] = future.result()
+                except Exception as e:
+                    failed.append(camera_id)
+                    logger.error(f"Erro ao iniciar contêiner FFmpeg para câmera {camera_id}: {e}")
+
+        self._save_container_ids(dict(kept), started_ids, idle)
+        self._last = {
+            "kept": len(kept),
+            "started": len(started_ids),
+            "idle": len(idle),
+            "failed": len(failed),
+            "orphans_stopped": len(orphans),
+            "duration_ms": round((time.monotonic() - started) * 1000, 1),
+        }
+        logger.info(f"Reconciliação FFmpeg concluída: {self._last}")
+
+        storage = output_storage([profile for _, _, profile, _ in cameras.values()])
+        if storage["ram_backed"] and not storage["sufficient"]:
+            logger.warning(f"O tmpfs de saída HLS ({storage['capacity_bytes']} bytes) é menor que o necessário "
+                           f"para {storage['cameras']} câmeras ({storage['required_bytes']} bytes).")
+        return self._last
+
+    def _probe_unknown_codecs(self):
+        # Câmeras em 'auto' cadastradas antes da sondagem de codec: descobre se cabem em passthrough
+        cameras = Camera.query.filter(
+            Camera.source_codec.is_(None),
+            db.or_(Camera.stream_profile.is_(None), Camera.stream_profile == 'auto')
+        ).all()
+        if not cameras:
+            return
+        results = rtsp_prober.probe_many([camera.rtsp_url for camera in cameras])
+        for camera, result in zip(cameras, results):
+            codec = result.get("codec")
+            if codec:
+                camera.source_codec = codec
+        db.session.commit()
+
+    def _save_container_ids(self, kept, started_ids, idle=()):
+        with self.app.app_context():
+            for camera in Camera.query.filter(Camera.id.in_(idle)).all():
+                camera.container_id = None
+            for camera_id, container_id in {**kept, **started_ids}.items():
+                camera = db.session.get(Camera, camera_id)
+                if camera is None:
+                    # Câmera removida durante a reconciliação
+                    stop_stream(container_id)
+                elif camera.container_id != container_id:
+                    camera.container_id = container_id
+            db.session.commit()
+
+    def stats(self):
+        return dict(self._last)
+
+    def status(self):
+        """Última reconciliação, tempos de start e workers; fora do dono dos streams, o publicado por ele."""
+        if self._thread is None:
+            return status_board.read("streams") or {}
+        return {
+            "reconcile": self.stats(),
+            "start_timings": segment_watcher.timings(),
+            "workers": list_streams(),
+        }
+
+    def publish_status(self):
+        status = self.status()
+        if getattr(backend, "local", False):
+            # Só o processo pai dos workers FFmpeg consegue medir a CPU deles
+            status["cpu"] = cpu_usage(worker["id"] for worker in status["workers"].values())
+        status_board.publish("streams", status)
+
+    def cpu_usage(self, worker_ids):
+        """{worker_id: % de CPU}, medido aqui ou, para workers filhos do processo de serviços, o publicado por ele."""
+        if self._thread is None and getattr(backend, "local", False):
+            published = (status_board.read("streams") or {}).get("cpu", {})
+            return {worker_id: published.get(worker_id) for worker_id in worker_ids}
+        return cpu_usage(worker_ids)
+
+
+def _take_requests():
+    # Marcadores removidos antes de reconciliar: um pedido feito durante a reconciliação fica para a próxima
+    requested = set()
+    try:
+        with os.scandir(Config.STREAM_REQUEST_DIR) as entries:
+            for entry in entries:
+                if entry.name.isdigit():
+                    requested.add(int(entry.name))
+                    try:
+                        os.remove(entry.path)
+                    except FileNotFoundError:
+                        pass
+    except FileNotFoundError:
+        pass
+    return requested
+
+
+def _wait_for_server(host, port, timeout=SERVER_WAIT_TIMEOUT):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection((host, port), timeout=1):
+                return True
+        except OSError:
+            time.sleep(0.2)
+    logger.warning(f"Servidor HTTP não respondeu em {timeout}s; reconciliando mesmo assim.")
+    return False
+
+
+stream_reconciler = StreamReconciler()
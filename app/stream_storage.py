@@ -0,0 +1,107 @@
+import argparse
+import os
+
+from config import Config
+from stream_profiles import hls_window, resolve_profile
+
+SIZE_MARGIN = 1.25  # Folga sobre a estimativa (bitrate de pico, playlists, arquivos temporários)
+
+
+def parse_bitrate(value):
+    """'2000k' / '2m' / '2000000' em bits por segundo."""
+    value = str(value).strip().lower()
+    multiplier = {'k': 1000, 'm': 1000 * 1000}.get(value[-1:], 1)
+    return int(value.rstrip('km')) * multiplier
+
+
+def window_bytes(profile):
+    """Espaço ocupado pelos segmentos de uma câmera com o perfil efetivo.
+
+    O muxer mantém a janela da playlist, mais um segmento aguardando remoção
+    (delete_segments) e o que está sendo gravado.
+    """
+    segment_time, list_size = hls_window(profile.get("low_latency"))
+    default = parse_bitrate(Config.HLS_ESTIMATED_BITRATE)
+    if profile["mode"] == "copy":
+        video = default
+    else:
+        video = sum(parse_bitrate(r["bitrate"]) if r["bitrate"] else default for r in profile["renditions"])
+    bits_per_second = video + 32000  # Áudio AAC a 32k
+    return int((list_size + 2) * segment_time * bits_per_second / 8)
+
+
+def required_bytes(profiles):
+    """Tamanho necessário do diretório de saída: câmeras × janela da playlist × bitrate, com folga."""
+    return int(sum(window_bytes(profile) for profile in profiles) * SIZE_MARGIN)
+
+
+def _mount_of(path):
+    # Ponto de montagem mais específico que contém o caminho, a partir de /proc/mounts
+    path = os.path.realpath(path)
+    best = ("", None)
+    try:
+        with open("/proc/mounts") as f:
+            for line in f:
+                _, mountpoint, fstype = line.split()[:3]
+                if (path == mountpoint or path.startswith(mountpoint.rstrip('/') + '/')) and len(mountpoint) > len(best[0]):
+                    best = (mountpoint, fstype)
+    except FileNotFoundError:
+        pass
+    return best
+
+
+def output_storage(profiles, path=None):
+    """Capacidade do diretório de saída HLS comparada ao necessário para as câmeras.
+
+    Com o diretório em tmpfs os segmentos não tocam o disco; o tamanho
+    necessário cresce com câmeras × janela da playlist × bitrate.
+    """
+    path = path or Config.FFMPEG_LOCAL_OUTPUT_DIR
+    required = required_bytes(profiles)
+    mountpoint, fstype = _mount_of(path)
+    try:
+        stat = os.statvfs(path)
+        capacity, free = stat.f_blocks * stat.f_frsize, stat.f_bavail * stat.f_frsize
+    except FileNotFoundError:
+        capacity = free = None
+    return {
+        "path": path,
+        "mountpoint": mountpoint or None,
+        "filesystem": fstype,
+        "ram_backed": fstype in ("tmpfs", "ramfs"),
+        "cameras": len(profiles),
+        "required_bytes": required,
+        "capacity_bytes": capacity,
+        "free_bytes": free,
+        "sufficient": capacity is None or capacity >= required,
+    }
+
+
+def _registered_profiles():
+    # Perfis das câmeras cadastradas, com o mesmo banco da API
+    from flask import Flask
+    from sqlalchemy.exc import OperationalError
+    from database import init_db
+    from models import Camera
+    from stream_profiles import profile_for
+
+    app = Flask(__name__)
+    app.config.from_object(Config)
+    init_db(app)
+    with app.app_context():
+        try:
+            return [profile_for(camera) for camera in Camera.query.all()]
+        except OperationalError:
+            return []  # Banco ainda não criado
+
+
+if __name__ == '__main__':
+    # Usado pelo setup.sh para dimensionar o tmpfs da saída HLS
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Bytes necessários no diretório de saída HLS")
+    parser.add_argument('--extra', type=int, default=0, help="Câmeras ainda não cadastradas, com o perfil padrão")
+    args = parser.parse_args()
+    default_profile = resolve_profile(None, None, None, None, None, None)
+    print(required_bytes(_registered_profiles() + [default_profile] * args.extra))
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Os módulos da aplicação ficam soltos em app/ (import config, import listing...): rode com python -m pytest de app/
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,299 @@
+import json
+import os
+import queue
+import socketserver
+import subprocess
+import sys
+import threading
+import time
+
+import paho.mqtt.client as mqtt
+import pytest
+
+from config import Config
+from gateway_simulator import beacon_mac, gateway_mac
+from ingest import merge_stats
+from ingest_benchmark import prepare_database
+from presence import GatewayPeopleManager
+from presence_sync import PresenceConsumer
+from status_board import StatusBoard
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PARTITIONS = 2
+GATEWAYS = 8  # crc32 dos MACs do simulador divide estes 8 gateways em 4 + 4 com duas partições
+BEACONS = 400
+DURATION = 4.0  # Segundos de carga por rodada
+WARMUP = 1.0  # Segundos de carga antes de começar a medir
+PRESENCE_TOPIC = "camanager/presence"
+
+# Tipos de pacote do MQTT 3.1.1
+CONNECT, PUBLISH, SUBSCRIBE, UNSUBSCRIBE, PINGREQ, DISCONNECT = 1, 3, 8, 10, 12, 14
+
+
+def _matches(topic_filter, topic):
+    parts, levels = topic_filter.split("/"), topic.split("/")
+    for index, part in enumerate(parts):
+        if part == "#":
+            return True
+        if index >= len(levels) or part not in ("+", levels[index]):
+            return False
+    return len(parts) == len(levels)
+
+
+def _length(value):
+    encoded = bytearray()
+    while True:
+        value, digit = divmod(value, 128)
+        encoded.append(digit | (0x80 if value else 0))
+        if not value:
+            return bytes(encoded)
+
+
+def _string(data, offset):
+    size = int.from_bytes(data[offset:offset + 2], "big")
+    return data[offset + 2:offset + 2 + size].decode("utf-8"), offset + 2 + size
+
+
+def _publish_packet(topic, payload, retain=False):
+    body = len(topic.encode()).to_bytes(2, "big") + topic.encode() + payload
+    return bytes([PUBLISH << 4 | int(retain)]) + _length(len(body)) + body
+
+
+class _Session(socketserver.BaseRequestHandler):
+    """Uma conexão do broker: lê pacotes nesta thread e escreve por uma fila com descarte, como o QoS 0 do mosquitto."""
+
+    def setup(self):
+        self.outbox = queue.Queue(maxsize=2000)
+        self.writer = threading.Thread(target=self._write, daemon=True)
+        self.writer.start()
+
+    def send(self, packet, droppable=False):
+        if droppable:
+            try:
+                self.outbox.put_nowait(packet)
+            except queue.Full:
+                pass
+        else:
+            self.outbox.put(packet)
+
+    def _write(self):
+        while True:
+            packet = self.outbox.get()
+            if packet is None:
+                return
+            try:
+                self.request.sendall(packet)
+            except OSError:
+                return
+
+    def _read(self, size):
+        data = b""
+        while len(data) < size:
+            chunk = self.request.recv(size - len(data))
+            if not chunk:
+                raise ConnectionError
+            data += chunk
+        return data
+
+    def handle(self):
+        broker = self.server
+        try:
+            while True:
+                first = self._read(1)[0]
+                size, shift = 0, 0
+                while True:
+                    digit = self._read(1)[0]
+                    size += (digit & 0x7F) << shift
+                    shift += 7
+                    if not digit & 0x80:
+                        break
+                data = self._read(size)
+                kind = first >> 4
+                if kind == CONNECT:
+                    self.send(b"\x20\x02\x00\x00")
+                elif kind == PUBLISH:
+                    topic, offset = _string(data, 0)
+                    qos = (first >> 1) & 3
+                    if qos:
+                        self.send(b"\x40\x02" + data[offset:offset + 2])
+                        offset += 2
+                    broker.publish(topic, data[offset:], retain=bool(first & 1))
+                elif kind == SUBSCRIBE:
+                    offset, filters = 2, []
+                    while offset < len(data):
+                        topic_filter, offset = _string(data, offset)
+                        filters.append(topic_filter)
+                        offset += 1
+                    self.send(bytes([0x90]) + _length(2 + len(filters)) + data[:2] + b"\x00" * len(filters))
+                    broker.subscribe(self, filters)
+                elif kind == UNSUBSCRIBE:
+                    offset, filters = 2, []
+                    while offset < len(data):
+                        topic_filter, offset = _string(data, offset)
+                        filters.append(topic_filter)
+                    broker.unsubscribe(self, filters)
+                    self.send(b"\xb0\x02" + data[:2])
+                elif kind == PINGREQ:
+                    self.send(b"\xd0\x00")
+                elif kind == DISCONNECT:
+                    return
+        except (ConnectionError, OSError):
+            pass
+
+    def finish(self):
+        self.server.unsubscribe(self)
+        self.outbox.put(None)
+
+
+class _Broker(socketserver.ThreadingTCPServer):
+    """Broker MQTT 3.1.1 mínimo: QoS 0, mensagens retidas e curingas + e #."""
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), _Session)
+        self.lock = threading.Lock()
+        self.exact = {}  # tópico -> sessões
+        self.wildcards = {}  # filtro com curinga -> sessões
+        self.retained = {}
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def subscribed(self, topic):
+        with self.lock:
+            return bool(self.exact.get(topic))
+
+    def subscribe(self, session, filters):
+        with self.lock:
+            for topic_filter in filters:
+                table = self.wildcards if "+" in topic_filter or "#" in topic_filter else self.exact
+                table.setdefault(topic_filter, set()).add(session)
+            retained = [(topic, payload) for topic, payload in self.retained.items()
+                        if any(_matches(topic_filter, topic) for topic_filter in filters)]
+        for topic, payload in retained:
+            session.send(_publish_packet(topic, payload, retain=True))
+
+    def unsubscribe(self, session, filters=None):
+        with self.lock:
+            for table in (self.exact, self.wildcards):
+                for topic_filter in list(table) if filters is None else filters:
+                    table.get(topic_filter, set()).discard(session)
+
+    def publish(self, topic, payload, retain=False):
+        with self.lock:
+            if retain:
+                self.retained[topic] = payload
+            sessions = set(self.exact.get(topic, ()))
+            for topic_filter, subscribers in self.wildcards.items():
+                if _matches(topic_filter, topic):
+                    sessions |= subscribers
+        packet = _publish_packet(topic, payload)
+        for session in sessions:
+            session.send(packet, droppable=True)
+
+
+def _wait(condition, timeout):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.05)
+    return False
+
+
+def _processed():
+    # Instância nova a cada leitura: sem o cache de mtime do status_board
+    return merge_stats(StatusBoard().read_all("ingest-"))["processed"]
+
+
+def _run(directory, partitions):
+    """Uma rodada: broker, processos de ingest, simulador e a presença juntada como no processo da API."""
+    database_uri = f"sqlite:///{directory}/ingest.db"
+    prepare_database(database_uri, GATEWAYS, BEACONS)
+    env = dict(os.environ, SQLALCHEMY_DATABASE_URI=database_uri, STATUS_DIR=f"{directory}/status",
+               STATUS_INTERVAL="0.1", MQTT_BROKER="127.0.0.1", MQTT_PRESENCE_TOPIC=PRESENCE_TOPIC)
+    broker = _Broker()
+    threading.Thread(target=broker.serve_forever, daemon=True).start()
+    env["MQTT_PORT"] = str(broker.port)
+
+    GatewayPeopleManager()._init_state()
+    consumer = PresenceConsumer(PRESENCE_TOPIC)
+    client = mqtt.Client()
+    client.on_connect = lambda client, *args: consumer.subscribe(client)
+    client.on_message = lambda client, userdata, msg: consumer.on_message(msg)
+
+    log = open(f"{directory}/workers.log", "w")
+    workers = [
+        subprocess.Popen([sys.executable, os.path.join(APP_DIR, "ingest_worker.py"),
+                          "--partition", str(partition), "--partitions", str(partitions)],
+                         cwd=directory, env=env, stdout=log, stderr=subprocess.STDOUT)
+        for partition in range(partitions)
+    ]
+    try:
+        with pytest.MonkeyPatch.context() as patch:
+            patch.setattr(Config, "STATUS_DIR", env["STATUS_DIR"])
+            # QoS 0: mensagens publicadas antes das assinaturas se perderiam
+            topics = [f"/gw/{gateway_mac(index)}/status" for index in range(GATEWAYS)]
+            assert _wait(lambda: all(broker.subscribed(topic) for topic in topics), timeout=30), \
+                open(f"{directory}/workers.log").read()
+
+            simulator = subprocess.Popen(
+                [sys.executable, os.path.join(APP_DIR, "gateway_simulator.py"), "--broker", "127.0.0.1",
+                 "--port", str(broker.port), "--gateways", str(GATEWAYS), "--beacons", str(BEACONS),
+                 "--per-message", str(BEACONS // GATEWAYS), "--interval", "0", "--duration", str(DURATION),
+                 "--disjoint"],
+                cwd=directory, stdout=subprocess.DEVNULL)
+            time.sleep(WARMUP)
+            before, started = _processed(), time.monotonic()
+            time.sleep(DURATION - WARMUP - 0.5)
+            after, elapsed = _processed(), time.monotonic() - started
+            simulator.wait(timeout=30)
+
+            client.connect("127.0.0.1", broker.port)
+            client.loop_start()
+            expected = {
+                gateway_mac(index): {beacon_mac(beacon) for beacon in range(index, BEACONS, GATEWAYS)}
+                for index in range(GATEWAYS)
+            }
+
+            def presence():
+                return {gateway: {person["ibeacon_mac"] for person in people}
+                        for gateway, people in GatewayPeopleManager().get_all_data().items()}
+
+            # Antes do BUFFER_TIME vencer: todos ainda presentes no gateway que os viu
+            _wait(lambda: presence() == expected, timeout=3)
+            return {"rate": (after - before) / elapsed, "presence": presence(), "expected": expected}
+    finally:
+        client.loop_stop()
+        client.disconnect()
+        for worker in workers:
+            worker.terminate()
+        for worker in workers:
+            try:
+                worker.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                worker.kill()
+        log.close()
+        broker.shutdown()
+        broker.server_close()
+
+
+@pytest.fixture(scope="module")
+def runs(tmp_path_factory):
+    return {partitions: _run(tmp_path_factory.mktemp(f"ingest-{partitions}"), partitions)
+            for partitions in (1, PARTITIONS)}
+
+
+@pytest.mark.parametrize("partitions", [1, PARTITIONS])
+def test_merged_presence_matches(runs, partitions):
+    assert runs[partitions]["presence"] == runs[partitions]["expected"]
+
+
+@pytest.mark.skipif((os.cpu_count() or 1) < PARTITIONS + 2,
+                    reason="processos de ingest, broker e simulador disputariam os mesmos núcleos")
+def test_throughput_rises_with_partitions(runs):
+    assert runs[1]["rate"] > 0
+    assert runs[PARTITIONS]["rate"] > 1.3 * runs[1]["rate"], {n: round(run["rate"]) for n, run in runs.items()}
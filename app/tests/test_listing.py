@@ -0,0 +1,124 @@
+import json
+from datetime import datetime, timedelta
+
+import pytest
+from flask import Flask
+from sqlalchemy import insert
+
+from listing import field, list_rows
+from models import db, Gateway, LocationLog, Person
+from retention import LocationLogRetention
+
+FIELDS = {
+    "id": field(Gateway.id),
+    "name": field(Gateway.name),
+    "mac": field(Gateway.mac, value=lambda row: row.mac.upper()),
+}
+
+
+@pytest.fixture
+def client():
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+    db.init_app(app)
+
+    @app.route('/gateways')
+    def gateways():
+        return list_rows(FIELDS, Gateway.id)
+
+    @app.route('/gateways/envelope')
+    def gateways_envelope():
+        return list_rows(FIELDS, Gateway.id, where=(Gateway.id > 2,), envelope=("gateways", {"total": 3}))
+
+    with app.app_context():
+        db.create_all()
+        db.session.add_all([Gateway(name=f"gw-{index}", mac=f"aa:bb:cc:dd:ee:{index:02x}") for index in range(1, 6)])
+        db.session.commit()
+        yield app.test_client()
+
+
+def test_list_without_parameters_returns_everything(client):
+    response = client.get('/gateways')
+    assert [row["id"] for row in response.json] == [1, 2, 3, 4, 5]
+    assert "X-Next-Cursor" not in response.headers
+
+
+def test_cursor_pages_follow_the_key(client):
+    first = client.get('/gateways?limit=2&fields=name')
+    assert first.json == [{"name": "gw-1"}, {"name": "gw-2"}]
+    assert first.headers["X-Next-Cursor"] == "2"
+    assert "after=2" in first.headers["Link"] and "fields=name" in first.headers["Link"]
+
+    second = client.get(f'/gateways?limit=2&fields=name&after={first.headers["X-Next-Cursor"]}')
+    assert second.json == [{"name": "gw-3"}, {"name": "gw-4"}]
+
+    last = client.get('/gateways?limit=2&after=4')
+    assert [row["id"] for row in last.json] == [5]
+    assert "X-Next-Cursor" not in last.headers
+
+
+def test_field_value_function(client):
+    assert client.get('/gateways?fields=mac&limit=1').json == [{"mac": "AA:BB:CC:DD:EE:01"}]
+
+
+def test_invalid_parameters(client):
+    assert client.get('/gateways?fields=name,serial').status_code == 400
+    assert client.get('/gateways?limit=0').status_code == 400
+    assert client.get('/gateways?stream=csv').status_code == 400
+
+
+def test_streaming_formats(client):
+    rows = client.get('/gateways?stream=json&fields=id').get_data(as_text=True)
+    assert json.loads(rows) == [{"id": index} for index in range(1, 6)]
+
+    lines = client.get('/gateways?stream=ndjson&fields=id&after=3').get_data(as_text=True).splitlines()
+    assert [json.loads(line) for line in lines] == [{"id": 4}, {"id": 5}]
+
+
+def test_envelope_plain_and_streamed(client):
+    expected = {"total": 3, "gateways": [{"id": 3}, {"id": 4}, {"id": 5}]}
+    assert client.get('/gateways/envelope?fields=id').json == expected
+    assert json.loads(client.get('/gateways/envelope?fields=id&stream=json').get_data(as_text=True)) == expected
+
+
+@pytest.fixture
+def history():
+    # Histórico do gateway 1: dois logs arquivados em janeiro e dois ainda na tabela principal
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+    db.init_app(app)
+    retention = LocationLogRetention()
+    retention.init_app(app)
+
+    @app.route('/gateways/<int:gateway_id>/people')
+    def gateway_people(gateway_id):
+        logs = retention.gateway_logs(gateway_id)
+        return list_rows({"id": field(logs.c.person_id), "name": field(Person.name)}, logs.c.id,
+                         join=db.join(logs, Person, logs.c.person_id == Person.id))
+
+    with app.app_context():
+        db.create_all()
+        db.session.add_all([Gateway(name="gw-1", mac="aa"), Gateway(name="gw-2", mac="bb")])
+        db.session.add_all([Person(name=f"p-{index}", ibeacon_mac=f"c3:{index:02x}") for index in range(1, 5)])
+        db.session.flush()
+        entry = datetime(2024, 1, 10)
+        archive = retention._partition("location_log_archive_202401")
+        db.session.execute(insert(archive), [
+            {"id": log_id, "person_id": person_id, "gateway_id": gateway_id, "entry_time": entry,
+             "exit_time": entry + timedelta(minutes=5), "duration": timedelta(minutes=5)}
+            for log_id, person_id, gateway_id in ((1, 1, 1), (2, 2, 2), (3, 2, 1))
+        ])
+        db.session.add_all([LocationLog(id=10, person_id=3, gateway_id=1), LocationLog(id=11, person_id=4, gateway_id=2),
+                            LocationLog(id=12, person_id=4, gateway_id=1)])
+        db.session.commit()
+        yield app.test_client()
+
+
+def test_gateway_history_includes_archived_partitions(history):
+    assert history.get('/gateways/1/people').json == [
+        {"id": 1, "name": "p-1"}, {"id": 2, "name": "p-2"}, {"id": 3, "name": "p-3"}, {"id": 4, "name": "p-4"}]
+
+    # O id do log continua sendo o cursor entre partição e tabela principal
+    first = history.get('/gateways/1/people?limit=2&fields=id')
+    assert first.json == [{"id": 1}, {"id": 2}] and first.headers["X-Next-Cursor"] == "3"
+    assert history.get('/gateways/1/people?limit=2&fields=id&after=3').json == [{"id": 3}, {"id": 4}]
@@ -0,0 +1,49 @@
+from datetime import datetime, timedelta
+
+import pytest
+from flask import Flask
+
+from location_writer import LocationLogWriter
+from models import db, LocationLog
+
+
+@pytest.fixture
+def writer():
+    app = Flask(__name__)
+    app.config.update(SQLALCHEMY_DATABASE_URI='sqlite://', LOCATION_LOG_FLUSH_INTERVAL=1.0,
+                      LOCATION_LOG_BATCH_SIZE=500, LOCATION_LOG_SWEEP_INTERVAL=5.0)
+    db.init_app(app)
+    writer = LocationLogWriter()
+    writer.init_app(app, buffer_time=5)
+    with app.app_context():
+        db.create_all()
+        # Visita sem avistamento há um minuto: deve ser fechada pelo sweep
+        old = datetime.utcnow() - timedelta(minutes=1)
+        db.session.add(LocationLog(id=1, person_id=1, gateway_id=1, entry_time=old - timedelta(minutes=5), last_seen=old))
+        db.session.commit()
+        yield writer
+
+
+def _closed():
+    db.session.expire_all()
+    return db.session.get(LocationLog, 1).exit_time is not None
+
+
+def test_sweep_runs_with_sightings_still_buffered(writer):
+    # Sob carga sempre há avistamentos recebidos depois do último flush
+    writer.record(2, 1)
+    writer._safe_sweep()
+    assert _closed()
+
+
+def test_sweep_waits_for_a_requeued_batch(writer):
+    writer._requeue([((2, 1), datetime.utcnow())])
+    writer._safe_sweep()
+    assert not _closed()
+
+    # O flush seguinte grava o lote e o fechamento volta a rodar
+    writer.flush()
+    assert not writer._requeued
+    writer._safe_sweep()
+    assert _closed()
+    assert LocationLog.query.filter_by(person_id=2, exit_time=None).count() == 1
@@ -0,0 +1,48 @@
+import re
+
+import pytest
+
+from config import Config
+from ffmpeg_manager import _multiplexed_command
+from stream_profiles import resolve_profile
+
+LABEL_RE = re.compile(r"\[([^\]:]+)\]")
+
+
+@pytest.fixture(autouse=True)
+def defaults(monkeypatch):
+    monkeypatch.setattr(Config, "FFMPEG_BINARY", "ffmpeg")
+    monkeypatch.setattr(Config, "FFMPEG_LOCAL_OUTPUT_DIR", "/hls")
+    monkeypatch.setattr(Config, "HLS_LOW_LATENCY", False)
+    monkeypatch.setattr(Config, "STREAM_X264_PRESET", "veryfast")
+    monkeypatch.setattr(Config, "STREAM_X264_TUNE", "")
+
+
+def _ladder():
+    return resolve_profile("transcode", "h264", resolutions="1280x720,360", bitrates="2000k,600k")
+
+
+def _graphs(command):
+    return [command[index + 1] for index, arg in enumerate(command) if arg == "-filter_complex"]
+
+
+def test_ladder_labels_are_unique_across_cameras():
+    command = _multiplexed_command([
+        (7, ("rtsp://a/1", _ladder(), "spec-a")),
+        (9, ("rtsp://b/1", _ladder(), "spec-b")),
+    ])
+    graphs = _graphs(command)
+    assert len(graphs) == 2
+    assert graphs[0].startswith("[0:v]split=2") and graphs[1].startswith("[1:v]split=2")
+
+    # Cada rótulo é produzido uma única vez no comando inteiro
+    produced = []
+    for graph in graphs:
+        for chain in graph.split(";"):
+            # Entradas vêm antes do filtro, saídas depois dos argumentos dele
+            produced += LABEL_RE.findall(chain.split("=", 1)[1])
+    assert len(produced) == len(set(produced)) == 8
+
+    maps = [command[index + 1] for index, arg in enumerate(command) if arg == "-map"]
+    assert maps == ["[c0v0o]", "[c0v1o]", "[c1v0o]", "[c1v1o]"]
+    assert "/hls/7/stream_%v.m3u8" in command and "/hls/9/stream_%v.m3u8" in command
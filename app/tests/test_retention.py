@@ -0,0 +1,28 @@
+from datetime import datetime
+
+from retention import PARTITION_RE, _months_between, _next_month, partition_name
+
+
+def test_partition_name_matches_pattern():
+    name = partition_name(datetime(2024, 3, 31, 23, 59))
+    assert name == "location_log_archive_202403"
+    assert PARTITION_RE.match(name).groups() == ("2024", "03")
+
+
+def test_next_month_from_any_day():
+    assert _next_month(datetime(2024, 1, 31, 12, 30)) == datetime(2024, 2, 1)
+    assert _next_month(datetime(2024, 2, 29)) == datetime(2024, 3, 1)
+    assert _next_month(datetime(2024, 12, 15)) == datetime(2025, 1, 1)
+
+
+def test_months_between_half_open_range():
+    assert list(_months_between(datetime(2024, 1, 15), datetime(2024, 3, 1))) == [
+        datetime(2024, 1, 1), datetime(2024, 2, 1)]
+    assert list(_months_between(datetime(2024, 1, 15), datetime(2024, 3, 1, 0, 0, 1))) == [
+        datetime(2024, 1, 1), datetime(2024, 2, 1), datetime(2024, 3, 1)]
+
+
+def test_months_between_across_years_and_empty():
+    assert [partition_name(month) for month in _months_between(datetime(2023, 11, 30), datetime(2024, 1, 2))] == [
+        "location_log_archive_202311", "location_log_archive_202312", "location_log_archive_202401"]
+    assert list(_months_between(datetime(2024, 5, 10), datetime(2024, 5, 10))) == []
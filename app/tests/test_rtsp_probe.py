@@ -0,0 +1,121 @@
+import base64
+
+from rtsp_probe import parse_h264_sps, parse_sdp
+
+
+class _BitWriter:
+    def __init__(self):
+        self.bits = []
+
+    def u(self, bits, value):
+        self.bits.extend((value >> (bits - 1 - i)) & 1 for i in range(bits))
+
+    def ue(self, value):
+        value += 1
+        self.u(2 * value.bit_length() - 1, value)
+
+    def nal(self):
+        # rbsp_trailing_bits e emulation prevention (00 00 0x -> 00 00 03 0x), como num SPS real
+        bits = self.bits + [1] + [0] * (-(len(self.bits) + 1) % 8)
+        rbsp = bytes(int("".join(map(str, bits[i:i + 8])), 2) for i in range(0, len(bits), 8))
+        escaped, zeros = bytearray(), 0
+        for byte in rbsp:
+            if zeros >= 2 and byte <= 3:
+                escaped.append(3)
+                zeros = 0
+            escaped.append(byte)
+            zeros = zeros + 1 if byte == 0 else 0
+        return b"\x67" + bytes(escaped)
+
+
+def _sps(width_mbs, height_map_units, crop_bottom=0, profile_idc=66, level_idc=31, fps=None):
+    writer = _BitWriter()
+    writer.u(8, profile_idc)
+    writer.u(8, 0)  # constraint flags
+    writer.u(8, level_idc)
+    writer.ue(0)  # seq_parameter_set_id
+    if profile_idc == 100:
+        writer.ue(1)  # chroma_format_idc 4:2:0
+        writer.ue(0)
+        writer.ue(0)
+        writer.u(1, 0)
+        writer.u(1, 0)  # sem scaling matrix
+    writer.ue(0)  # log2_max_frame_num_minus4
+    writer.ue(2)  # pic_order_cnt_type
+    writer.ue(1)  # max_num_ref_frames
+    writer.u(1, 0)
+    writer.ue(width_mbs - 1)
+    writer.ue(height_map_units - 1)
+    writer.u(1, 1)  # frame_mbs_only_flag
+    writer.u(1, 1)  # direct_8x8_inference_flag
+    writer.u(1, 1 if crop_bottom else 0)
+    if crop_bottom:
+        for value in (0, 0, 0, crop_bottom):
+            writer.ue(value)
+    writer.u(1, 1 if fps else 0)  # vui_parameters_present_flag
+    if fps:
+        for _ in range(4):
+            writer.u(1, 0)  # aspect ratio, overscan, video signal, chroma loc
+        writer.u(1, 1)  # timing_info_present_flag
+        writer.u(32, 1)  # num_units_in_tick
+        writer.u(32, 2 * fps)  # time_scale
+    return writer.nal()
+
+
+def test_parse_h264_sps_rfc6184_example():
+    # sprop-parameter-sets do exemplo de SDP da RFC 6184 (Baseline, nível 1.0, QCIF)
+    assert parse_h264_sps(base64.b64decode("Z0IACpZTBYmI")) == {"width": 176, "height": 144, "fps": None}
+
+
+def test_parse_h264_sps_dimensions():
+    assert parse_h264_sps(_sps(80, 45)) == {"width": 1280, "height": 720, "fps": None}
+
+
+def test_parse_h264_sps_cropping_and_high_profile():
+    # 1088 linhas codificadas, 8 cortadas embaixo (4:2:0 corta de 2 em 2)
+    assert parse_h264_sps(_sps(120, 68, crop_bottom=4, profile_idc=100)) == {"width": 1920, "height": 1080, "fps": None}
+
+
+def test_parse_h264_sps_timing_info():
+    assert parse_h264_sps(_sps(40, 30, fps=25))["fps"] == 25
+
+
+def test_parse_h264_sps_emulation_prevention():
+    # Perfil, flags e nível zerados: o RBSP começa com 00 00 00, gravado como 00 00 03 00
+    nal = _sps(1, 1, profile_idc=0, level_idc=0)
+    assert nal.startswith(b"\x67\x00\x00\x03\x00")
+    assert parse_h264_sps(nal) == {"width": 16, "height": 16, "fps": None}
+
+
+SDP = """v=0
+o=- 0 0 IN IP4 127.0.0.1
+s=camera
+m=audio 0 RTP/AVP 97
+a=rtpmap:97 MPEG4-GENERIC/16000/1
+a=control:trackID=2
+m=video 0 RTP/AVP 96
+a=rtpmap:96 H264/90000
+a=fmtp:96 packetization-mode=1;profile-level-id=42001f;sprop-parameter-sets={sps},aM4G4g==
+a=framerate:15
+a=control:trackID=1
+m=video 0 RTP/AVP 98
+a=rtpmap:98 H265/90000
+a=control:trackID=3
+"""
+
+
+def test_parse_sdp_first_video_track():
+    sps = base64.b64encode(_sps(80, 45, fps=30)).decode().rstrip("=")
+    info = parse_sdp(SDP.format(sps=sps))
+    assert info == {"codec": "h264", "width": 1280, "height": 720, "fps": 15.0,
+                    "audio_codec": "mpeg4-generic", "control": "trackID=1"}
+
+
+def test_parse_sdp_dimensions_attribute_and_unknown_codec():
+    info = parse_sdp("m=video 0 RTP/AVP 26\r\na=rtpmap:26 VP8/90000\r\na=x-dimensions:640,480\r\n")
+    assert (info["codec"], info["width"], info["height"], info["fps"]) == ("vp8", 640, 480, None)
+
+
+def test_parse_sdp_invalid_sps_is_ignored():
+    info = parse_sdp("m=video 0 RTP/AVP 96\na=rtpmap:96 H264/90000\na=fmtp:96 sprop-parameter-sets=Zw==\n")
+    assert (info["codec"], info["width"]) == ("h264", None)
@@ -0,0 +1,150 @@
+import hashlib
+import socket
+import socketserver
+import threading
+import time
+
+import pytest
+
+from rtsp_probe import _probe_native
+
+USERNAME, PASSWORD, REALM, NONCE = "admin", "s3nha", "camera", "abc123"
+SPS = "Z0IACpZTBYmI"  # Exemplo da RFC 6184: 176x144
+SDP = (
+    "v=0\r\n"
+    "s=stand-in\r\n"
+    "m=video 0 RTP/AVP 96\r\n"
+    "a=rtpmap:96 H264/90000\r\n"
+    f"a=fmtp:96 packetization-mode=1;sprop-parameter-sets={SPS},aM4G4g==\r\n"
+    "a=control:trackID=1\r\n"
+)
+
+
+def _md5(text):
+    return hashlib.md5(text.encode("utf-8")).hexdigest()
+
+
+def _authorized(method, header):
+    if not header.startswith("Digest "):
+        return False
+    fields = {}
+    for part in header[len("Digest "):].split(","):
+        key, _, value = part.strip().partition("=")
+        fields[key] = value.strip('"')
+    ha1 = _md5(f"{USERNAME}:{REALM}:{PASSWORD}")
+    ha2 = _md5(f"{method}:{fields['uri']}")
+    expected = _md5(f"{ha1}:{NONCE}:{fields['nc']}:{fields['cnonce']}:auth:{ha2}")
+    return fields.get("username") == USERNAME and fields.get("response") == expected
+
+
+class _StandInHandler(socketserver.StreamRequestHandler):
+    """Câmera RTSP de mentira: Digest com qop, DESCRIBE com SDP, SETUP/PLAY e um pacote RTP intercalado."""
+
+    def handle(self):
+        server = self.server
+        while True:
+            lines = []
+            while True:
+                line = self.rfile.readline()
+                if not line:
+                    return
+                if line in (b"\r\n", b"\n"):
+                    break
+                lines.append(line.decode("utf-8").rstrip("\r\n"))
+            method, url, _ = lines[0].split(" ", 2)
+            headers = dict(line.split(": ", 1) for line in lines[1:])
+            server.requests.append((method, url))
+            if server.silent:
+                continue
+            if method == "TEARDOWN":
+                return
+            if not _authorized(method, headers.get("Authorization", "")):
+                self._reply(headers, "401 Unauthorized",
+                            {"WWW-Authenticate": f'Digest realm="{REALM}", nonce="{NONCE}", qop="auth"'})
+                continue
+            if method == "DESCRIBE":
+                base = f"rtsp://127.0.0.1:{server.server_address[1]}/stream/"
+                self._reply(headers, "200 OK", {"Content-Base": base, "Content-Type": "application/sdp"}, SDP.encode())
+            elif method == "SETUP" and server.udp_only:
+                self._reply(headers, "461 Unsupported Transport", {})
+            elif method == "SETUP":
+                self._reply(headers, "200 OK", {"Session": "42;timeout=60", "Transport": headers["Transport"]})
+            elif method == "PLAY":
+                self._reply(headers, "200 OK", {"Session": "42"})
+                if server.send_rtp:
+                    rtp = bytes([0x80, 0x80 | 96]) + b"\x00\x01" + b"\x00" * 8 + b"\x65"
+                    self.wfile.write(b"$\x00" + len(rtp).to_bytes(2, "big") + rtp)
+            else:
+                self._reply(headers, "200 OK", {"Public": "OPTIONS, DESCRIBE, SETUP, PLAY, TEARDOWN"})
+
+    def _reply(self, headers, status, extra, body=b""):
+        lines = [f"RTSP/1.0 {status}", f"CSeq: {headers['CSeq']}"]
+        lines += [f"{name}: {value}" for name, value in extra.items()]
+        lines.append(f"Content-Length: {len(body)}")
+        self.wfile.write(("\r\n".join(lines) + "\r\n\r\n").encode() + body)
+
+
+@pytest.fixture
+def camera():
+    server = socketserver.ThreadingTCPServer(("127.0.0.1", 0), _StandInHandler)
+    server.daemon_threads = True
+    server.requests = []
+    server.silent = False
+    server.udp_only = False
+    server.send_rtp = True
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def _url(server, credentials=f"{USERNAME}:{PASSWORD}@"):
+    return f"rtsp://{credentials}127.0.0.1:{server.server_address[1]}/stream"
+
+
+def test_probe_reads_sdp_and_rtp_packet(camera):
+    result = _probe_native(_url(camera), timeout=5, read_packet=True)
+    assert result == {"ok": True, "error": None, "codec": "h264", "width": 176, "height": 144, "fps": None,
+                      "audio_codec": None, "rtp_payload_type": 96}
+    # O TEARDOWN é enviado sem esperar resposta
+    deadline = time.monotonic() + 2
+    while camera.requests[-1][0] != "TEARDOWN" and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert [method for method, _ in camera.requests] == ["OPTIONS", "OPTIONS", "DESCRIBE", "SETUP", "PLAY", "TEARDOWN"]
+    # SETUP na URL de controle da trilha, relativa ao Content-Base
+    assert camera.requests[3][1].endswith("/stream/trackID=1")
+
+
+def test_probe_udp_only_camera_passes_with_warning(camera):
+    camera.udp_only = True
+    result = _probe_native(_url(camera), timeout=5, read_packet=True)
+    assert result["ok"] and result["codec"] == "h264" and result["warning"] == "rtp"
+    assert "rtp_payload_type" not in result
+
+
+def test_probe_camera_slow_to_send_rtp_passes_with_warning(camera):
+    camera.send_rtp = False
+    result = _probe_native(_url(camera), timeout=0.5, read_packet=True)
+    assert result["ok"] and result["warning"] == "rtp"
+
+
+def test_probe_without_packet_stops_after_describe(camera):
+    result = _probe_native(_url(camera), timeout=5, read_packet=False)
+    assert result["ok"] and "rtp_payload_type" not in result
+    assert [method for method, _ in camera.requests][-1] == "DESCRIBE"
+
+
+def test_probe_wrong_password(camera):
+    assert _probe_native(_url(camera, f"{USERNAME}:errada@"), timeout=5, read_packet=False) == \
+        {"ok": False, "error": "unauthorized"}
+
+
+def test_probe_without_credentials(camera):
+    assert _probe_native(_url(camera, ""), timeout=5, read_packet=False) == {"ok": False, "error": "unauthorized"}
+
+
+def test_probe_deadline_on_silent_server(camera):
+    camera.silent = True
+    with pytest.raises(socket.timeout):
+        _probe_native(_url(camera), timeout=0.5, read_packet=False)
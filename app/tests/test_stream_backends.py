@@ -0,0 +1,180 @@
+import os
+import signal
+import time
+import uuid
+
+import pytest
+from docker.errors import NotFound
+
+from config import Config
+from ffmpeg_manager import CONTAINER_PREFIX, SPEC_LABEL, DockerBackend, ProcessBackend, stream_spec
+from stream_profiles import resolve_profile
+
+URL = "rtsp://camera.local/1"
+PROFILE = {"mode": "copy", "low_latency": False}
+
+
+class _FakeContainer:
+    def __init__(self, client, name, labels):
+        self.client = client
+        self.id = uuid.uuid4().hex
+        self.name = name
+        self.labels = labels
+        self.status = "created"
+
+    def start(self):
+        self.status = "running"
+
+    def stop(self):
+        self.status = "exited"
+
+    def remove(self):
+        self.client.containers.items.pop(self.id, None)
+
+
+class _FakeContainers:
+    def __init__(self, client):
+        self.client = client
+        self.items = {}
+
+    def create(self, image, command, name, labels, **kwargs):
+        container = _FakeContainer(self.client, name, labels)
+        self.items[container.id] = container
+        return container
+
+    def get(self, container_id):
+        try:
+            return self.items[container_id]
+        except KeyError:
+            raise NotFound(container_id)
+
+
+class _FakeApi:
+    def __init__(self, client):
+        self.client = client
+
+    def containers(self, all, filters):
+        return [
+            {"Id": container.id, "Names": [f"/{container.name}"], "State": container.status, "Labels": container.labels}
+            for container in self.client.containers.items.values() if container.name.startswith(filters["name"])
+        ]
+
+
+class _FakeDockerClient:
+    """Só a parte da API do docker-py que o DockerBackend usa."""
+
+    def __init__(self):
+        self.containers = _FakeContainers(self)
+        self.api = _FakeApi(self)
+
+    def exit(self, container_id):
+        # FFmpeg terminou: com auto_remove o Docker apaga o contêiner
+        self.containers.items.pop(container_id)
+
+
+@pytest.fixture(autouse=True)
+def directories(tmp_path, monkeypatch):
+    monkeypatch.setattr(Config, "FFMPEG_HOST_OUTPUT_DIR", str(tmp_path / "host"))
+    monkeypatch.setattr(Config, "FFMPEG_LOCAL_OUTPUT_DIR", str(tmp_path / "output"))
+    monkeypatch.setattr(Config, "FFMPEG_PID_DIR", str(tmp_path / "pid"))
+
+
+@pytest.fixture
+def docker_backend():
+    backend = DockerBackend()
+    backend._client = _FakeDockerClient()
+    backend.exit = backend.client.exit
+    return backend
+
+
+@pytest.fixture
+def process_backend(tmp_path, monkeypatch):
+    ffmpeg = tmp_path / "ffmpeg"
+    ffmpeg.write_text("#!/bin/sh\nexec sleep 300\n")
+    ffmpeg.chmod(0o755)
+    monkeypatch.setattr(Config, "FFMPEG_BINARY", str(ffmpeg))
+    monkeypatch.setattr(Config, "FFMPEG_RESTART_BACKOFF", 0.1)
+    monkeypatch.setattr(Config, "FFMPEG_PROCESS_MEMORY_MB", 0)
+    backend = ProcessBackend(interval=0.05)
+
+    def exit_worker(worker_id):
+        # FFmpeg caiu sozinho
+        pid = backend.list()[int(worker_id[len(CONTAINER_PREFIX):])]["pid"]
+        os.killpg(pid, signal.SIGKILL)
+
+    backend.exit = exit_worker
+    yield backend
+    for worker in backend.list().values():
+        backend.stop(worker["id"])
+
+
+@pytest.fixture(params=["docker", "process"])
+def harness(request):
+    return request.getfixturevalue(f"{request.param}_backend")
+
+
+def _wait(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.02)
+    return False
+
+
+def test_start_lists_running_worker_with_spec(harness):
+    worker_id, timings = harness.start(1, URL, PROFILE)
+    assert set(timings) == {"create_ms", "start_ms"}
+    worker = harness.list()[1]
+    assert (worker["id"], worker["name"], worker["state"]) == (worker_id, f"{CONTAINER_PREFIX}1", "running")
+    assert worker["spec"] == stream_spec(1, URL, PROFILE)
+
+
+def test_stop_removes_worker(harness):
+    worker_id, _ = harness.start(1, URL, PROFILE)
+    harness.start(2, URL, PROFILE)
+    harness.stop(worker_id)
+    assert list(harness.list()) == [2]
+    # Parar de novo (ou um worker que já sumiu) não é erro
+    harness.stop(worker_id)
+
+
+def test_spec_diff_after_configuration_change(harness):
+    # O reconciliador recria o worker quando o spec listado difere do da configuração atual
+    harness.start(1, URL, PROFILE)
+    listed = harness.list()[1]["spec"]
+    transcode = resolve_profile("transcode", "h264", preset="veryfast", tune="")
+    assert listed == stream_spec(1, URL, PROFILE)
+    assert listed != stream_spec(1, "rtsp://camera.local/2", PROFILE)
+    assert listed != stream_spec(1, URL, transcode)
+
+    harness.stop(harness.list()[1]["id"])
+    harness.start(1, URL, transcode)
+    assert harness.list()[1]["spec"] == stream_spec(1, URL, transcode)
+
+
+def test_restart_on_exit(harness):
+    worker_id, _ = harness.start(1, URL, PROFILE)
+    pid = harness.list()[1].get("pid")
+    harness.exit(worker_id)
+    if isinstance(harness, ProcessBackend):
+        # O supervisor sobe o processo de novo, com o mesmo identificador
+        assert _wait(lambda: harness.list()[1]["restarts"] == 1 and harness.list()[1]["state"] == "running")
+        assert harness.list()[1]["pid"] != pid
+        assert harness.list()[1]["id"] == worker_id
+    else:
+        # Com auto_remove o contêiner some da lista e o monitor de saúde pede um start novo
+        assert 1 not in harness.list()
+        new_id, _ = harness.start(1, URL, PROFILE)
+        assert new_id != worker_id and harness.list()[1]["state"] == "running"
+
+
+def test_docker_labels_carry_camera_and_spec(docker_backend):
+    worker_id, _ = docker_backend.start(3, URL, PROFILE)
+    labels = docker_backend.client.containers.get(worker_id).labels
+    assert labels == {"camanager.camera_id": "3", SPEC_LABEL: stream_spec(3, URL, PROFILE)}
+
+
+def test_docker_stop_of_missing_container_is_logged(docker_backend, caplog):
+    docker_backend.stop("inexistente")
+    assert "inexistente não encontrado" in caplog.text
@@ -0,0 +1,44 @@
+import os
+import time
+
+import pytest
+
+from config import Config
+from stream_demand import _playlist_fresh, _wait_for_playlist
+
+MASTER = "#EXTM3U\n#EXT-X-VERSION:3\n#EXT-X-STREAM-INF:BANDWIDTH=2200000,RESOLUTION=1280x720\nstream_0.m3u8\n"
+
+
+@pytest.fixture
+def output(tmp_path, monkeypatch):
+    monkeypatch.setattr(Config, "FFMPEG_LOCAL_OUTPUT_DIR", str(tmp_path))
+    monkeypatch.setattr(Config, "HLS_LOW_LATENCY", False)
+    monkeypatch.setattr(Config, "HLS_SEGMENT_TIME", 2.0)
+    (tmp_path / "5").mkdir()
+    return tmp_path / "5"
+
+
+def _age(path, seconds):
+    mtime = time.time() - seconds
+    os.utime(path, (mtime, mtime))
+
+
+def test_single_playlist_freshness(output):
+    assert not _playlist_fresh(5)
+    (output / "stream.m3u8").write_text("#EXTM3U\n")
+    assert _playlist_fresh(5)
+    _age(output / "stream.m3u8", 60)
+    assert not _playlist_fresh(5)
+
+
+def test_ladder_follows_first_variant(output):
+    # A master é gravada uma vez só; quem diz se o stream está no ar é a variante
+    (output / "stream.m3u8").write_text(MASTER)
+    _age(output / "stream.m3u8", 60)
+    assert not _playlist_fresh(5)
+    (output / "stream_0.m3u8").write_text("#EXTM3U\n")
+    assert _playlist_fresh(5)
+    assert _wait_for_playlist(5, time.time() - 1, timeout=0.5)
+    _age(output / "stream_0.m3u8", 60)
+    assert not _playlist_fresh(5)
+    assert not _wait_for_playlist(5, time.time(), timeout=0.3)
@@ -0,0 +1,29 @@
+from datetime import datetime, timezone
+
+from stream_health import parse_media_playlist
+
+PLAYLIST = """#EXTM3U
+#EXT-X-VERSION:3
+#EXT-X-TARGETDURATION:2
+#EXT-X-MEDIA-SEQUENCE:41
+#EXT-X-PROGRAM-DATE-TIME:2024-05-01T12:00:00.000Z
+#EXTINF:2.000000,
+stream41.ts
+#EXTINF:1.960000,
+stream42.ts
+"""
+
+
+def test_parse_media_playlist():
+    sequence, target, segments = parse_media_playlist(PLAYLIST)
+    assert (sequence, target) == (41, 2.0)
+    assert segments == [
+        ("stream41.ts", 2.0, datetime(2024, 5, 1, 12, tzinfo=timezone.utc).timestamp()),
+        ("stream42.ts", 1.96, None),
+    ]
+
+
+def test_parse_media_playlist_empty_and_invalid_date():
+    assert parse_media_playlist("#EXTM3U\n") == (0, None, [])
+    _, _, segments = parse_media_playlist("#EXT-X-PROGRAM-DATE-TIME:ontem\n#EXTINF:2,\na.ts\n")
+    assert segments == [("a.ts", 2.0, None)]
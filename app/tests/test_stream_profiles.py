@@ -0,0 +1,67 @@
+import pytest
+
+from config import Config
+from stream_profiles import hls_window, parse_ladder, profile_label, resolve_profile, stream_settings_error
+
+
+@pytest.fixture(autouse=True)
+def defaults(monkeypatch):
+    monkeypatch.setattr(Config, "HLS_LOW_LATENCY", False)
+    monkeypatch.setattr(Config, "STREAM_X264_PRESET", "veryfast")
+    monkeypatch.setattr(Config, "STREAM_X264_TUNE", "")
+
+
+def test_parse_ladder_pairs_by_position():
+    assert parse_ladder("1280x720, 360", "2000K") == [
+        {"width": 1280, "height": 720, "bitrate": "2000k"},
+        {"width": None, "height": 360, "bitrate": None},
+    ]
+    assert parse_ladder(None, "") == []
+
+
+def test_auto_uses_passthrough_only_for_browser_codecs_without_ladder():
+    assert resolve_profile("auto", "h264")["mode"] == "copy"
+    assert resolve_profile(None, "hevc")["mode"] == "x264"
+    assert resolve_profile("auto", None)["mode"] == "x264"
+    assert resolve_profile("auto", "h264", resolutions="720")["mode"] == "x264"
+
+
+def test_explicit_profiles():
+    assert resolve_profile("passthrough", "hevc")["mode"] == "copy"
+    profile = resolve_profile("transcode", "h264", preset="fast", tune="film")
+    assert (profile["mode"], profile["preset"], profile["tune"]) == ("x264", "fast", "film")
+    assert profile["renditions"] == [{"width": None, "height": None, "bitrate": None}]
+
+
+def test_low_latency_defaults_to_zerolatency(monkeypatch):
+    monkeypatch.setattr(Config, "HLS_LOW_LATENCY", True)
+    profile = resolve_profile("transcode", "h264")
+    assert profile["tune"] == "zerolatency" and profile["low_latency"]
+    assert resolve_profile("auto", "h264") == {"mode": "copy", "low_latency": True}
+
+
+def test_profile_label():
+    assert profile_label(resolve_profile("auto", "h264")) == "passthrough"
+    assert profile_label(resolve_profile("transcode", "h264")) == "x264/veryfast/origem@auto"
+    assert profile_label(resolve_profile("auto", "hevc", tune="film", resolutions="1280x720,360", bitrates="2000k")) == \
+        "x264/veryfast/film/1280x720@2000k+360p@auto"
+
+
+def test_stream_settings_error():
+    assert stream_settings_error({}) is None
+    assert stream_settings_error({"stream_profile": "auto", "resolutions": "1280x720,480", "bitrates": "2M,800k"}) is None
+    assert "Perfil" in stream_settings_error({"stream_profile": "copy"})
+    assert "passthrough" in stream_settings_error({"stream_profile": "passthrough"}, "hevc")
+    assert "Preset" in stream_settings_error({"encoder_preset": "turbo"})
+    assert "Tune" in stream_settings_error({"encoder_tune": "sharp"})
+    assert "Resoluções" in stream_settings_error({"resolutions": "1280*720"})
+    assert "Bitrates" in stream_settings_error({"bitrates": "2 Mbps"})
+
+
+def test_hls_window(monkeypatch):
+    monkeypatch.setattr(Config, "HLS_SEGMENT_TIME", 2.0)
+    monkeypatch.setattr(Config, "HLS_LIST_SIZE", 5)
+    monkeypatch.setattr(Config, "HLS_LL_SEGMENT_TIME", 1.0)
+    monkeypatch.setattr(Config, "HLS_LL_LIST_SIZE", 4)
+    assert hls_window(False) == (2.0, 5)
+    assert hls_window(True) == (1.0, 4)
@@ -0,0 +1,6 @@
+from app import create_app, start_worker_services
+
+# Ponto de entrada dos workers do gunicorn (gunicorn.conf.py). Migrações e
+# serviços de fundo já foram iniciados pelo master, uma vez por implantação.
+app = create_app(migrate_schema=False)
+start_worker_services()
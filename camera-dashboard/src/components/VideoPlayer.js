@@ -6,12 +6,20 @@ const VideoPlayer = ({ src }) => {
 
   useEffect(() => {
     if (Hls.isSupported()) {
-      const hls = new Hls();
+      // Fica a poucos segmentos do ao vivo e acelera a reprodução para recuperar atrasos
+      const hls = new Hls({
+        lowLatencyMode: true,
+        liveSyncDurationCount: 2,
+        liveMaxLatencyDurationCount: 5,
+        maxLiveSyncPlaybackRate: 1.5,
+        backBufferLength: 10,
+      });
       hls.loadSource(src);
       hls.attachMedia(videoRef.current);
       hls.on(Hls.Events.MANIFEST_PARSED, () => {
         videoRef.current.play(); // Inicia o vídeo automaticamente quando o manifesto é carregado
       });
+      return () => hls.destroy();
     } else if (videoRef.current.canPlayType('application/vnd.apple.mpegurl')) {
       videoRef.current.src = src;
       videoRef.current.addEventListener('loadedmetadata', () => {
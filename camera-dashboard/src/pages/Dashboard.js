@@ -46,6 +46,7 @@ function Dashboard() {
       <table className="camera-table">
         <thead>
           <tr>
+            <th>Imagem</th>
             <th>Nome</th>
             <th>Agrupamento</th>
             <th>Ações</th>
@@ -54,6 +55,16 @@ function Dashboard() {
         <tbody>
           {cameras.map((camera) => (
             <tr key={camera.id}>
+              <td>
+                {/* Miniatura em cache no backend: uma imagem pequena por câmera em vez de um player HLS */}
+                <img
+                  className="camera-snapshot"
+                  src={`/api/cameras/${camera.id}/snapshot`}
+                  alt={camera.name}
+                  loading="lazy"
+                  onClick={() => handleViewCamera(camera.id)}
+                />
+              </td>
               <td>{camera.name}</td>
               <td>{camera.agrupamento}</td>
               <td>
@@ -15,28 +15,75 @@ function VisualizarMapa() {
   const mapImageRef = useRef(null);
 
   useEffect(() => {
+    let eventSource = null;
+    let cancelled = false;
+
     const fetchMapDetails = async () => {
       try {
         const response = await getMapDetails(mapId);
-        setMap(response.data);
+        if (!cancelled) {
+          setMap(response.data);
+        }
       } catch (error) {
         console.error('Erro ao buscar detalhes do mapa:', error);
       }
     };
-    fetchMapDetails();
-  }, [mapId]);
 
-  useEffect(() => {
-    const interval = setInterval(async () => {
-      try {
-        const response = await getMapDetails(mapId);
-        setMap(response.data);
-      } catch (error) {
-        console.error('Erro ao atualizar detalhes do mapa:', error);
+    // Aplica a presença de um gateway recebida pelo stream de eventos
+    const updateGatewayPeople = (gatewayId, updatePeople) => {
+      setMap((current) => {
+        if (!current) {
+          return current;
+        }
+        return {
+          ...current,
+          gateways: current.gateways.map((gateway) =>
+            gateway.gateway_id === gatewayId
+              ? { ...gateway, people: updatePeople(gateway.people) }
+              : gateway
+          ),
+        };
+      });
+    };
+
+    const subscribeToPresence = () => {
+      eventSource = new EventSource(`/api/maps/${mapId}/events`);
+
+      eventSource.addEventListener('snapshot', (event) => {
+        const { gateways } = JSON.parse(event.data);
+        gateways.forEach(({ gateway_id, people }) => updateGatewayPeople(gateway_id, () => people));
+      });
+
+      eventSource.addEventListener('presence', (event) => {
+        const { gateway_id, entered, left } = JSON.parse(event.data);
+        updateGatewayPeople(gateway_id, (people) => [
+          ...people.filter(
+            (person) => !left.includes(person.id) && !entered.some((p) => p.id === person.id)
+          ),
+          ...entered,
+        ]);
+      });
+
+      // O servidor pede recarga completa quando este cliente perdeu eventos
+      eventSource.addEventListener('resync', fetchMapDetails);
+
+      eventSource.onerror = (error) => {
+        console.error('Erro no stream de presença do mapa:', error);
+      };
+    };
+
+    fetchMapDetails().then(() => {
+      if (!cancelled) {
+        subscribeToPresence();
       }
-    }, 5000); // Atualiza a cada 5 segundos
+    });
 
-    return () => clearInterval(interval);
+    return () => {
+      cancelled = true;
+      if (eventSource) {
+        eventSource.close();
+      }
+    };
   }, [mapId]);
 
   if (!map) {